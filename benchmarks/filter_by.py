@@ -0,0 +1,106 @@
+"""
+Накладні витрати Base.filter_by_ на побудову запитів - до і після кешу форм запитів (statement_cache):
+
+    python -m benchmarks.filter_by
+    python -m benchmarks.filter_by --calls 5000 --db
+
+build - лише Python: побудова SELECT, selectinload, count-підзапиту, сторінкового запиту та ключа
+SQLAlchemy compiled cache (те, що робиться перед кожним виконанням). Старий варіант відтворює
+побудову "з нуля", як filter_by_ робив до кешу.
+--db - повний filter_by_ з БД: з кешем, що скидається перед кожним викликом, і з прогрітим.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+from sqlalchemy import select, func, desc
+from sqlalchemy.orm import selectinload, InstrumentedAttribute
+
+from benchmarks.search import percentiles
+from settings.database import Base, statement_cache
+from shops.models import Product
+
+FILTERS = dict(category_id=1, in_stock=True)
+RELATED = ['category', 'category.shop']
+ORDERED = ['in_stock', 'name']
+
+
+def legacy_statements(cls, filters: dict, related: list[str], ordered: list[str], limit: int, offset: int):
+    """ Побудова запитів без кешу (як до statement_cache) """
+    fields = {attr for attr, value in vars(cls).items() if isinstance(value, InstrumentedAttribute)}
+    filter_params = {k: v for k, v in filters.items() if k in fields}
+    stmt = select(cls).filter_by(**filter_params)
+    relations = []
+    for path in related:
+        current_cls, loader = cls, None
+        for part in path.split('.'):
+            attr = getattr(current_cls, part)
+            loader = selectinload(attr) if loader is None else loader.selectinload(attr)
+            current_cls = attr.property.mapper.class_
+        relations.append(loader)
+    stmt = stmt.options(*relations)
+    order = cls._ordering_(ordered)
+    count_query = select(func.count()).select_from(stmt.subquery())
+    page_query = stmt.offset(offset).order_by(*[desc(i) if d else i for i, d in order]).limit(limit + 1)
+    return count_query, page_query
+
+
+def cached_statements(cls, filters: dict, related: list[str], ordered: list[str], limit: int, offset: int):
+    """ Те саме через _statement_shape_ та закешований сторінковий запит """
+    filter_params = cls._filter_kwargs_by_atribute_(**filters)
+    shape_key, stmt, count_query = cls._statement_shape_(filter_params, tuple(related))
+    order = cls._ordering_(ordered)
+    key = (shape_key, tuple((i.key, d) for i, d in order), False, False, ())
+    page_query = statement_cache.get(key)
+    if page_query is None:
+        raise RuntimeError("statement_cache is not warmed up")
+    return count_query, page_query
+
+
+def run_build(build, calls: int) -> dict:
+    timings = []
+    for n in range(calls):
+        t = time.perf_counter()
+        for stmt in build(Product, dict(FILTERS, category_id=n % 50 + 1), RELATED, ORDERED, 30, n % 5 * 30):
+            stmt._generate_cache_key()
+        timings.append(time.perf_counter() - t)
+    return percentiles(timings)
+
+
+async def run_db(calls: int, cold: bool) -> dict:
+    timings = []
+    # print-и filter_by_ не повинні потрапляти в заміри
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n in range(calls):
+            if cold:
+                statement_cache.clear()
+                Base._loader_options_.__func__.cache_clear()
+                Base._model_fields_.__func__.cache_clear()
+            t = time.perf_counter()
+            await Base.filter_by_.__func__(Product, **FILTERS, related=RELATED, ordered=ORDERED, limit=30,
+                                           offset=n % 5 * 30, count='exact')
+            timings.append(time.perf_counter() - t)
+    return percentiles(timings)
+
+
+async def main(args):
+    # прогрів: форма запиту та сторінковий запит потрапляють у кеш
+    with contextlib.redirect_stdout(io.StringIO()):
+        await Base.filter_by_.__func__(Product, **FILTERS, related=RELATED, ordered=ORDERED, limit=30, count='none')
+
+    print(f"calls: {args.calls}, filters: {sorted(FILTERS)}, related: {RELATED}, ordered: {ORDERED}")
+    print("build legacy (ms):", run_build(legacy_statements, args.calls))
+    print("build cached (ms):", run_build(cached_statements, args.calls))
+    if args.db:
+        print("filter_by_ cold cache (ms):", await run_db(args.calls, cold=True))
+        print("filter_by_ warm cache (ms):", await run_db(args.calls, cold=False))
+    print(f"statement_cache: {len(statement_cache)} entries, {statement_cache.hits} hits, {statement_cache.misses} misses")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Base.filter_by_ statement building benchmark")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--db", action="store_true", help="also time full filter_by_ calls against the database")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+Однаковий бенчмарк для пошукових бекендів (settings.search):
+
+    python -m benchmarks.search --backend memory
+    python -m benchmarks.search --backend elastic --queries 2000
+
+Запити будуються з назв товарів у БД (префікси з 1-3 слів, останнє слово обрізане,
+як при наборі тексту), кожен бекенд проганяє той самий набір через search() та suggest().
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import select, func
+
+from settings.database import AsyncSessionLocal
+from settings.search import connect_search, close_search, MemoryBackend
+from shops.models import Product
+
+
+async def sample_queries(count: int, seed: int) -> list[str]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(Product.name).order_by(func.random()).limit(count))
+        names = [name for name in result.scalars() if name]
+    rnd = random.Random(seed)
+    queries = []
+    for name in names:
+        words = MemoryBackend.tokenize(name)
+        if not words:
+            continue
+        words = words[:rnd.randint(1, min(3, len(words)))]
+        words[-1] = words[-1][:rnd.randint(1, len(words[-1]))]
+        queries.append(" ".join(words))
+    return queries
+
+
+def percentiles(timings: list[float]) -> dict:
+    timings = sorted(timings)
+    pick = lambda p: round(timings[min(len(timings) - 1, int(len(timings) * p))] * 1000, 3)
+    return dict(p50=pick(0.5), p95=pick(0.95), p99=pick(0.99),
+                mean=round(statistics.fmean(timings) * 1000, 3))
+
+
+async def run(method, queries: list[str], **kwargs) -> dict:
+    timings, hits = [], 0
+    started = time.perf_counter()
+    for q in queries:
+        t = time.perf_counter()
+        hits += len(await method(q, **kwargs))
+        timings.append(time.perf_counter() - t)
+    seconds = time.perf_counter() - started
+    return dict(**percentiles(timings), qps=round(len(queries) / seconds, 1), hits=hits)
+
+
+async def main(args):
+    tracemalloc.start()
+    backend = await connect_search(args.backend)
+    try:
+        started = time.perf_counter()
+        await backend.create_index()
+        build_seconds = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        queries = await sample_queries(args.queries, args.seed)
+        # прогрів (кеші, зʼєднання), щоб не рахувати перший запит
+        for q in queries[:20]:
+            await backend.search(q, size=args.size)
+
+        print(f"backend: {backend.name}, queries: {len(queries)}, size: {args.size}")
+        print(f"create_index: {build_seconds:.3f}s, python memory: {memory / 2 ** 20:.1f} MiB")
+        print("search  (ms):", await run(backend.search, queries, size=args.size))
+        print("suggest (ms):", await run(backend.suggest, queries, size=args.size))
+    finally:
+        await close_search()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search backend benchmark")
+    parser.add_argument("--backend", default="memory", choices=("memory", "elastic"))
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,48 @@
+import os
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi.responses import FileResponse
+
+from settings.config import settings
+from .models import Job, JOB_DONE, submit_job as submit_job_
+from .serializers import JobSchemaGET
+from . import tasks  # noqa: F401 - реєстрація задач
+
+router = APIRouter()
+
+
+@router.post("/{kind}", response_model=JobSchemaGET, status_code=202, description="Submit a background job")
+async def submit_job(kind: str, params: dict = Body(default={})):
+    try:
+        return await submit_job_(kind, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# без слеша шлях інакше перехоплює /api/{item_id} магазинів
+@router.get("", response_model=List[JobSchemaGET])
+@router.get("/", response_model=List[JobSchemaGET], include_in_schema=False)
+async def list_jobs(kind: str = Query(None),
+                    status: str = Query(None),
+                    limit: int = Query(20, ge=1, le=100)):
+    return await Job.list_(kind=kind, status=status, limit=limit)
+
+
+@router.get("/{job_id}", response_model=JobSchemaGET, description="Job status and progress")
+async def get_job(job_id: int):
+    item = await Job.get(job_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return item
+
+
+@router.get("/{job_id}/download", description="Result file of a finished export job")
+async def download_job_result(job_id: int):
+    item = await Job.get(job_id)
+    if not item or item.status != JOB_DONE or not (item.result or {}).get("file"):
+        raise HTTPException(status_code=404, detail="No file for this job")
+    path = os.path.join(settings.EXPORT_DIR, os.path.basename(item.result["file"]))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(path, filename=os.path.basename(path), media_type="text/csv")
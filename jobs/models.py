@@ -0,0 +1,294 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import String, Text, DateTime, select, update, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from settings.config import settings
+from settings.database import Base, AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Зареєстровані задачі: kind -> async def task(ctx: JobContext, **params) -> dict
+JOBS: dict[str, Callable[..., Awaitable[dict | None]]] = {}
+# Задачі, які мають сенс лише в процесі застосунку (наприклад, індекс пошуку в памʼяті)
+LOCAL_JOBS: set[str] = set()
+
+
+def job(kind: str, local: bool = False):
+    """ Реєструє функцію як фонову задачу `kind` """
+    def decorator(func):
+        JOBS[kind] = func
+        if local:
+            LOCAL_JOBS.add(kind)
+        return func
+    return decorator
+
+
+class Job(Base):
+    """
+    Фонова задача. Рядок у БД є і чергою (для воркерів, queue = 'db'), і місцем, де
+    зберігаються статус, прогрес та результат задачі для будь-якого бекенду.
+    Записи - поза unit of work запиту: задачу мають побачити воркер чи локальна черга одразу.
+    """
+    __tablename__ = "job"
+
+    kind: Mapped[str] = mapped_column(String(64), index=True)
+    params: Mapped[dict] = mapped_column(JSONB, default=dict)
+    queue: Mapped[str] = mapped_column(String(16), default="db")
+    status: Mapped[str] = mapped_column(String(16), default=JOB_QUEUED, index=True)
+    progress: Mapped[float] = mapped_column(default=0.0)  # 0..1
+    done: Mapped[int] = mapped_column(default=0)
+    total: Mapped[int | None]
+    message: Mapped[str | None]
+    result: Mapped[dict | None] = mapped_column(JSONB)
+    error: Mapped[str | None] = mapped_column(Text)
+    worker: Mapped[str | None] = mapped_column(String(128))
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    @classmethod
+    def validate(cls, kind: str, params: dict):
+        if kind not in JOBS:
+            raise ValueError(f"Unknown job: {kind}. Available: {', '.join(sorted(JOBS))}")
+        signature = inspect.signature(JOBS[kind])
+        unknown = set(params) - set(list(signature.parameters)[1:])
+        if unknown:
+            raise ValueError(f"Unknown params for {kind}: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    async def submit(cls, kind: str, params: dict | None = None, queue: str = "db") -> "Job":
+        params = params or {}
+        cls.validate(kind, params)
+        async with AsyncSessionLocal.detached() as session:
+            instance = cls(kind=kind, params=params, queue=queue, status=JOB_QUEUED, progress=0.0, done=0)
+            session.add(instance)
+            await session.commit()
+            await session.refresh(instance)
+        return instance
+
+    @classmethod
+    async def get(cls, job_id: int) -> "Job | None":
+        async with AsyncSessionLocal.detached() as session:
+            return await session.get(cls, job_id)
+
+    @classmethod
+    async def list_(cls, kind: str | None = None, status: str | None = None, limit: int = 20) -> list["Job"]:
+        query = select(cls).order_by(cls.id.desc()).limit(limit)
+        if kind:
+            query = query.where(cls.kind == kind)
+        if status:
+            query = query.where(cls.status == status)
+        async with AsyncSessionLocal.detached() as session:
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    @classmethod
+    async def update_(cls, job_id: int, **values):
+        async with AsyncSessionLocal.detached() as session:
+            await session.execute(update(cls).where(cls.id == job_id).values(**values, updated_at=func.now()))
+            await session.commit()
+
+    @classmethod
+    async def claim(cls, worker: str, kinds: list[str] | None = None) -> "Job | None":
+        """ Забирає найстарішу задачу з черги; SKIP LOCKED - воркери не чекають один одного """
+        candidate = (
+            select(cls.id)
+            .where(cls.status == JOB_QUEUED, cls.queue == "db")
+            .order_by(cls.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if kinds:
+            candidate = candidate.where(cls.kind.in_(kinds))
+        stmt = (
+            update(cls)
+            .where(cls.id == candidate.scalar_subquery())
+            .values(status=JOB_RUNNING, worker=worker, started_at=func.now(), updated_at=func.now())
+            .returning(cls)
+        )
+        async with AsyncSessionLocal.detached() as session:
+            result = await session.execute(stmt)
+            instance = result.scalar()
+            await session.commit()
+        return instance
+
+    @classmethod
+    async def claim_stale_local(cls, worker: str, older_than: float = settings.JOB_STALE_AFTER) -> list["Job"]:
+        """
+        Локальні задачі процесу, який зупинився (перезапуск, падіння): без heartbeat довше `older_than`.
+        Живі процеси оновлюють updated_at і поки задача чекає в черзі, тож їх задачі не забираються.
+        """
+        async with AsyncSessionLocal.detached() as session:
+            result = await session.execute(
+                update(cls)
+                .where(cls.status.in_((JOB_QUEUED, JOB_RUNNING)), cls.queue == LocalJobQueue.name,
+                       cls.updated_at < func.now() - timedelta(seconds=older_than))
+                .values(status=JOB_QUEUED, worker=worker, updated_at=func.now())
+                .returning(cls)
+            )
+            instances = result.scalars().all()
+            await session.commit()
+        return instances
+
+    @classmethod
+    async def requeue_stale(cls, older_than: float = settings.JOB_STALE_AFTER) -> int:
+        """ Повертає в чергу задачі воркерів, які перестали надсилати heartbeat """
+        async with AsyncSessionLocal.detached() as session:
+            result = await session.execute(
+                update(cls)
+                .where(cls.status == JOB_RUNNING, cls.queue == "db",
+                       cls.updated_at < func.now() - timedelta(seconds=older_than))
+                .values(status=JOB_QUEUED, worker=None, updated_at=func.now())
+                .returning(cls.id)
+            )
+            ids = result.scalars().all()
+            await session.commit()
+        if ids:
+            logger.warning(f'[jobs] requeued stale jobs: {ids}')
+        return len(ids)
+
+
+class JobContext:
+    """ Передається в задачу: звітування про прогрес (записи в БД не частіше JOB_PROGRESS_INTERVAL) """
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._written_at = 0.0
+
+    async def progress(self, done: int, total: int | None = None, message: str | None = None, force: bool = False):
+        now = time.monotonic()
+        finished = total is not None and done >= total
+        if not force and not finished and now - self._written_at < settings.JOB_PROGRESS_INTERVAL:
+            return
+        self._written_at = now
+        values = dict(done=done, total=total)
+        if total:
+            values['progress'] = min(done / total, 1.0)
+        if message is not None:
+            values['message'] = message
+        await Job.update_(self.job_id, **values)
+
+
+async def heartbeat(job_id: int):
+    """ Позначка "процес живий" для задачі: без неї задачу забирає requeue_stale / claim_stale_local """
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+        try:
+            await Job.update_(job_id)
+        except Exception as e:
+            logger.warning(f'[jobs] heartbeat of job #{job_id} failed: {e}')
+
+
+async def run_job(instance: Job, worker: str) -> Job:
+    """ Виконує задачу, статус running має бути вже встановлений (claim або локальна черга) """
+    ctx = JobContext(instance.id)
+    beat = asyncio.create_task(heartbeat(instance.id))
+    try:
+        result = await JOBS[instance.kind](ctx, **instance.params)
+        # результат зберігається в JSONB: datetime та інше - рядками
+        result = json.loads(json.dumps(result, default=str)) if result is not None else None
+        await Job.update_(instance.id, status=JOB_DONE, progress=1.0, result=result, finished_at=func.now())
+        logger.info(f'[jobs] {worker}: {instance.kind}#{instance.id} done')
+    except Exception as e:
+        logger.exception(f'[jobs] {worker}: {instance.kind}#{instance.id} failed: {e}')
+        await Job.update_(instance.id, status=JOB_FAILED, error=f'{type(e).__name__}: {e}', finished_at=func.now())
+    finally:
+        beat.cancel()
+    return instance
+
+
+class LocalJobQueue:
+    """ Задачі виконуються в цьому ж процесі (одновузлові інсталяції, тести) """
+    name = "local"
+
+    def __init__(self, concurrency: int = settings.JOB_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks: set[asyncio.Task] = set()
+        self.recovery: asyncio.Task | None = None
+
+    async def submit(self, kind: str, params: dict | None = None) -> Job:
+        instance = await Job.submit(kind, params, queue=self.name)
+        self._schedule(instance)
+        return instance
+
+    async def start(self):
+        """ Фонова перевірка: локальні задачі процесів, що зупинились, перезапускаються в цьому """
+        if self.recovery is None:
+            self.recovery = asyncio.create_task(self._recover_forever())
+
+    async def stop(self):
+        if self.recovery is not None:
+            self.recovery.cancel()
+            self.recovery = None
+
+    async def _recover_forever(self):
+        while True:
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.exception(f'[jobs] recovery of local jobs failed: {e}')
+            await asyncio.sleep(settings.JOB_STALE_AFTER)
+
+    async def recover(self) -> int:
+        """ Перезапускає локальні задачі, які залишились queued/running після зупинки їх процесу """
+        instances = await Job.claim_stale_local(self.name)
+        for instance in instances:
+            self._schedule(instance)
+        if instances:
+            logger.warning(f'[jobs] restarted interrupted local jobs: {[i.id for i in instances]}')
+        return len(instances)
+
+    def _schedule(self, instance: Job):
+        task = asyncio.create_task(self._run(instance))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, instance: Job):
+        # heartbeat і під час очікування в черзі: задача живого процесу не вважається завислою
+        waiting = asyncio.create_task(heartbeat(instance.id))
+        try:
+            await self.semaphore.acquire()
+        finally:
+            waiting.cancel()
+        try:
+            await Job.update_(instance.id, status=JOB_RUNNING, worker=self.name, started_at=func.now())
+            await run_job(instance, self.name)
+        finally:
+            self.semaphore.release()
+
+
+class DatabaseJobQueue:
+    """ Задачі записуються в таблицю job, виконують окремі процеси `python -m jobs.worker` """
+    name = "db"
+
+    async def submit(self, kind: str, params: dict | None = None) -> Job:
+        return await Job.submit(kind, params, queue=self.name)
+
+
+JOB_QUEUES = {LocalJobQueue.name: LocalJobQueue, DatabaseJobQueue.name: DatabaseJobQueue}
+_queues: dict[str, LocalJobQueue | DatabaseJobQueue] = {}
+
+
+def get_job_queue(name: str = settings.JOB_BACKEND) -> LocalJobQueue | DatabaseJobQueue:
+    if name not in JOB_QUEUES:
+        raise ValueError(f"Unsupported job backend: {name}")
+    if name not in _queues:
+        _queues[name] = JOB_QUEUES[name]()
+    return _queues[name]
+
+
+async def submit_job(kind: str, params: dict | None = None) -> Job:
+    queue = get_job_queue(LocalJobQueue.name if kind in LOCAL_JOBS else settings.JOB_BACKEND)
+    return await queue.submit(kind, params)
@@ -0,0 +1,29 @@
+from pydantic import BaseModel, computed_field
+from typing import Optional
+from datetime import datetime
+from settings.config import settings
+
+
+class JobSchemaGET(BaseModel):
+    id: int
+    kind: str
+    params: dict
+    queue: str
+    status: str
+    progress: float
+    done: int
+    total: Optional[int] = None
+    message: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    worker: Optional[str] = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+    @computed_field
+    def link(self) -> str:
+        return f"{settings.BASE_URL}/api/jobs/{self.id}"
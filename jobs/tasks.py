@@ -0,0 +1,87 @@
+import csv
+import os
+
+from sqlalchemy import select, func
+
+from jobs.models import job, JobContext
+from settings.config import settings
+from settings.database import AsyncSessionLocal
+from settings.search import connect_search
+from shops.models import Product, Category, PriceRollup, PriceMover
+
+
+@job("reindex", local=settings.SEARCH_BACKEND == "memory")
+async def reindex(ctx: JobContext, full: bool = False) -> dict:
+    """ Переіндексація пошуку (full - blue/green перебудова індексу) """
+    search_backend = await connect_search()
+    return await search_backend.index_products(full=full, progress=ctx.progress)
+
+
+@job("rollup_rebuild")
+async def rollup_rebuild(ctx: JobContext, product_ids: list[int] | None = None,
+                         batch_size: int = settings.JOB_BATCH_SIZE) -> dict:
+    """ Перерахунок тижневих/місячних агрегатів цін пачками товарів """
+    if not product_ids:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(Product.id).order_by(Product.id))
+            product_ids = result.scalars().all()
+
+    total = len(product_ids)
+    for start in range(0, total, batch_size):
+        await PriceRollup.rebuild(product_ids[start:start + batch_size])
+        await ctx.progress(min(start + batch_size, total), total)
+    return dict(products=total)
+
+
+@job("product_stats")
+async def product_stats(ctx: JobContext, product_ids: list[int] | None = None,
+                        batch_size: int = settings.STATS_BATCH_SIZE) -> dict:
+    """ Перерахунок метрик цін товарів (середня за 30 днів, історичний мінімум, волатильність, sparkline) """
+    query = select(Product.id, Product.category_id).order_by(Product.id)
+    if product_ids:
+        query = query.where(Product.id.in_(product_ids))
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(query)).all()
+    product_ids = [product_id for product_id, _ in rows]
+
+    total, updated = len(product_ids), 0
+    for start in range(0, total, batch_size):
+        updated += await Product.update_stats(product_ids[start:start + batch_size])
+        await ctx.progress(min(start + batch_size, total), total)
+    Product.invalidate_caches([dict(category_id=i) for i in {category_id for _, category_id in rows}])
+    return dict(products=total, updated=updated)
+
+
+@job("movers_rebuild")
+async def movers_rebuild(ctx: JobContext) -> dict:
+    """ Перебудова лідербордів змін цін з таблиці product """
+    movers = await PriceMover.rebuild()
+    Product.invalidate_caches([])
+    return dict(movers=movers)
+
+
+@job("export")
+async def export(ctx: JobContext, shop_id: int | None = None, category_id: int | None = None) -> dict:
+    """ CSV з товарами (останні ціни) у settings.EXPORT_DIR, завантаження - /api/jobs/{id}/download """
+    stmt = select(Product.id, Product.name, Product.url, Product.category_id, Product.packaging,
+                  Product.in_stock, Product.last_price, Product.price_change, Product.updated_at)
+    if category_id is not None:
+        stmt = stmt.where(Product.category_id == category_id)
+    if shop_id is not None:
+        stmt = stmt.join(Category, Category.id == Product.category_id).where(Category.shop_id == shop_id)
+    stmt = stmt.order_by(Product.id)
+
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.EXPORT_DIR, f"export_{ctx.job_id}.csv")
+    rows = 0
+    async with AsyncSessionLocal.reader() as session:
+        total = (await session.execute(select(func.count()).select_from(stmt.subquery()))).scalar()
+        result = await session.stream(stmt.execution_options(yield_per=settings.JOB_BATCH_SIZE))
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(result.keys())
+            async for partition in result.partitions(settings.JOB_BATCH_SIZE):
+                writer.writerows(partition)
+                rows += len(partition)
+                await ctx.progress(rows, total)
+    return dict(rows=rows, file=os.path.basename(path))
@@ -0,0 +1,77 @@
+"""
+Воркер фонових задач (JOB_BACKEND = "db"):
+
+    python -m jobs.worker --concurrency 2
+    python -m jobs.worker --kinds reindex,export
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+
+from jobs.models import Job, run_job
+from jobs import tasks  # noqa: F401 - реєстрація задач
+from settings.config import settings
+from settings.search import close_search
+from settings.database import cache_broadcast
+
+logger = logging.getLogger(__name__)
+
+
+# найдовша пауза між спробами, коли БД недоступна
+MAX_BACKOFF = 60
+
+
+async def work(name: str, kinds: list[str] | None, stop: asyncio.Event):
+    failures = 0
+    while not stop.is_set():
+        try:
+            instance = await Job.claim(name, kinds)
+            failures = 0
+            if instance is not None:
+                logger.info(f'[jobs] {name}: {instance.kind}#{instance.id} started')
+                await run_job(instance, name)
+                continue
+        except Exception as e:
+            # збій БД не зупиняє воркер: пауза росте з кожною невдалою спробою
+            failures += 1
+            logger.exception(f'[jobs] {name}: {e}, retry #{failures}')
+        delay = min(settings.JOB_POLL_INTERVAL * 2 ** failures, MAX_BACKOFF)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main(args):
+    kinds = args.kinds.split(",") if args.kinds else None
+    stop = asyncio.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    if settings.CACHE_BROADCAST:
+        # задачі (product_stats, movers_rebuild) скидають кеші - процеси застосунку мають про це дізнатись
+        await cache_broadcast.start()
+    workers = [asyncio.create_task(work(f"{prefix}/{i}", kinds, stop)) for i in range(args.concurrency)]
+    logger.info(f'[jobs] worker {prefix} started, concurrency {args.concurrency}, kinds: {kinds or "all"}')
+    try:
+        while True:
+            try:
+                await Job.requeue_stale()
+            except Exception as e:
+                logger.exception(f'[jobs] requeue of stale jobs failed: {e}')
+            await asyncio.sleep(settings.JOB_STALE_AFTER)
+    finally:
+        stop.set()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await close_search()
+        await cache_broadcast.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Background jobs worker")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_CONCURRENCY)
+    parser.add_argument("--kinds", default="", help="Comma-separated job kinds, all by default")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,48 +1,81 @@
-from typing import Optional
-
-from elasticsearch import AsyncElasticsearch
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastadmin import fastapi_app as admin_app
 
 # from starlette.middleware.cors import CORSMiddleware
 
-from shops.urls import router as shop_router
+from shops.ingest import ingest_queue
+from shops.models import price_partitions
+from shops.urls import router as shop_router, conditional_rules
+from jobs.apis import router as jobs_router
+from jobs.models import submit_job, get_job_queue, LocalJobQueue
 from settings.config import settings
 from settings.service import import_admin_modules
-from settings.elastic import create_index, index_products_from_db
-from settings.database import async_engine, Base
+from settings.search import connect_search, close_search
+from settings.database import async_engine, replicas, cache_broadcast, Base, UnitOfWorkMiddleware, pool_stats
+from settings.migrations import run_migrations
+from settings.response_cache import ResponseCacheMiddleware
+from settings.conditional import ConditionalGetMiddleware
+from settings.metrics import MetricsMiddleware, registry, CONTENT_TYPE
 
 import_admin_modules()
 
 
 app = FastAPI()
-es: Optional[AsyncElasticsearch] = None
 @app.on_event("startup")
 async def startup():
     from users.models import User
     # Ініціалізація таблиць у базі даних
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(async_engine)
+    await price_partitions.start(async_engine)
+    await replicas.start()
+    if settings.CACHE_BROADCAST:
+        await cache_broadcast.start()
+    await get_job_queue(LocalJobQueue.name).start()
 
-    global es
-    es = AsyncElasticsearch("http://elastic_search:9200")
-
-    await create_index(es)
-    # await index_products_from_db()
+    search_backend = await connect_search()
+    if await search_backend.create_index():
+        # повна перебудова - задачею: статус і помилки видно в /api/jobs, паралельні перебудови не запускаються
+        await submit_job("reindex", dict(full=True))
+    if settings.INGEST_MODE == "queue":
+        await ingest_queue.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    await es.close()
+    await ingest_queue.stop()
+    await price_partitions.stop()
+    await get_job_queue(LocalJobQueue.name).stop()
+    await close_search()
+    await replicas.stop()
+    await cache_broadcast.stop()
 
 app.mount("/admin", admin_app)
 app.mount("/static", settings.static, name="static")
 
-@app.get("/reindex")
-async def reindex_products():
-    await index_products_from_db(es)
-    return {"status": "done"}
+@app.get("/reindex", status_code=202)
+async def reindex_products(full: bool = False):
+    job = await submit_job("reindex", dict(full=full))
+    return {"status": job.status, "job_id": job.id, "link": f"{settings.BASE_URL}/api/jobs/{job.id}"}
+
+@app.get("/api/db/stats", description="Connection pool: usage, saturation, checkout wait time and read replica health")
+async def db_stats():
+    return pool_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
 
+app.include_router(jobs_router, prefix="/api/jobs", tags=["jobs"])
 app.include_router(shop_router)
+# внутрішній шар: одна транзакція на запит, відповіді з кешу та 304 зʼєднання не беруть
+app.add_middleware(UnitOfWorkMiddleware)
+app.add_middleware(ResponseCacheMiddleware)
+# зовнішній шар: 304 віддається ще до кешу відповідей і запитів сторінки
+app.add_middleware(ConditionalGetMiddleware, rules=conditional_rules)
+# найзовнішніший: латентність рахується і для 304 / відповідей з кешу
+app.add_middleware(MetricsMiddleware)
 #
 # app.add_middleware(
 #     CORSMiddleware,
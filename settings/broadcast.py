@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Callable
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBroadcast:
+    """
+    Інвалідації кешів процесу (count-и, готові відповіді) між процесами - воркерами uvicorn,
+    воркерами задач - через Postgres LISTEN/NOTIFY.
+
+    `publish(tags)` надсилає теги іншим процесам, отримані від них теги передаються в `on_invalidate`
+    (власні повідомлення процес пропускає - він уже скинув кеш сам). Поки зʼєднання немає, чужі
+    інвалідації губляться, тому після кожного (пере)підключення кеші скидаються повністю:
+    `on_invalidate(None)`.
+    """
+    channel = 'cache_invalidation'
+    # NOTIFY приймає payload до 8000 байт; довший список тегів замінюється на "скинути все"
+    max_payload = 7900
+
+    def __init__(self, dsn: str, on_invalidate: Callable[[tuple[str, ...] | None], None],
+                 reconnect_interval: float = 5):
+        self.dsn = dsn
+        self.on_invalidate = on_invalidate
+        self.reconnect_interval = reconnect_interval
+        self.origin = uuid.uuid4().hex
+        # теги до відправки; невідправлене через обрив лишається першим
+        self.outbox: deque[tuple[str, ...]] = deque()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.connected = False
+
+    def publish(self, tags):
+        if self.task is not None:
+            self.outbox.append(tuple(tags))
+            self.wakeup.set()
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run_forever())
+
+    async def stop(self, timeout: float = 2):
+        """ Дає відправити вже поставлені інвалідації і закриває зʼєднання """
+        if self.task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self.outbox and self.connected and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.outbox:
+            logger.warning(f'[cache broadcast] {len(self.outbox)} invalidations not sent')
+        self.task.cancel()
+        self.task = None
+        self.outbox.clear()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get('origin') == self.origin:
+            return
+        tags = message.get('tags')
+        self.on_invalidate(tuple(tags) if tags is not None else None)
+
+    def _payload(self, tags: tuple[str, ...]) -> str:
+        payload = json.dumps(dict(origin=self.origin, tags=tags))
+        if len(payload.encode()) > self.max_payload:
+            payload = json.dumps(dict(origin=self.origin, tags=None))
+        return payload
+
+    async def _run_forever(self):
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+            except (OSError, asyncpg.PostgresError, asyncio.TimeoutError) as e:
+                logger.warning(f'[cache broadcast] connect failed: {e}')
+                await asyncio.sleep(self.reconnect_interval)
+                continue
+
+            try:
+                await connection.add_listener(self.channel, self._on_notify)
+                self.connected = True
+                self.on_invalidate(None)
+                while True:
+                    if not self.outbox:
+                        self.wakeup.clear()
+                        try:
+                            await asyncio.wait_for(self.wakeup.wait(), timeout=self.reconnect_interval)
+                        except asyncio.TimeoutError:
+                            # без трафіку обрив зʼєднання помітний лише на запиті
+                            await connection.execute('SELECT 1')
+                        continue
+                    await connection.execute('SELECT pg_notify($1, $2)', self.channel, self._payload(self.outbox[0]))
+                    self.outbox.popleft()
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError) as e:
+                logger.warning(f'[cache broadcast] connection lost: {e}')
+            finally:
+                self.connected = False
+                try:
+                    await asyncio.wait_for(connection.close(), timeout=self.reconnect_interval)
+                except Exception:
+                    connection.terminate()
+            await asyncio.sleep(self.reconnect_interval)
@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Hashable, Iterable
+
+
+class TTLCache:
+    """
+    In-process LRU кеш з обмеженням за кількістю записів та часом життя (TTL).
+    Записи можна позначати тегами і інвалідувати всі записи тегу разом.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any, tuple]] = OrderedDict()
+        self._tags: defaultdict[str, set] = defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = (), ttl: float | None = None):
+        if key in self._data:
+            self._remove(key)
+        tags = tuple(tags)
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, tags)
+        for tag in tags:
+            self._tags[tag].add(key)
+        while len(self._data) > self.maxsize:
+            self._remove(next(iter(self._data)))
+
+    def invalidate(self, *tags: str) -> list:
+        """ Видаляє всі записи з будь-яким із тегів, повертає ключі видалених """
+        removed = []
+        for tag in tags:
+            for key in self._tags.pop(tag, set()):
+                if key in self._data:
+                    self._remove(key)
+                    removed.append(key)
+        return removed
+
+    def clear(self):
+        self._data.clear()
+        self._tags.clear()
+
+    def keys(self) -> list:
+        return list(self._data)
+
+    def _remove(self, key: Hashable):
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+_MISSING = object()
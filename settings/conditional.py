@@ -0,0 +1,110 @@
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Awaitable, Callable
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers
+
+from settings.cache import TTLCache
+from settings.replicas import primary_requested
+from settings.response_cache import ResponseCacheMiddleware, response_cache, cache_tags
+
+# Шаблон шляху -> async функція (match шляху, параметри запиту), що повертає (час останньої зміни,
+# кількість рядків) даних сторінки; None - для цих параметрів валідаторів немає, запит іде без них
+ConditionalRules = list[tuple[re.Pattern, Callable[[re.Match, dict[str, str]],
+                                                   Awaitable[tuple[datetime | None, int] | None]]]]
+
+
+def validators(modified: datetime | None, total: int = 0) -> tuple[str, str | None]:
+    """ (ETag, Last-Modified) для часу останньої зміни і кількості рядків """
+    if modified is None:
+        return f'W/"0-{total:x}"', None
+    return (f'W/"{int(modified.timestamp() * 1_000_000):x}-{total:x}"',
+            format_datetime(modified.astimezone(timezone.utc), usegmt=True))
+
+
+def not_modified(headers: Headers, etag: str, modified: datetime | None) -> bool:
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-None-Match має пріоритет над If-Modified-Since; порівняння слабке (без W/)
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or etag.removeprefix('W/') in tags
+
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since is None or modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Last-Modified передається з точністю до секунди
+    return modified.replace(microsecond=0) <= since
+
+
+class ConditionalGetMiddleware:
+    """
+    ASGI middleware умовних GET: для маршрутів з `rules` рахує валідатори (ETag, Last-Modified)
+    з часу останньої зміни і кількості рядків даних і відповідає 304 ще до запиту сторінки з БД
+    та рендеру шаблону. Успішні відповіді отримують заголовки ETag / Last-Modified / Cache-Control: no-cache.
+
+    Валідатори кешуються в кеші відповідей з тегами сторінки (cache_tags) - їх скидає та сама
+    інвалідація при інжесті, тож повторні запити не ходять у БД, як і запити, на які
+    ResponseCacheMiddleware відповідає з памʼяті.
+    """
+
+    def __init__(self, app, rules: ConditionalRules, cache: TTLCache = response_cache):
+        self.app = app
+        self.rules = rules
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await self.app(scope, receive, send)
+        for pattern, last_modified in self.rules:
+            match = pattern.match(scope['path'])
+            if match:
+                break
+        else:
+            return await self.app(scope, receive, send)
+
+        # ключ - як у кеші відповідей: від параметрів залежить, з яких даних сторінка
+        key = ('validators', *ResponseCacheMiddleware.cache_key(scope))
+        # після власного запису клієнта (read-your-writes) валідатори рахуються заново, як і сторінка
+        cached = None if primary_requested(scope) else self.cache.get(key)
+        if cached is None:
+            version = self._version()
+            query = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+            cached = await last_modified(match, query)
+            if cached is None:
+                return await self.app(scope, receive, send)
+            # інвалідація під час запиту - значення могло застаріти ще до запису в кеш
+            if version == self._version():
+                self.cache.set(key, cached, tags=cache_tags(scope['path']) or ())
+        modified, total = cached
+        etag, last_modified_header = validators(modified, total)
+        headers = [(b'etag', etag.encode()), (b'cache-control', b'no-cache')]
+        if last_modified_header:
+            headers.append((b'last-modified', last_modified_header.encode()))
+
+        if not_modified(Headers(scope=scope), etag, modified):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start' and message['status'] == 200:
+                names = {name for name, _ in headers}
+                message = dict(message, headers=[
+                    (k, v) for k, v in message.get('headers', []) if k.lower() not in names
+                ] + headers)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _version() -> int:
+        """ Лічильник інвалідацій кешу відповідей """
+        return ResponseCacheMiddleware.instance.version if ResponseCacheMiddleware.instance else 0
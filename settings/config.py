@@ -15,6 +15,20 @@ class Settings(BaseSettings):
     DB_HOST: str
     DB_PORT: int
     DB_NAME: str
+    # пул асинхронних зʼєднань
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30  # скільки чекати вільне зʼєднання, потім TimeoutError
+    DB_POOL_RECYCLE: int = 1800  # перевідкривати зʼєднання, старші за стільки секунд
+    DB_POOL_PRE_PING: bool = True
+    # одна сесія/транзакція на HTTP-запит на запис (UnitOfWorkMiddleware) замість сесії на кожен метод моделі
+    DB_REQUEST_SESSION: bool = True
+    # репліки для читання: URL через кому (postgresql+asyncpg://...), порожньо - все читається з primary
+    DB_REPLICA_URLS: str = ''
+    DB_REPLICA_HEALTH_INTERVAL: float = 5  # як часто перевіряти репліки, секунд
+    DB_REPLICA_HEALTH_TIMEOUT: float = 2
+    DB_REPLICA_MAX_LAG: float = 10  # репліка, що відстає більше (секунд), не отримує читань
+    DB_READ_YOUR_WRITES_SECONDS: int = 5  # скільки після запису клієнт читає з primary (cookie)
 
     ADMIN_USER_MODEL: str
     ADMIN_USER_MODEL_USERNAME_FIELD: str
@@ -22,10 +36,96 @@ class Settings(BaseSettings):
 
     CELERY_BROKER_URL: str
 
+    # запис товарів від скраперів: "sync" - в запиті, "queue" - write-behind черга (відповідь 202)
+    INGEST_MODE: str = "sync"
+    INGEST_BATCH_SIZE: int = 5000
+    INGEST_FLUSH_INTERVAL: float = 2
+    INGEST_MAX_PENDING: int = 200_000
+    INGEST_MAX_ATTEMPTS: int = 3  # спроб записати товар, який відхиляє БД, перед dead-letter
+    # куди черга скидає незаписані товари при зупинці (NDJSON), на старті вони повертаються в чергу
+    INGEST_SPILL_DIR: str = os.path.join(BASE_DIR, "ingest_spill")
+    # POST /api/products/stream
+    INGEST_STREAM_CHUNK: int = 5000  # рядків в одному COPY
+    INGEST_STREAM_MAX_LINE: int = 1024 * 1024
+    INGEST_STREAM_MAX_ERRORS: int = 100
+
+    # фонові задачі: "local" - в процесі застосунку, "db" - черга в БД + `python -m jobs.worker`
+    JOB_BACKEND: str = "local"
+    JOB_CONCURRENCY: int = 2
+    JOB_POLL_INTERVAL: float = 1
+    JOB_HEARTBEAT_INTERVAL: float = 15
+    JOB_STALE_AFTER: float = 120  # задача воркера без heartbeat стільки секунд повертається в чергу
+    JOB_PROGRESS_INTERVAL: float = 1
+    JOB_BATCH_SIZE: int = 1000
+    EXPORT_DIR: str = os.path.join(BASE_DIR, "exports")
+
+    # секціонування таблиці цін по місяцях
+    PRICE_PARTITIONS_AHEAD: int = 3  # скільки місяців наперед створювати секції
+    PRICE_RETENTION_MONTHS: int = 0  # 0 - зберігати історію назавжди
+    PRICE_EXPIRED_PARTITIONS: str = 'detach'  # detach | drop
+    # максимум точок в /api/products/{id}/history, коли деталізація обирається автоматично
+    HISTORY_MAX_POINTS: int = 200
+    # скільки останніх цін товару вантажити для списків товарів (графік на сторінці)
+    PRICES_ON_PAGE: int = 90
+    # максимум товарів в одному запиті /api/charts
+    CHART_MAX_PRODUCTS: int = 100
+    # розмір пачки рядків при вивантаженні цін колонками (/api/prices/series)
+    SERIES_FETCH_SIZE: int = 50_000
+    # максимум точок у відповіді: колонки збираються в памʼяті цілком (~16 байт на точку) до відправки
+    SERIES_MAX_ROWS: int = 5_000_000
+    # метрики цін товарів (Product.update_stats): вікно рядів, середня, точки sparkline, товарів за раз
+    STATS_WINDOW_DAYS: int = 90
+    STATS_AVG_DAYS: int = 30
+    STATS_SPARKLINE_POINTS: int = 30
+    STATS_BATCH_SIZE: int = 5000
+    # лідерборди змін цін (/api/movers)
+    MOVERS_LIMIT: int = 20
+    MOVERS_MAX_LIMIT: int = 100
+    # глибина сторінок: OFFSET пропускає рядки індексу по одному
+    MOVERS_MAX_OFFSET: int = 10_000
+    # /metrics: латентність HTTP, SQL, пошук, інжест; рядів (комбінацій міток) на метрику не більше
+    METRICS_ENABLED: bool = True
+    METRICS_MAX_SERIES: int = 500
+    # кеш count(*) для пагінації
+    COUNT_CACHE_SIZE: int = 10_000
+    COUNT_CACHE_TTL: int = 300
+    # кеш готових форм запитів Base.filter_by_ (модель, поля фільтра, related, сортування)
+    STATEMENT_CACHE_SIZE: int = 1000
+    # кеш готових відповідей сторінок і read API (скидається інжестом)
+    RESPONSE_CACHE_SIZE: int = 2000
+    RESPONSE_CACHE_TTL: int = 600
+    RESPONSE_CACHE_TRACK_KEYS: int = 5000  # скільки ключів відстежувати для популярності
+    RESPONSE_CACHE_PREWARM: int = 50  # скільки найпопулярніших сторінок перерендерювати після інжесту
+    RESPONSE_CACHE_PREWARM_DELAY: float = 1
+    # інвалідації кешів (count-и, відповіді) між процесами через Postgres LISTEN/NOTIFY
+    CACHE_BROADCAST: bool = True
+
+    # Пошук: "elastic" - кластер Elasticsearch, "memory" - індекс у памʼяті процесу
+    SEARCH_BACKEND: str = "elastic"
+    SEARCH_MEMORY_MAX_GRAM: int = 20
+
+    # Elasticsearch
+    ELASTIC_URL: str = "http://elastic_search:9200"
+    ES_CONNECTIONS_PER_NODE: int = 10
+    ES_REQUEST_TIMEOUT: float = 10
+    ES_REPLICAS: int = 1
+    ES_KEEP_INDICES: int = 1  # скільки попередніх версій індексу залишати для відкату
+    SEARCH_CACHE_SIZE: int = 2048
+    SEARCH_CACHE_TTL: int = 30
+    SUGGEST_SIZE: int = 10
+    ES_BATCH_SIZE: int = 1000  # документів в одному bulk-запиті
+    ES_MAX_IN_FLIGHT: int = 4  # одночасних bulk-запитів
+    # на скільки секунд watermark відстає від часу читання: більше за найдовшу транзакцію інжесту
+    ES_WATERMARK_SAFETY_SECONDS: int = 300
+
     @property
     def database_url_async(self) -> str:
         return f'postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}'
 
+    @property
+    def database_replica_urls(self) -> list[str]:
+        return [url.strip() for url in self.DB_REPLICA_URLS.split(',') if url.strip()]
+
     @property
     def database_url_sync(self) -> str:
         return f'postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}'
@@ -1,14 +1,30 @@
 import asyncio
+import json
 import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
-from typing import Optional
+from functools import cache
+from typing import Optional, Callable, Hashable
 
-from sqlalchemy import MetaData, func, create_engine, inspect, tuple_, DateTime
+from sqlalchemy import (MetaData, func, create_engine, inspect, tuple_, DateTime, Integer, bindparam, column, desc,
+                        and_, or_, false, text)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.future import select
+from sqlalchemy.types import TypeEngine
 from sqlalchemy.orm import sessionmaker, selectinload, DeclarativeBase, Mapped, mapped_column, InstrumentedAttribute
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncConnection, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from settings.config import settings
+from settings.cache import TTLCache
+from settings.response_cache import invalidate_responses, clear_responses
+from settings.broadcast import InvalidationBroadcast
+from settings.pagination import encode_cursor, decode_cursor
+from settings.replicas import ReplicaSet, PRIMARY_COOKIE, primary_pinned, primary_requested, use_primary
+from settings import metrics
 
 logging.basicConfig(
     # filename=logfile,
@@ -28,9 +44,378 @@ engine = create_engine(
 )
 sessions_sync = sessionmaker(bind=engine)
 
-# Створення асинхронного двигуна
-async_engine = create_async_engine(settings.database_url_async, echo=False, future=True,)
-AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул, що рахує очікування на зʼєднання (разом з відкриттям нового в межах overflow) і таймаути.
+    Лічильники в кожного пулу свої: primary і кожна репліка звітують окремо.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = dict(checkouts=0, timeouts=0, wait_seconds_total=0.0, wait_seconds_max=0.0)
+
+    def recreate(self):
+        # engine.dispose() замінює пул новим - лічильники переходять до нього
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.stats['timeouts'] += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started
+            self.stats['checkouts'] += 1
+            self.stats['wait_seconds_total'] += wait
+            self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], wait)
+
+
+# Налаштування пулу - однакові для primary і реплік
+ENGINE_OPTIONS = dict(
+    echo=False,
+    future=True,
+    poolclass=InstrumentedPool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+
+# Створення асинхронного двигуна (primary: всі записи)
+async_engine = create_async_engine(settings.database_url_async, **ENGINE_OPTIONS)
+# Репліки для читання (DB_REPLICA_URLS); перевірка стану - replicas.start() при старті застосунку
+replicas = ReplicaSet(settings.database_replica_urls, **ENGINE_OPTIONS)
+
+
+metrics.instrument_engine(async_engine, 'primary')
+for _engine in replicas.engines:
+    metrics.instrument_engine(_engine, 'replica')
+
+
+def _checkout_stats(pool: InstrumentedPool) -> dict:
+    stats = pool.stats
+    checkouts = stats['checkouts']
+    return dict(
+        checkouts=checkouts,
+        timeouts=stats['timeouts'],
+        wait_seconds_total=round(stats['wait_seconds_total'], 6),
+        wait_seconds_avg=round(stats['wait_seconds_total'] / checkouts, 6) if checkouts else None,
+        wait_seconds_max=round(stats['wait_seconds_max'], 6),
+    )
+
+
+def pool_stats() -> dict:
+    """
+    Стан пулу primary: зайняті зʼєднання, насиченість (зайняті / максимум), очікування на checkout.
+    Репліки - окремо, кожна зі своїми лічильниками.
+    """
+    pool = async_engine.pool
+    checked_out = pool.checkedout()
+    capacity = pool.size() + settings.DB_MAX_OVERFLOW
+    return dict(
+        size=pool.size(),
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        checked_out=checked_out,
+        checked_in=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        saturation=round(checked_out / capacity, 3) if capacity else None,
+        **_checkout_stats(pool),
+        replicas=[dict(**stats, **_checkout_stats(engine.pool))
+                  for stats, engine in zip(replicas.stats(), replicas.engines)],
+    )
+
+
+def _replica_name(engine) -> str:
+    return f'{engine.url.host}:{engine.url.port}'
+
+
+def _replica_samples(value: Callable) -> list[tuple[dict, float | None]]:
+    return [(dict(replica=_replica_name(engine)), value(engine)) for engine in replicas.engines]
+
+
+def _pool_samples(key: str) -> list[tuple[dict, float]]:
+    """ Лічильник checkout-ів по пулах: primary та кожна репліка окремо """
+    return [(dict(pool='primary'), async_engine.pool.stats[key])] + [
+        (dict(pool=_replica_name(engine)), engine.pool.stats[key]) for engine in replicas.engines
+    ]
+
+
+# Стан пулу primary та реплік читається під час scrape /metrics
+metrics.registry.callback('db_pool_checked_out', 'Primary pool connections in use',
+                          lambda: [({}, async_engine.pool.checkedout())])
+metrics.registry.callback('db_pool_saturation', 'Primary pool connections in use / (pool_size + max_overflow)',
+                          lambda: [({}, pool_stats()['saturation'])])
+metrics.registry.callback('db_pool_checkouts', 'Connection checkouts per pool (primary or replica)',
+                          lambda: _pool_samples('checkouts'), kind='counter', labels=('pool',))
+metrics.registry.callback('db_pool_timeouts', 'Checkouts that timed out waiting for a connection',
+                          lambda: _pool_samples('timeouts'), kind='counter', labels=('pool',))
+metrics.registry.callback('db_pool_wait_seconds', 'Time spent waiting for a connection',
+                          lambda: _pool_samples('wait_seconds_total'), kind='counter', labels=('pool',))
+metrics.registry.callback('db_replica_healthy', 'Read replica passed the last health check (1/0)',
+                          lambda: _replica_samples(lambda engine: int(replicas.healthy[engine])), labels=('replica',))
+metrics.registry.callback('db_replica_lag_seconds', 'Read replica replay lag',
+                          lambda: _replica_samples(replicas.lag.get), labels=('replica',))
+metrics.registry.callback('db_replica_checked_out', 'Read replica pool connections in use',
+                          lambda: _replica_samples(lambda engine: engine.pool.checkedout()), labels=('replica',))
+
+
+class UnitOfWork:
+    """
+    Одне зʼєднання і одна транзакція на HTTP-запит (або інший блок `unit_of_work()`).
+    Сесії з AsyncSessionLocal() у тому ж asyncio task працюють на цьому зʼєднанні, їх
+    begin/commit/rollback - SAVEPOINT (join_transaction_mode="create_savepoint"), тож методи
+    моделей не змінюються, а помилка одного з них відкочує лише його зміни.
+    Зʼєднання береться з пулу при першому запиті до БД; фіксується все разом у `commit()`.
+    Задачі, запущені з запиту (create_task), успадковують contextvar, але працюють з власними сесіями.
+
+    Сесії для читання (AsyncSessionLocal.reader()) отримують окреме зʼєднання з репліки, поки
+    запит не привʼязаний до primary і ще не відкрив зʼєднання з ним: після першого звернення
+    до primary читання теж ідуть туди і бачать власні зміни запиту.
+    """
+
+    def __init__(self):
+        self.owner = asyncio.current_task()
+        self.connection: AsyncConnection | None = None
+        self.read_connection: AsyncConnection | None = None
+        self.callbacks: list[Callable[[], None]] = []
+        self.closed = False
+
+    @property
+    def active(self) -> bool:
+        return not self.closed and self.owner is asyncio.current_task()
+
+    async def connect(self, read: bool = False) -> AsyncConnection:
+        if read and self.connection is None and not primary_pinned():
+            if self.read_connection is None:
+                self.read_connection = await _connect_replica()
+            if self.read_connection is not None:
+                return self.read_connection
+        if self.connection is None:
+            self.connection = await async_engine.connect()
+            await self.connection.begin()
+        return self.connection
+
+    async def commit(self):
+        await self._finish(commit=True)
+
+    async def rollback(self):
+        await self._finish(commit=False)
+
+    async def _finish(self, commit: bool):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.connection is not None:
+                if commit:
+                    await self.connection.commit()
+                else:
+                    await self.connection.rollback()
+        finally:
+            if self.connection is not None:
+                await self.connection.close()
+            if self.read_connection is not None:
+                await self.read_connection.close()
+        if commit:
+            for callback in self.callbacks:
+                callback()
+        self.callbacks.clear()
+
+
+async def _connect_replica(begin: bool = True) -> AsyncConnection | None:
+    """ Зʼєднання з наступною здоровою реплікою; None - реплік немає або жодна не відповідає """
+    while (engine := replicas.pick()) is not None:
+        try:
+            connection = await engine.connect()
+        except (SQLAlchemyError, OSError) as e:
+            replicas.mark_down(engine, e)
+            continue
+        if begin:
+            await connection.begin()
+        return connection
+    return None
+
+
+_unit_of_work: ContextVar[UnitOfWork | None] = ContextVar('unit_of_work', default=None)
+
+
+class _UnitOfWorkSession:
+    """ `async with` для сесії на зʼєднанні UnitOfWork: закриття сесії не повертає зʼєднання в пул """
+
+    def __init__(self, uow: UnitOfWork, read: bool = False):
+        self.uow = uow
+        self.read = read
+        self.session: AsyncSession | None = None
+
+    async def __aenter__(self) -> AsyncSession:
+        self.session = AsyncSession(bind=await self.uow.connect(read=self.read), expire_on_commit=False,
+                                    join_transaction_mode="create_savepoint")
+        return self.session
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+
+class _ReplicaSession:
+    """ `async with` для сесії читання поза unit of work: зʼєднання з першою репліки, що відповіла, інакше primary """
+
+    def __init__(self, sessionmaker: async_sessionmaker):
+        self.sessionmaker = sessionmaker
+        self.connection: AsyncConnection | None = None
+        self.session: AsyncSession | None = None
+
+    async def __aenter__(self) -> AsyncSession:
+        self.connection = await _connect_replica(begin=False)
+        if self.connection is None:
+            self.session = self.sessionmaker()
+        else:
+            self.session = self.sessionmaker(bind=self.connection)
+        return self.session
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        if self.connection is not None:
+            await self.connection.close()
+
+
+class SessionFactory:
+    """ AsyncSessionLocal(): сесія unit of work поточного запиту, якщо він відкритий, інакше - нова """
+
+    def __init__(self, **kwargs):
+        self.sessionmaker = async_sessionmaker(**kwargs)
+
+    def __call__(self) -> AsyncSession | _UnitOfWorkSession:
+        uow = _unit_of_work.get()
+        if uow is not None and uow.active:
+            return _UnitOfWorkSession(uow)
+        return self.sessionmaker()
+
+    def detached(self) -> AsyncSession:
+        """ Нова сесія з власним зʼєднанням навіть всередині unit of work (зміни видно іншим процесам одразу) """
+        return self.sessionmaker()
+
+    def reader(self) -> AsyncSession | _UnitOfWorkSession | _ReplicaSession:
+        """
+        Сесія лише для читання: з репліки (round-robin по здорових), якщо вони є і читання
+        не привʼязане до primary (use_primary(), X-DB-Primary, cookie після запису, не-GET запит).
+        """
+        uow = _unit_of_work.get()
+        if uow is not None and uow.active:
+            return _UnitOfWorkSession(uow, read=True)
+        if primary_pinned() or not replicas.engines:
+            return self.sessionmaker()
+        return _ReplicaSession(self.sessionmaker)
+
+
+AsyncSessionLocal = SessionFactory(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def unit_of_work():
+    """ Блок з одним зʼєднанням і транзакцією для всіх методів моделей; вкладений блок - частина зовнішнього """
+    uow = _unit_of_work.get()
+    if uow is not None and uow.active:
+        yield uow
+        return
+    uow = UnitOfWork()
+    token = _unit_of_work.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        await uow.rollback()
+        raise
+    else:
+        await uow.commit()
+    finally:
+        _unit_of_work.reset(token)
+
+
+def after_commit(callback: Callable[[], None]):
+    """ Виконує callback після фіксації unit of work поточного запиту (або одразу, якщо його немає) """
+    uow = _unit_of_work.get()
+    if uow is not None and uow.active:
+        uow.callbacks.append(callback)
+    else:
+        callback()
+
+
+class UnitOfWorkMiddleware:
+    """
+    ASGI middleware: кожен HTTP-запит на запис (крім `exclude`) - один UnitOfWork. Транзакція
+    фіксується перед відправкою заголовків відповіді (клієнт не побачить успіх незафіксованих змін),
+    відповідь 5xx або виняток - відкат.
+
+    GET/HEAD працюють без unit of work: UnitOfWork тримав би зʼєднання з primary (і з репліки)
+    до відправки заголовків - разом із рендером шаблону та серіалізацією, хоча запити до БД вже
+    виконані. Без нього кожна сесія моделі бере зʼєднання лише на свої запити; ціна - запити
+    однієї сторінки (елементи, count) не бачать спільного знімка БД і беруть зʼєднання з пулу кожен.
+
+    З репліками: GET/HEAD читають з реплік, решта запитів і запити з X-DB-Primary - з primary.
+    Після успішного запису клієнт отримує cookie, з яким DB_READ_YOUR_WRITES_SECONDS читає з primary
+    і бачить власні зміни, навіть якщо репліка ще відстає.
+    """
+
+    def __init__(self, app, exclude: tuple[str, ...] = ('/admin', '/static')):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith(self.exclude):
+            return await self.app(scope, receive, send)
+        writes = scope['method'] not in ('GET', 'HEAD')
+        if not replicas.engines or not (writes or primary_requested(scope)):
+            return await self._run(scope, receive, send, writes)
+
+        async def remember_write(message):
+            if message['type'] == 'http.response.start' and writes and message['status'] < 400:
+                cookie = f'{PRIMARY_COOKIE}=1; Max-Age={settings.DB_READ_YOUR_WRITES_SECONDS}; Path=/; HttpOnly; SameSite=Lax'
+                message = dict(message, headers=list(message.get('headers', [])) + [(b'set-cookie', cookie.encode())])
+            await send(message)
+
+        with use_primary():
+            await self._run(scope, receive, remember_write, writes)
+
+    async def _run(self, scope, receive, send, writes: bool):
+        if not (settings.DB_REQUEST_SESSION and writes):
+            return await self.app(scope, receive, send)
+
+        async with unit_of_work() as uow:
+            async def send_wrapper(message):
+                if message['type'] == 'http.response.start':
+                    if message['status'] < 500:
+                        await uow.commit()
+                    else:
+                        await uow.rollback()
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+
+# Кеш точних count(*) для пагінації: ключ (таблиця, фільтри), теги - значення FK у фільтрах
+count_cache = TTLCache(maxsize=settings.COUNT_CACHE_SIZE, ttl=settings.COUNT_CACHE_TTL)
+COUNT_STRATEGIES = ('exact', 'cached', 'estimate', 'none')
+
+
+def _invalidate_local(tags: tuple[str, ...] | None):
+    """ Інвалідація від іншого процесу; None - скинути все (список тегів не вмістився або був обрив) """
+    if tags is None:
+        count_cache.clear()
+        clear_responses()
+    else:
+        count_cache.invalidate(*tags)
+        invalidate_responses(*tags)
+
+
+# Кеші живуть у памʼяті процесу: інжест в одному процесі скидає їх в усіх інших (start() на старті процесу)
+cache_broadcast = InvalidationBroadcast(settings.database_url_async.replace('+asyncpg', ''), _invalidate_local)
+# Готові запити Base.filter_by_ зі значеннями у bindparam - живуть, доки їх не витіснять (TTL не потрібен)
+statement_cache = TTLCache(maxsize=settings.STATEMENT_CACHE_SIZE, ttl=float('inf'))
 
 
 async def get_session() -> AsyncSession:
@@ -41,6 +426,27 @@ def now() -> datetime:
     return datetime.now(tz=timezone.utc)
 
 
+def unnest_table(columns: dict[str, type[TypeEngine] | TypeEngine], rows: list[dict], name: str = 'src'):
+    """
+    Табличне джерело `unnest(:col_1, :col_2, ...) AS name(col_1, col_2, ...)` зі списку словників.
+    На кожну колонку передається один параметр-масив, тож текст запиту і кількість
+    параметрів не залежать від кількості рядків.
+
+    :param columns: {назва колонки: тип SQLAlchemy}
+    :param rows: список словників з даними
+    :param name: аліас джерела в запиті (має бути унікальним в межах запиту)
+    """
+    arrays = [
+        bindparam(f'{name}_{col}', [row.get(col) for row in rows], type_=ARRAY(type_))
+        for col, type_ in columns.items()
+    ]
+    return (
+        func.unnest(*arrays)
+        .table_valued(*[column(col, type_) for col, type_ in columns.items()])
+        .render_derived(name=name)
+    )
+
+
 class Base(DeclarativeBase):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -75,11 +481,22 @@ class Base(DeclarativeBase):
         :param kwargs: словник значень
         :return: відфільтрований словник
         """
-        # Отримуємо набір імен усіх атрибутів моделі, які є колонками або relationship
-        model_fields = {attr for attr, value in vars(cls).items() if isinstance(value, InstrumentedAttribute)}
+        model_fields = cls._model_fields_()
         # Повертаємо тільки ті пари ключ-значення, які є в полях моделі
         return {key: value for key, value in kwargs.items() if key in model_fields}
 
+    @classmethod
+    @cache
+    def _model_fields_(cls) -> frozenset[str]:
+        """ Імена всіх атрибутів моделі, які є колонками або relationship (рахується один раз на модель) """
+        return frozenset(attr for attr, value in vars(cls).items() if isinstance(value, InstrumentedAttribute))
+
+    @classmethod
+    @cache
+    def _column_fields_(cls) -> frozenset[str]:
+        """ Атрибути-колонки: лише по них фільтр можна винести в bindparam """
+        return frozenset(attr.key for attr in inspect(cls).column_attrs)
+
     # @classmethod
     # def validate_relationships(cls, relateds: list[str]) -> list:
     #     relations = []
@@ -94,6 +511,12 @@ class Base(DeclarativeBase):
 
     @classmethod
     def validate_relationships(cls, relateds: list[str]) -> list:
+        return list(cls._loader_options_(tuple(relateds)))
+
+    @classmethod
+    @cache
+    def _loader_options_(cls, relateds: tuple[str, ...]) -> tuple:
+        """ Ланцюжки selectinload для `relateds`; опції незмінні, тож будуються один раз на набір """
         relations = []
         for related in relateds:
             parts = related.split(".")
@@ -118,7 +541,7 @@ class Base(DeclarativeBase):
 
             relations.append(current_loader)
 
-        return relations
+        return tuple(relations)
 
     @classmethod
     async def create(cls, **kwargs):
@@ -128,6 +551,7 @@ class Base(DeclarativeBase):
             session.add(instance)
             await session.commit()
             await session.refresh(instance)
+        cls.invalidate_caches([request])
         logger.debug(f'class {cls.__name__} created: {instance}')
         return instance
 
@@ -170,6 +594,7 @@ class Base(DeclarativeBase):
             await session.commit()  # Коммітимо зміни
             for instance in instances:
                 await session.refresh(instance)
+        cls.invalidate_caches(objects)
 
         return instances
 
@@ -183,7 +608,7 @@ class Base(DeclarativeBase):
                 raise ValueError(f"Relationship '{related}' not found on model '{cls.__name__}'")
             stmt = stmt.options(selectinload(relation))
 
-        async with AsyncSessionLocal() as session:
+        async with AsyncSessionLocal.reader() as session:
             result = await session.execute(stmt)
 
             try:
@@ -215,61 +640,303 @@ class Base(DeclarativeBase):
             print('get all shops', shops)
             return shops
 
+    @classmethod
+    def _ordering_(cls, ordered: Optional[list], direction: Optional[str] = None) -> list[tuple]:
+        """
+        Перетворює `ordered` (назви полів або готові вирази) та `direction` (asc/desc)
+        на список (вираз, desc: bool). Останнім завжди додається id, щоб порядок був однозначним.
+        """
+        order = []
+        for item in ordered or []:
+            if isinstance(item, str):
+                attr = getattr(cls, item, None)
+                if not isinstance(attr, InstrumentedAttribute):
+                    raise ValueError(f"Field '{item}' not found on model '{cls.__name__}'")
+                item = attr
+            order.append((item, direction == 'desc'))
+        if not any(item is cls.id for item, _ in order):
+            order.append((cls.id, direction == 'desc'))
+        return order
+
+    @staticmethod
+    def _keyset_after_(order: list[tuple], values: list):
+        """
+        WHERE для рядків, що йдуть після рядка зі значеннями `values` при сортуванні `order`.
+        NULL впорядковуються як в PostgreSQL за замовчуванням: ASC - NULLS LAST, DESC - NULLS FIRST.
+        """
+        columns = [item for item, _ in order]
+        directions = {descending for _, descending in order}
+        not_null = all(getattr(getattr(item, 'expression', item), 'nullable', True) is False for item in columns)
+        if len(directions) == 1 and not_null and all(value is not None for value in values):
+            # Однаковий напрямок без NULL - порівняння рядків, яке PostgreSQL виконує по індексу
+            if directions.pop():
+                return tuple_(*columns) < tuple_(*values)
+            return tuple_(*columns) > tuple_(*values)
+
+        clauses, equal = [], []
+        for (item, descending), value in zip(order, values):
+            if value is None:
+                after = item.is_not(None) if descending else false()
+            elif descending:
+                after = item < value
+            else:
+                after = or_(item > value, item.is_(None))
+            clauses.append(and_(*equal, after))
+            equal.append(item.is_(None) if value is None else item == value)
+        return or_(*clauses)
+
     @classmethod
     async def filter_by_(cls, **kwargs) -> dict:
         """
         ordered: Optional[list] = None,
+        direction: Optional[str] = None,  # asc | desc
         related: Optional[str] = None,
         limit: Optional[int] = 10,
         offset: Optional[int] = 0,
+        cursor: Optional[str] = None,  # курсор next/prev з попередньої відповіді замість offset
+        count: Optional[str] = 'exact',  # exact | cached | estimate | none - див. _count_
+        count_key: Optional[tuple] = None,  # доповнення ключа кешу, якщо фільтри задані через base_query
+        where: Optional[tuple[Hashable, list]] = None,  # (ключ, додаткові умови без змінних значень)
         :param kwargs:
         :return:
         """
         limit = kwargs.get('limit', 10)
         offset = kwargs.get('offset', 0)
-        ordered = kwargs.get('ordered')
-        related = kwargs.get('related')
+        order = cls._ordering_(kwargs.get('ordered'), kwargs.get('direction'))
+        related = kwargs.get('related') or []
+        if isinstance(related, str):
+            related = [related, ]
+        elif not isinstance(related, list):
+            raise Exception(f"Unsupported type of related: {type(related)}")
 
         filter_params = cls._filter_kwargs_by_atribute_(**kwargs)
         # print(f'filter_params: {filter_params}')
-        stmt = kwargs.get('base_query', select(cls).filter_by(**filter_params))
+        if 'base_query' in kwargs or not filter_params.keys() <= cls._column_fields_():
+            # довільний запит або фільтр по relationship - будується наново щоразу
+            shape_key, params = None, {}
+            stmt = kwargs.get('base_query', select(cls).filter_by(**filter_params))
+            if related:
+                stmt = stmt.options(*cls.validate_relationships(related))
+            count_query = None
+        else:
+            shape_key, stmt, count_query = cls._statement_shape_(filter_params, tuple(related), kwargs.get('where'))
+            params = {f'f_{k}': v for k, v in filter_params.items() if v is not None}
+
+        count = kwargs.get('count') or 'exact'
+        if count not in COUNT_STRATEGIES:
+            raise ValueError(f"Unsupported count strategy: {count}")
+        scope = cls._scope_columns_()
+        count_options = dict(
+            strategy=count,
+            key=(cls.__tablename__, tuple(sorted(filter_params.items(), key=str)), kwargs.get('count_key')),
+            tags=[f'{cls.__tablename__}:{k}={v}' for k, v in filter_params.items() if k in scope]
+                 or [f'{cls.__tablename__}:*'],
+            unfiltered=not filter_params and 'base_query' not in kwargs and not kwargs.get('where'),
+            params=params,
+            count_query=count_query,
+        )
+
+        result = await cls._paginate_objects_(stmt, offset, limit, order=order, cursor=kwargs.get('cursor'),
+                                              count=count_options, shape_key=shape_key, params=params)
+        print('[filter_by_]', result)
+        return result
 
-        if ordered:
-            stmt = stmt.order_by(*ordered)
+    @classmethod
+    def _statement_shape_(cls, filter_params: dict, related: tuple[str, ...] = (),
+                          where: Optional[tuple[Hashable, list]] = None) -> tuple[tuple, object, object]:
+        """
+        Готовий SELECT і count-запит до нього для набору фільтрів. Значення фільтрів - bindparam
+        `f_<поле>` (передаються при виконанні), тож один обʼєкт запиту обслуговує будь-які значення:
+        не перебудовуються select та selectinload, ключ SQLAlchemy compiled cache береться
+        з мемоізованого, а asyncpg бачить той самий SQL (prepared statement).
 
-        if related:
-            if isinstance(related, str):
-                relations = cls.validate_relationships([related, ])
-            elif isinstance(related, list):
-                relations = cls.validate_relationships(related)
-            else:
-                raise Exception(f"Unsupported type of related: {type(related)}")
-            stmt = stmt.options(*relations)
+        :param where: (ключ, умови) - умови без змінних значень, ключ розрізняє їх у кеші
+        :return: (ключ форми, запит, count-запит)
+        """
+        key = (cls, tuple(sorted((k, v is None) for k, v in filter_params.items())), related,
+               where[0] if where else None)
+        shape = statement_cache.get(key)
+        if shape is None:
+            query = select(cls).where(*[
+                getattr(cls, k).is_(None) if is_null else getattr(cls, k) == bindparam(f'f_{k}')
+                for k, is_null in key[1]
+            ])
+            if where:
+                query = query.where(*where[1])
+            if related:
+                query = query.options(*cls.validate_relationships(list(related)))
+            shape = (query, select(func.count()).select_from(query.subquery()))
+            statement_cache.set(key, shape)
+        return key, *shape
 
-        result = await cls._paginate_objects_(stmt, offset, limit)
-        print('[filter_by_]', result)
-        return result
+    @classmethod
+    @cache
+    def _scope_columns_(cls) -> frozenset[str]:
+        """ Колонки-зовнішні ключі: по них інвалідуються закешовані count-и """
+        return frozenset(c.name for c in cls.__table__.columns if c.foreign_keys)
 
     @classmethod
-    async def _paginate_objects_(cls, base_query, offset: int, limit: int) -> dict:
-        count_query = select(func.count()).select_from(base_query.subquery())
-        limited_query = base_query.limit(limit).offset(offset)
+    def _modified_columns_(cls) -> tuple:
+        """ Колонки часу зміни, що враховуються у валідаторах умовних GET (last_modified_) """
+        return (cls.updated_at,)
+
+    @classmethod
+    async def last_modified_(cls, **filters) -> tuple[Optional[datetime], int]:
+        """
+        Час останньої зміни рядків (max по _modified_columns_) і їх кількість з фільтрами по колонках -
+        валідатори для умовних GET. Кількість помічає те, чого max(updated_at) не бачить:
+        видалені рядки та рядки, що перейшли під інший фільтр (товар у іншій категорії).
+        Для швидкості потрібен індекс (<колонки фільтра>, updated_at).
+        Читається з primary: з репліки, що відстає, клієнт отримав би 304 на вже змінені дані.
+        """
+        columns = [func.max(column) for column in cls._modified_columns_()]
+        # greatest() пропускає NULL - колонки, яких у рядків ще немає (stats_at до першого перерахунку)
+        modified_column = columns[0] if len(columns) == 1 else func.greatest(*columns)
+        query = select(modified_column, func.count()).select_from(cls).filter_by(**filters)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            modified, total = result.one()
+        if modified is not None and modified.tzinfo is None:
+            modified = modified.replace(tzinfo=timezone.utc)
+        return modified, total
+
+    @classmethod
+    def invalidate_caches(cls, objects: list[dict]):
+        """ Скидає закешовані count-и та відповіді сторінок/API, на які могли вплинути додані/змінені обʼєкти """
+        scope = cls._scope_columns_()
+        tags = {f'{cls.__tablename__}:*'} | {
+            f'{cls.__tablename__}:{key}={obj[key]}'
+            for obj in objects for key in scope if obj.get(key) is not None
+        }
+
+        def invalidate():
+            count_cache.invalidate(*tags)
+            invalidate_responses(*tags)
+            if settings.CACHE_BROADCAST:
+                cache_broadcast.publish(tags)
+
+        # в межах unit of work зміни ще не зафіксовані - інакше кеш встиг би заповнитись старими даними
+        after_commit(invalidate)
+
+    @classmethod
+    async def _count_(cls, session: AsyncSession, base_query, strategy: str = 'exact', key: tuple = None,
+                      tags: list[str] = (), unfiltered: bool = False, params: Optional[dict] = None,
+                      count_query=None) -> Optional[int]:
+        """
+        Кількість рядків для пагінації:
+            exact    - SELECT count(*) FROM (<запит>);
+            cached   - exact, закешований по (таблиця, фільтри) до інвалідації при інжесті або TTL;
+            estimate - без фільтрів pg_class.reltuples, з фільтрами - оцінка планувальника (EXPLAIN);
+            none     - не рахувати (лише has_more).
+        `params` - значення bindparam запиту, `count_query` - готовий count-запит (_statement_shape_).
+        """
+        if strategy == 'none':
+            return None
+
+        if strategy == 'cached':
+            total = count_cache.get(key)
+            if total is None:
+                total = await cls._count_(session, base_query, params=params, count_query=count_query)
+                count_cache.set(key, total, tags=tags)
+            return total
+
+        if strategy == 'estimate':
+            if unfiltered:
+                result = await session.execute(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                    {"table": cls.__tablename__},
+                )
+                estimate = result.scalar()
+            else:
+                compiled = base_query.params(params or {}).compile(dialect=async_engine.dialect,
+                                                                   compile_kwargs={'literal_binds': True})
+                result = await session.execute(text(f'EXPLAIN (FORMAT JSON) {compiled}'))
+                plan = result.scalar()
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate is not None and estimate >= 0:  # -1: таблицю ще не аналізували
+                return estimate
+
+        if count_query is None:
+            count_query = select(func.count()).select_from(base_query.subquery())
+        result = await session.execute(count_query, params)
+        return result.scalar()
+
+    @classmethod
+    async def _paginate_objects_(cls, base_query, offset: int, limit: int,
+                                 order: Optional[list[tuple]] = None, cursor: Optional[str] = None,
+                                 count: Optional[dict] = None, shape_key: Optional[tuple] = None,
+                                 params: Optional[dict] = None) -> dict:
+        """
+        Без `cursor` - LIMIT/OFFSET. З `cursor` - keyset pagination: WHERE (ключ сортування) > (ключ
+        останнього рядка), тож будь-яка сторінка коштує як перша. Курсори next/prev повертаються
+        в обох режимах, якщо сортування задане полями моделі.
+        З `shape_key` (_statement_shape_) сторінковий запит теж кешується: LIMIT/OFFSET та значення
+        курсора передаються через bindparam разом з `params`.
+        """
+        order = order or cls._ordering_(None)
+        params = dict(params or {}, limit=limit + 1, offset=offset)  # +1 рядок - чи є ще сторінка далі
+
+        backwards = False
+        values = []
+        if cursor:
+            values, direction = decode_cursor(cursor)
+            if len(values) != len(order):
+                raise ValueError("Invalid cursor")
+            backwards = direction == 'prev'
+            params.update({f'k_{i}': value for i, value in enumerate(values) if value is not None})
+
+        key = None
+        if shape_key is not None:
+            order_key = tuple((item.key if isinstance(item, InstrumentedAttribute) else item, descending)
+                              for item, descending in order)
+            key = (shape_key, order_key, bool(cursor), backwards, tuple(value is None for value in values))
+        limited_query = statement_cache.get(key) if key is not None else None
+        if limited_query is None:
+            if cursor:
+                # попередня сторінка - ті ж рядки "після", але в зворотному порядку
+                order_ = [(item, not descending) for item, descending in order] if backwards else order
+                binds = [None if value is None else bindparam(f'k_{i}', type_=getattr(item, 'type', None))
+                         for i, ((item, _), value) in enumerate(zip(order_, values))]
+                limited_query = base_query.where(cls._keyset_after_(order_, binds))
+            else:
+                order_ = order
+                limited_query = base_query.offset(bindparam('offset', type_=Integer))
+            limited_query = (
+                limited_query
+                .order_by(*[desc(item) if descending else item for item, descending in order_])
+                .limit(bindparam('limit', type_=Integer))
+            )
+            if key is not None:
+                statement_cache.set(key, limited_query)
 
         # print(f'\ncount_query: {count_query.compile(compile_kwargs={'literal_binds': True})}\n\n'
         #       f'limited_query: {limited_query.compile(compile_kwargs={'literal_binds': True})}\n\n')
 
-        async with AsyncSessionLocal() as session:
+        async with AsyncSessionLocal.reader() as session:
             # Виконання запитів
-            total_items = await session.execute(count_query)
-            limited_objects = await session.execute(limited_query)
+            total_items = await cls._count_(session, base_query, **(count or {}))
+            limited_objects = await session.execute(limited_query, params)
 
-        total_items = total_items.scalar()
         limited_objects = limited_objects.unique()
         items = limited_objects.scalars().all()
-        total_pages = total_items // limit
+        has_more = len(items) > limit
+        items = items[:limit]
+        if backwards:
+            items.reverse()
+        total_pages = total_items // limit if total_items is not None else None
         page_ = offset // limit
 
-        return dict(page=page_, page_size=limit, total_items=total_items, total_pages=total_pages, items=items)
+        next_, prev_ = None, None
+        keys = [item.key for item, _ in order if isinstance(item, InstrumentedAttribute)]
+        if items and len(keys) == len(order):
+            if has_more or backwards:
+                next_ = encode_cursor([getattr(items[-1], key) for key in keys], 'next')
+            if (has_more if backwards else bool(cursor or offset)):
+                prev_ = encode_cursor([getattr(items[0], key) for key in keys], 'prev')
+
+        return dict(page=page_, page_size=limit, total_items=total_items, total_pages=total_pages, items=items,
+                    has_more=has_more if not backwards else True, next=next_, prev=prev_)
 
     @classmethod
     async def get_or_create_bulb(cls, objects_: list[dict[str, str | int]]) -> list:
@@ -296,6 +963,8 @@ class Base(DeclarativeBase):
             session.add_all(to_create)
             await session.commit()
             results_.extend(to_create)
+        if to_create:
+            cls.invalidate_caches(objects_)
         return results_
 
 
@@ -1,75 +1,390 @@
-from asyncio import sleep
+import asyncio
+import logging
+import re
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
 
+from elasticsearch import AsyncElasticsearch, BadRequestError
 from elasticsearch.helpers import async_bulk
+from sqlalchemy import DateTime, func, select, bindparam, delete, text
+from sqlalchemy.orm import Mapped, mapped_column
 
+from settings.cache import TTLCache
+from settings.config import settings
+from settings.database import Base, AsyncSessionLocal, async_engine
+from settings.metrics import es_request_duration, observe_reindex
+from settings.replicas import LAG_QUERY
 from shops.models import Product
 
+logger = logging.getLogger(__name__)
 
+# async callback(done, total) для звітування про хід індексації
+Progress = Callable[[int, int | None], Awaitable[None]]
 
+# Один клієнт (і один пул зʼєднань) на процес, створюється на старті застосунку
+es_client: AsyncElasticsearch | None = None
 
+# Кеш результатів пошуку по нормалізованому запиту: автокомпліт шле однакові запити на кожне натискання
+search_cache = TTLCache(maxsize=settings.SEARCH_CACHE_SIZE, ttl=settings.SEARCH_CACHE_TTL)
+SEARCH_FIELDS = ("id", "name", "last_price", "price_change", "category_id")
 
-async def create_index(es):
-    # es = AsyncElasticsearch("http://elasticsearch:9200")
 
-    exists = await es.indices.exists(index="products")
-    if not exists:
-        await es.indices.create(index="products", body={
-            "settings": {
-                "analysis": {
-                    "filter": {
-                        "autocomplete_filter": {
-                            "type": "edge_ngram",
-                            "min_gram": 1,
-                            "max_gram": 20
-                        }
-                    },
-                    "analyzer": {
-                        "autocomplete": {
-                            "type": "custom",
-                            "tokenizer": "standard",
-                            "filter": [
-                                "lowercase",
-                                "autocomplete_filter"
-                            ]
-                        }
-                    }
-                }
-            },
-            "mappings": {
-                "properties": {
-                    "name": {
-                        "type": "text",
-                        "analyzer": "autocomplete",
-                        "search_analyzer": "standard"
-                    },
-                    "last_price": {"type": "float"},
-                    "price_change": {"type": "float"},
-                    "category_id": {"type": "integer"},
-                }
+async def connect_es() -> AsyncElasticsearch:
+    global es_client
+    if es_client is None:
+        es_client = AsyncElasticsearch(
+            settings.ELASTIC_URL,
+            connections_per_node=settings.ES_CONNECTIONS_PER_NODE,
+            request_timeout=settings.ES_REQUEST_TIMEOUT,
+            retry_on_timeout=True,
+        )
+    return es_client
+
+
+async def close_es():
+    global es_client
+    if es_client is not None:
+        await es_client.close()
+        es_client = None
+
+
+def get_es() -> AsyncElasticsearch:
+    """ FastAPI dependency: спільний клієнт Elasticsearch """
+    if es_client is None:
+        raise RuntimeError("Elasticsearch client is not initialized")
+    return es_client
+
+
+class IndexWatermark(Base):
+    """ До якого моменту (updated_at товарів) індекс уже наповнений """
+    __tablename__ = "index_watermark"
+
+    name: Mapped[str] = mapped_column(unique=True)
+    watermark: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+# Поле для пошуку "по мірі набору": search_as_you_type сам будує shingle-підполя та
+# індекс префіксів (_index_prefix), тому не потрібен edge_ngram по всій назві
+SUGGEST_FIELD = "suggest"
+SUGGEST_MAPPING = {"type": "search_as_you_type", "max_shingle_size": 3}
+SUGGEST_SOURCE = ("id", "name", "last_price", "category_id")
+
+
+# Пошук і інкрементальна індексація йдуть через аліас, за яким стоїть одна з версій індексу
+# `products_vN`; повна переіндексація будує нову версію поруч і атомарно перемикає аліас
+INDEX_ALIAS = "products"
+INDEX_VERSION_RE = re.compile(rf'^{INDEX_ALIAS}_v(\d+)$')
+# Ключ advisory lock: одна перебудова індексу на всі процеси (застосунок, воркери задач)
+REBUILD_LOCK_ID = zlib.crc32(f'rebuild_index:{INDEX_ALIAS}'.encode())
+
+
+def index_body() -> dict:
+    return {
+        "settings": {
+            "number_of_replicas": settings.ES_REPLICAS,
+        },
+        "mappings": {
+            "properties": {
+                "name": {"type": "text"},
+                SUGGEST_FIELD: SUGGEST_MAPPING,
+                "last_price": {"type": "float"},
+                "price_change": {"type": "float"},
+                "category_id": {"type": "integer"},
             }
+        },
+    }
+
+
+async def index_versions(es) -> dict[str, int]:
+    """ Фізичні індекси `products_vN` -> N """
+    indices = await es.indices.get(index=f"{INDEX_ALIAS}_v*", allow_no_indices=True, expand_wildcards="open")
+    return {name: int(match[1]) for name in indices if (match := INDEX_VERSION_RE.match(name))}
+
+
+async def create_index(es) -> bool:
+    """
+    Створює першу версію індексу за аліасом, якщо його ще немає.
+    :return: True, якщо потрібна повна переіндексація (старий індекс без аліасу)
+    """
+    if await es.indices.exists_alias(name=INDEX_ALIAS):
+        return False
+
+    if await es.indices.exists(index=INDEX_ALIAS):
+        # Індекс `products` зі старою схемою: обслуговує пошук, доки rebuild_index не замінить його аліасом
+        logger.warning(f'[create_index] "{INDEX_ALIAS}" is not an alias, full reindex required')
+        return True
+
+    versions = await index_versions(es)
+    if versions:
+        # аліас втрачено, але версії індексу є - повертаємо його на останню
+        await es.indices.put_alias(index=max(versions, key=versions.get), name=INDEX_ALIAS)
+        return False
+
+    try:
+        await es.indices.create(index=f"{INDEX_ALIAS}_v1", aliases={INDEX_ALIAS: {}}, **index_body())
+    except BadRequestError as e:
+        # інший процес створив індекс одночасно з нами
+        if e.error != "resource_already_exists_exception":
+            raise
+        return False
+    await reset_watermark(INDEX_ALIAS)
+    return False
+
+
+async def rebuild_index(es, progress: Progress | None = None) -> dict:
+    """
+    Blue/green переіндексація:
+        1. нова версія `products_vN+1` без реплік і з вимкненим refresh;
+        2. повне завантаження товарів з БД;
+        3. повернення налаштувань (репліки, refresh), refresh;
+        4. перевірка: кількість документів = кількість проіндексованих, помилок немає;
+        5. атомарне перемикання аліасу, видалення старих версій (крім ES_KEEP_INDICES останніх).
+    Якщо перевірка не пройдена - нова версія видаляється, аліас не змінюється.
+    Перебудова, запущена під час іншої (в будь-якому процесі), пропускається: skipped=True.
+    """
+    async with async_engine.connect() as lock:
+        # сесійний advisory lock: тримається до unlock або до закриття зʼєднання, якщо процес впаде
+        if not (await lock.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": REBUILD_LOCK_ID})).scalar():
+            logger.warning('[rebuild_index] another rebuild is in progress, skipped')
+            return dict(indexed=0, failed=0, swapped=False, skipped=True)
+        try:
+            return await _rebuild_index(es, progress)
+        finally:
+            await lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": REBUILD_LOCK_ID})
+
+
+async def _rebuild_index(es, progress: Progress | None = None) -> dict:
+    versions = await index_versions(es)
+    name = f"{INDEX_ALIAS}_v{max(versions.values(), default=0) + 1}"
+    body = index_body()
+    body["settings"].update(number_of_replicas=0, refresh_interval="-1")
+    await es.indices.create(index=name, **body)
+
+    try:
+        report = await index_products(es, full=True, index=name, save_watermark=False,
+                                      progress=progress)
+        await es.indices.put_settings(index=name, settings={
+            "number_of_replicas": settings.ES_REPLICAS,
+            "refresh_interval": None,  # значення за замовчуванням
         })
+        await es.indices.refresh(index=name)
+        count = (await es.count(index=name))["count"]
+    except Exception:
+        await es.indices.delete(index=name, ignore_unavailable=True)
+        raise
 
-BATCH_SIZE = 100
-
-async def index_products_from_db(es):
-    products = await Product.get_all_async()
-    print(f"I have {len(products)} products")
-    for i in range(0, len(products), BATCH_SIZE):
-        batch = products[i:i + BATCH_SIZE]
-        actions = [
-            {
-                "_index": "products",
-                "_id": product.id,
-                "_source": {
-                    "id": product.id,
-                    "name": product.name,
-                    "last_price": product.last_price,
-                    "price_change": product.price_change,
-                },
-            }
-            for product in batch
-        ]
+    report.update(index=name, count=count, swapped=False)
+    if report["failed"] or count != report["indexed"]:
+        await es.indices.delete(index=name, ignore_unavailable=True)
+        logger.error(f'[rebuild_index] verification failed, alias not changed: {report}')
+        return report
+
+    current = await es.indices.get_alias(name=INDEX_ALIAS, ignore_unavailable=True) \
+        if await es.indices.exists_alias(name=INDEX_ALIAS) else {}
+    actions = [{"remove": {"index": index, "alias": INDEX_ALIAS}} for index in current]
+    if not current and await es.indices.exists(index=INDEX_ALIAS):
+        # старий індекс без аліасу видаляється в тій самій атомарній операції
+        actions.append({"remove_index": {"index": INDEX_ALIAS}})
+    actions.append({"add": {"index": name, "alias": INDEX_ALIAS}})
+    await es.indices.update_aliases(actions=actions)
+    # зміни, що прийшли під час завантаження, підхопить наступна інкрементальна індексація
+    await set_watermark(INDEX_ALIAS, report["watermark"])
+    search_cache.clear()
+    report["swapped"] = True
+
+    versions[name] = max(versions.values(), default=0) + 1
+    for old in sorted(versions, key=versions.get)[:-(settings.ES_KEEP_INDICES + 1)]:
+        await es.indices.delete(index=old, ignore_unavailable=True)
+    logger.info(f'[rebuild_index] {report}')
+    return report
+
+
+async def get_watermark(name: str) -> datetime | None:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(IndexWatermark.watermark).where(IndexWatermark.name == name))
+        return result.scalar()
+
+
+async def set_watermark(name: str, watermark: datetime):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(IndexWatermark).where(IndexWatermark.name == name))
+        instance = result.scalar() or IndexWatermark(name=name)
+        instance.watermark = watermark
+        session.add(instance)
+        await session.commit()
+
+
+async def reset_watermark(name: str):
+    """ Наступна індексація буде повною """
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(IndexWatermark).where(IndexWatermark.name == name))
+        await session.commit()
+
+
+async def index_products(es, full: bool = False, index: str = INDEX_ALIAS,
+                         batch_size: int = settings.ES_BATCH_SIZE,
+                         max_in_flight: int = settings.ES_MAX_IN_FLIGHT,
+                         save_watermark: bool = True,
+                         progress: Progress | None = None) -> dict:
+    """
+    Потокова індексація товарів в Elasticsearch.
+
+    Товари читаються серверним курсором пачками по `batch_size` (без ORM-обʼєктів і без
+    завантаження всієї таблиці в памʼять), пачки відправляються bulk-запитами, одночасно
+    не більше `max_in_flight`. Без `full` індексуються лише товари з updated_at новішим за
+    збережений watermark; watermark зсувається тільки якщо всі документи проіндексовані.
+
+    :param progress: async callback(done, total), викликається після кожної пачки
+    :return: dict(indexed=..., failed=..., seconds=..., docs_per_sec=..., watermark=...)
+    """
+    started = time.monotonic()
+    watermark = None if full else await get_watermark(index)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+    stats = dict(indexed=0, failed=0)
+
+    async def send(actions: list[dict]):
+        try:
+            with es_request_duration.time(operation='bulk'):
+                success, errors = await async_bulk(es, actions, chunk_size=len(actions),
+                                                   raise_on_error=False, raise_on_exception=False)
+            stats['indexed'] += success
+            stats['failed'] += len(errors)
+            for error in errors[:3]:
+                logger.warning(f'[index_products] failed: {error}')
+        except Exception as e:
+            stats['failed'] += len(actions)
+            logger.exception(f'[index_products] bulk request failed: {e}')
+        finally:
+            semaphore.release()
+
+    stmt = select(Product.id, Product.name, Product.last_price, Product.price_change, Product.category_id)
+    if watermark is not None:
+        stmt = stmt.where(Product.updated_at > bindparam('watermark', watermark, type_=DateTime(timezone=True)))
+
+    # новий watermark - час початку читання за годинником primary (той самий, що пише updated_at):
+    # зміни, що прийдуть під час індексації, підхопить наступний запуск
+    async with AsyncSessionLocal() as session:
+        read_started = (await session.execute(select(func.now()))).scalar()
+
+    async with AsyncSessionLocal.reader() as session:
+        # updated_at - час початку транзакції запису, тож транзакція, що почалась до читання, а закомітилась
+        # після, отримує updated_at менший за цей час: watermark зсувається назад на ES_WATERMARK_SAFETY_SECONDS,
+        # а на репліці - ще й на її відставання (коміти primary, яких вона ще не програла).
+        # Повторно проіндексовані в цьому вікні товари просто перезаписуються за _id
+        lag = (await session.execute(LAG_QUERY)).scalar() or 0
+        new_watermark = read_started - timedelta(seconds=settings.ES_WATERMARK_SAFETY_SECONDS + float(lag))
+        total = None
+        if progress is not None:
+            total = (await session.execute(select(func.count()).select_from(stmt.subquery()))).scalar()
+        result = await session.stream(stmt.execution_options(yield_per=batch_size))
+        async for rows in result.partitions(batch_size):
+            actions = [
+                {
+                    "_index": index,
+                    "_id": row.id,
+                    "_source": {
+                        "id": row.id,
+                        "name": row.name,
+                        SUGGEST_FIELD: row.name,
+                        "last_price": row.last_price,
+                        "price_change": row.price_change,
+                        "category_id": row.category_id,
+                    },
+                }
+                for row in rows
+            ]
+            await semaphore.acquire()
+            task = asyncio.create_task(send(actions))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if progress is not None:
+                await progress(stats['indexed'] + stats['failed'], total)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    if progress is not None:
+        await progress(stats['indexed'] + stats['failed'], total)
+
+    if not stats['failed'] and save_watermark:
+        await set_watermark(index, new_watermark)
+    search_cache.clear()
+
+    seconds = time.monotonic() - started
+    report = dict(
+        **stats,
+        seconds=round(seconds, 3),
+        docs_per_sec=round(stats['indexed'] / seconds, 1) if seconds else 0.0,
+        watermark=new_watermark if not stats['failed'] else watermark,
+        full=full,
+    )
+    logger.info(f'[index_products] {report}')
+    observe_reindex('elastic', report)
+    return report
+
+
+async def search_products(es, q: str, size: int = 20, from_: int = 0,
+                          fields: tuple[str, ...] = SEARCH_FIELDS) -> list[dict]:
+    """
+    Пошук товарів за назвою. Результат кешується на SEARCH_CACHE_TTL секунд по нормалізованому
+    запиту (регістр і зайві пробіли не враховуються), повертаються лише поля `fields`.
+    """
+    query = " ".join(q.lower().split())
+    key = (query, size, from_, fields)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with es_request_duration.time(operation='search'):
+        res = await es.search(
+            index=INDEX_ALIAS,
+            size=size,
+            from_=from_,
+            source=list(fields),
+            sort=['last_price:desc', ],
+            track_total_hits=False,
+            query=_prefix_query(query),
+        )
+    hits = [hit["_source"] for hit in res["hits"]["hits"]]
+    search_cache.set(key, hits)
+    return hits
+
+
+def _prefix_query(query: str) -> dict:
+    """ Всі слова запиту мають бути в назві, останнє - як префікс """
+    return {
+        "multi_match": {
+            "query": query,
+            "type": "bool_prefix",
+            "operator": "and",
+            "fields": [SUGGEST_FIELD, f"{SUGGEST_FIELD}._2gram", f"{SUGGEST_FIELD}._3gram"],
+        }
+    }
+
+
+async def suggest_products(es, q: str, size: int = settings.SUGGEST_SIZE) -> list[dict]:
+    """
+    Підказки для поля пошуку: top `size` товарів за релевантністю, лише id, name, last_price,
+    category_id. Без сортування, підрахунку total та зайвих полів відповіді (filter_path),
+    повторні запити віддаються з кешу.
+    """
+    query = " ".join(q.lower().split())
+    key = ("suggest", query, size)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
 
-        await async_bulk(es, actions)
-        print(f'Updated {i} products')
-        await sleep(0.5)
+    with es_request_duration.time(operation='suggest'):
+        res = await es.search(
+            index=INDEX_ALIAS,
+            size=size,
+            source=list(SUGGEST_SOURCE),
+            track_total_hits=False,
+            filter_path=["hits.hits._source"],
+            query=_prefix_query(query),
+        )
+    hits = [hit["_source"] for hit in res.get("hits", {}).get("hits", [])]
+    search_cache.set(key, hits)
+    return hits
@@ -0,0 +1,320 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import Match
+
+from settings.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Значення міток, що не вмістились у METRICS_MAX_SERIES, та запити без маршруту
+OVERFLOW = '__other__'
+UNMATCHED = '__unmatched__'
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+BATCH_BUCKETS = (1, 10, 100, 500, 1000, 5000, 10_000, 50_000, 100_000, 1_000_000)
+JOB_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    Метрика з фіксованим набором міток. Кількість рядів (комбінацій значень міток) обмежена
+    `max_series`: нові комбінації понад ліміт зливаються в один ряд зі значеннями OVERFLOW,
+    тож неочікувані значення міток не роздувають памʼять і відповідь /metrics.
+    """
+    kind: str
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 max_series: int = settings.METRICS_MAX_SERIES):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labels
+        self.max_series = max_series
+        self.series: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        if key not in self.series and len(self.series) >= self.max_series:
+            return (OVERFLOW,) * len(self.labelnames)
+        return key
+
+    @abstractmethod
+    def samples(self) -> Iterable[tuple[str, tuple, tuple, float]]:
+        """ (суфікс імені, імена міток, значення міток, значення) """
+
+    def render(self) -> list[str]:
+        # у форматі 0.0.4 HELP/TYPE лічильника вказуються для імені з _total, як і в його рядах
+        family = f'{self.name}_total' if self.kind == 'counter' else self.name
+        lines = [f'# HELP {family} {self.documentation}', f'# TYPE {family} {self.kind}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.series.items():
+            yield '_total', self.labelnames, key, value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        self.series[self._key(labels)] = value
+
+    def samples(self):
+        for key, value in self.series.items():
+            yield '', self.labelnames, key, value
+
+
+class Histogram(Metric):
+    """ Гістограма з фіксованими межами кошиків; ряд - [лічильники кошиків..., сума, кількість] """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(name, documentation, labels, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        names = self.labelnames + ('le',)
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield '_bucket', names, key + (_format_value(bound),), cumulative
+            yield '_bucket', names, key + ('+Inf',), series[-1]
+            yield '_sum', self.labelnames, key, series[-2]
+            yield '_count', self.labelnames, key, series[-1]
+
+
+class CallbackMetric(Metric):
+    """ Значення читаються під час scrape з `collect()` -> [(мітки, значення)] (стан пулу, черги тощо) """
+
+    def __init__(self, name: str, documentation: str, kind: str, collect: Callable[[], Iterable[tuple[dict, float]]],
+                 labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self):
+        suffix = '_total' if self.kind == 'counter' else ''
+        for labels, value in self.collect():
+            if value is not None:
+                yield suffix, self.labelnames, tuple(str(labels.get(name, '')) for name in self.labelnames), value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets=buckets))
+
+    def callback(self, name: str, documentation: str, collect: Callable[[], Iterable[tuple[dict, float]]],
+                 kind: str = 'gauge', labels: tuple[str, ...] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, collect, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.warning(f'[metrics] {metric.name} failed: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# HTTP
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template',
+    ('method', 'route', 'status'))
+# БД
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds', 'Duration of a single SQL statement', ('role',), buckets=QUERY_BUCKETS)
+db_queries_per_request = registry.histogram(
+    'db_queries_per_request', 'SQL statements executed per HTTP request', ('route',), buckets=COUNT_BUCKETS)
+db_query_seconds_per_request = registry.histogram(
+    'db_query_seconds_per_request', 'Total SQL time per HTTP request', ('route',), buckets=LATENCY_BUCKETS)
+# Пошук
+es_request_duration = registry.histogram(
+    'es_request_duration_seconds', 'Elasticsearch request latency', ('operation',))
+search_reindex_docs = registry.counter(
+    'search_reindex_docs', 'Documents indexed by reindex runs', ('backend', 'mode'))
+search_reindex_duration = registry.histogram(
+    'search_reindex_duration_seconds', 'Reindex run duration', ('backend', 'mode'), buckets=JOB_BUCKETS)
+search_reindex_docs_per_second = registry.gauge(
+    'search_reindex_docs_per_second', 'Throughput of the last reindex run', ('backend', 'mode'))
+# Інжест
+ingest_batch_size = registry.histogram(
+    'ingest_batch_size', 'Products per ingest write', ('path',), buckets=BATCH_BUCKETS)
+ingest_rows = registry.counter(
+    'ingest_rows', 'Products written by ingest, by outcome', ('path', 'result'))
+ingest_batch_duration = registry.histogram(
+    'ingest_batch_duration_seconds', 'Duration of an ingest write', ('path',), buckets=LATENCY_BUCKETS + (30, 60))
+
+# [кількість запитів, сумарний час] SQL поточного HTTP-запиту
+_request_queries: ContextVar[list | None] = ContextVar('request_queries', default=None)
+
+
+def observe_ingest(path: str, size: int, seconds: float, report: dict):
+    """ Пачка інжесту: розмір, тривалість і скільки товарів додано / змінено / без змін """
+    ingest_batch_size.observe(size, path=path)
+    ingest_batch_duration.observe(seconds, path=path)
+    for result in ('inserted', 'updated', 'unchanged'):
+        if report.get(result):
+            ingest_rows.inc(report[result], path=path, result=result)
+
+
+def observe_reindex(backend: str, report: dict):
+    mode = 'full' if report.get('full') else 'incremental'
+    search_reindex_docs.inc(report.get('indexed', 0), backend=backend, mode=mode)
+    search_reindex_duration.observe(report.get('seconds', 0.0), backend=backend, mode=mode)
+    search_reindex_docs_per_second.set(report.get('docs_per_sec', 0.0), backend=backend, mode=mode)
+
+
+def instrument_engine(engine: AsyncEngine, role: str):
+    """ Тривалість кожного SQL-запиту двигуна та лічильники запитів поточного HTTP-запиту """
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        db_query_duration.observe(seconds, role=role)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += seconds
+
+
+_route_templates: dict[int, tuple[int, dict]] = {}
+
+
+def route_label(scope) -> str:
+    """ Шаблон шляху маршруту (/api/{item_id}), а не сам шлях - мітка з обмеженою кількістю значень """
+    app, endpoint = scope.get('app'), scope.get('endpoint')
+    routes = getattr(getattr(app, 'router', None), 'routes', None)
+    if routes is None:
+        return UNMATCHED
+    if endpoint is None:
+        # відповідь з кешу або 304 - маршрутизація не виконувалась
+        for route in routes:
+            if route.matches(scope)[0] != Match.NONE:
+                return route.path
+        return UNMATCHED
+    cached = _route_templates.get(id(app))
+    if cached is None or cached[0] != len(routes):
+        # Route - endpoint, Mount - застосунок, що обслуговує весь префікс
+        templates = {getattr(route, 'endpoint', None) or route.app: route.path for route in routes
+                     if hasattr(route, 'path')}
+        cached = _route_templates[id(app)] = (len(routes), templates)
+    return cached[1].get(endpoint, UNMATCHED)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware (зовнішній шар): латентність кожного HTTP-запиту за (метод, шаблон маршруту,
+    клас статусу), включно з відповідями з кешу та 304, і кількість/час SQL-запитів на HTTP-запит.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = [500]
+        token = _request_queries.set([0, 0.0])
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            queries, query_seconds = _request_queries.get()
+            _request_queries.reset(token)
+            route = route_label(scope)
+            method = scope['method'] if scope['method'] in METHODS else 'OTHER'
+            http_request_duration.observe(time.perf_counter() - started, method=method, route=route,
+                                          status=f'{status[0] // 100}xx')
+            db_queries_per_request.observe(queries, route=route)
+            db_query_seconds_per_request.observe(query_seconds, route=route)
@@ -0,0 +1,225 @@
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Міграції, які не може виконати `Base.metadata.create_all` (нові колонки та індекси
+# на вже існуючих таблицях, перенесення даних). Кожна міграція виконується один раз
+# в окремій транзакції, назви застосованих зберігаються в таблиці `schema_migrations`.
+# На новій БД create_all вже створює актуальну схему, тому SQL має бути ідемпотентним.
+MIGRATIONS: list[tuple[str, list[str]]] = [
+    (
+        "0001_product_url_unique",
+        [
+            # Дублікати url зливаємо в найстаріший товар: він отримує поточний стан останнього оновленого
+            # дубліката, ціни всіх дублікатів переносяться на нього, і лише потім зайві товари видаляються
+            """
+            UPDATE product keep
+            SET name = latest.name, img_src = latest.img_src, packaging = latest.packaging,
+                in_stock = latest.in_stock, category_id = latest.category_id, last_price = latest.last_price,
+                price_change = latest.price_change, updated_at = latest.updated_at
+            FROM (
+                SELECT DISTINCT ON (url) url, min(id) OVER (PARTITION BY url) AS keep_id,
+                       name, img_src, packaging, in_stock, category_id, last_price, price_change, updated_at
+                FROM product
+                WHERE url IS NOT NULL
+                ORDER BY url, updated_at DESC NULLS LAST, id DESC
+            ) latest
+            WHERE keep.id = latest.keep_id
+            """,
+            """
+            WITH dup AS (
+                SELECT id, min(id) OVER (PARTITION BY url) AS keep_id
+                FROM product
+                WHERE url IS NOT NULL
+            )
+            UPDATE price SET product_id = dup.keep_id
+            FROM dup
+            WHERE price.product_id = dup.id AND dup.id <> dup.keep_id
+            """,
+            """
+            DELETE FROM product p
+            USING product keep
+            WHERE p.url = keep.url AND p.id > keep.id
+              AND NOT EXISTS (SELECT 1 FROM price WHERE price.product_id = p.id)
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_product_url ON product (url)",
+        ],
+    ),
+    (
+        "0002_price_date",
+        [
+            "ALTER TABLE price ADD COLUMN IF NOT EXISTS price_date DATE",
+            "UPDATE price SET price_date = created_at::date WHERE price_date IS NULL",
+            # Якщо за день встигло записатись кілька цін - залишаємо останню
+            """
+            DELETE FROM price p
+            USING price newer
+            WHERE p.product_id = newer.product_id AND p.price_date = newer.price_date AND p.id < newer.id
+            """,
+            "ALTER TABLE price ALTER COLUMN price_date SET DEFAULT CURRENT_DATE",
+            "ALTER TABLE price ALTER COLUMN price_date SET NOT NULL",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_price_product_date ON price (product_id, price_date)",
+        ],
+    ),
+    (
+        "0003_price_partitioned",
+        [
+            # Переносимо звичайну таблицю price у секціоновану по місяцях (PARTITION BY RANGE (price_date)).
+            # Секції для вже наявної історії створюються тут, наступні - MonthlyPartitionManager.
+            """
+            DO $$
+            DECLARE
+                month date;
+            BEGIN
+                IF (SELECT relkind FROM pg_class WHERE oid = 'price'::regclass) = 'p' THEN
+                    RETURN;
+                END IF;
+
+                ALTER TABLE price RENAME TO price_unpartitioned;
+                ALTER TABLE price_unpartitioned RENAME CONSTRAINT price_pkey TO price_unpartitioned_pkey;
+                ALTER INDEX uq_price_product_date RENAME TO uq_price_unpartitioned_product_date;
+
+                CREATE TABLE price (LIKE price_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (price_date);
+                ALTER SEQUENCE price_id_seq OWNED BY price.id;
+                ALTER TABLE price ADD PRIMARY KEY (id, price_date);
+                CREATE UNIQUE INDEX uq_price_product_date ON price (product_id, price_date);
+                ALTER TABLE price ADD CONSTRAINT price_product_id_fkey
+                    FOREIGN KEY (product_id) REFERENCES product (id) ON DELETE CASCADE;
+
+                FOR month IN
+                    SELECT generate_series(lo, hi, interval '1 month')::date
+                    FROM (
+                        SELECT date_trunc('month', min(price_date)) AS lo, date_trunc('month', max(price_date)) AS hi
+                        FROM price_unpartitioned
+                    ) bounds
+                LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF price FOR VALUES FROM (%L) TO (%L)',
+                        'price_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+                        month,
+                        (month + interval '1 month')::date
+                    );
+                END LOOP;
+
+                INSERT INTO price SELECT * FROM price_unpartitioned;
+                DROP TABLE price_unpartitioned;
+            END $$
+            """,
+        ],
+    ),
+    (
+        "0004_price_rollups_backfill",
+        [
+            # Таблиці агрегатів створює create_all, тут - заповнення з наявної історії цін
+            """
+            INSERT INTO price_weekly (product_id, period_start, open_price, close_price, min_price, max_price,
+                                      sum_price, prices_count, first_date, last_date)
+            SELECT product_id,
+                   date_trunc('week', price_date)::date,
+                   (array_agg(price ORDER BY price_date))[1],
+                   (array_agg(price ORDER BY price_date DESC))[1],
+                   min(price), max(price), sum(price), count(*), min(price_date), max(price_date)
+            FROM price
+            GROUP BY product_id, date_trunc('week', price_date)::date
+            ON CONFLICT (product_id, period_start) DO NOTHING
+            """,
+            """
+            INSERT INTO price_monthly (product_id, period_start, open_price, close_price, min_price, max_price,
+                                       sum_price, prices_count, first_date, last_date)
+            SELECT product_id,
+                   date_trunc('month', price_date)::date,
+                   (array_agg(price ORDER BY price_date))[1],
+                   (array_agg(price ORDER BY price_date DESC))[1],
+                   min(price), max(price), sum(price), count(*), min(price_date), max(price_date)
+            FROM price
+            GROUP BY product_id, date_trunc('month', price_date)::date
+            ON CONFLICT (product_id, period_start) DO NOTHING
+            """,
+        ],
+    ),
+    (
+        "0005_updated_at_indexes",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_product_category_updated_at ON product (category_id, updated_at)",
+            "CREATE INDEX IF NOT EXISTS ix_product_updated_at ON product (updated_at)",
+            "CREATE INDEX IF NOT EXISTS ix_category_shop_updated_at ON category (shop_id, updated_at)",
+        ],
+    ),
+    (
+        "0006_product_stats",
+        [
+            # значення рахує Product.update_stats з наступними пачками інжесту або задача product_stats
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS avg_price_30d DOUBLE PRECISION",
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS below_avg_pct DOUBLE PRECISION NOT NULL DEFAULT 0",
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS historic_low DOUBLE PRECISION",
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS above_low_pct DOUBLE PRECISION NOT NULL DEFAULT 0",
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS volatility DOUBLE PRECISION NOT NULL DEFAULT 0",
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS sparkline SMALLINT[]",
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS stats_at TIMESTAMPTZ",
+            "CREATE INDEX IF NOT EXISTS ix_product_category_below_avg ON product (category_id, below_avg_pct)",
+            "CREATE INDEX IF NOT EXISTS ix_product_category_above_low ON product (category_id, above_low_pct)",
+            "CREATE INDEX IF NOT EXISTS ix_product_category_volatility ON product (category_id, volatility)",
+        ],
+    ),
+    (
+        "0007_price_mover_backfill",
+        [
+            # Таблицю лідербордів створює create_all, тут - заповнення з поточних змін цін (як PriceMover._movers_)
+            """
+            INSERT INTO price_mover (product_id, shop_id, category_id, last_price, price_change, change_pct)
+            SELECT p.id, c.shop_id, p.category_id, p.last_price, p.price_change,
+                   round((p.price_change / (p.last_price - p.price_change) * 100)::numeric, 2)
+            FROM product p
+            JOIN category c ON c.id = p.category_id
+            WHERE p.price_change <> 0 AND p.last_price > 0 AND p.last_price - p.price_change > 0
+            ON CONFLICT (product_id) DO NOTHING
+            """,
+        ],
+    ),
+    (
+        "0008_above_low_nullable",
+        [
+            # нульова ціна (ціни немає) давала historic_low = 0 і above_low_pct = 0 - "на мінімумі"
+            "ALTER TABLE product ALTER COLUMN above_low_pct DROP NOT NULL",
+            "ALTER TABLE product ALTER COLUMN above_low_pct DROP DEFAULT",
+            "UPDATE product SET historic_low = NULL, above_low_pct = NULL WHERE historic_low <= 0",
+            """
+            UPDATE product SET above_low_pct = NULL
+            WHERE above_low_pct IS NOT NULL AND (historic_low IS NULL OR coalesce(last_price, 0) <= 0)
+            """,
+        ],
+    ),
+    (
+        "0009_price_mover_updated_at_index",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_price_mover_updated_at ON price_mover (updated_at)",
+        ],
+    ),
+]
+
+
+# Ключ advisory lock, щоб кілька воркерів не застосовували міграції одночасно
+MIGRATIONS_LOCK_ID = 7_300_001
+
+
+async def run_migrations(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_ID})
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+
+    for name, statements in MIGRATIONS:
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_ID})
+            applied = await conn.execute(text("SELECT 1 FROM schema_migrations WHERE name = :name"), {"name": name})
+            if applied.scalar():
+                continue
+            for statement in statements:
+                await conn.execute(text(statement))
+            await conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        logger.info(f'migration applied: {name}')
@@ -1,3 +1,6 @@
+import base64
+import json
+from datetime import datetime, date
 from typing import List, Generic, TypeVar
 from pydantic import BaseModel
 
@@ -7,6 +10,48 @@ class PaginatedResponse(BaseModel, Generic[T]):
     title: str | None = None
     page: int
     page_size: int
-    total_items: int
-    total_pages: int
+    total_items: int | None = None  # None, якщо count не рахувався (count=none)
+    total_pages: int | None = None
     items: List[T]
+    has_more: bool | None = None
+    next: str | None = None  # курсор наступної сторінки (keyset pagination)
+    prev: str | None = None  # курсор попередньої сторінки
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "$dt" in value:
+            return datetime.fromisoformat(value["$dt"])
+        if "$d" in value:
+            return date.fromisoformat(value["$d"])
+        raise ValueError("Invalid cursor")
+    return value
+
+
+def encode_cursor(values: list, direction: str) -> str:
+    """
+    Непрозорий курсор: значення ключа сортування (останнім завжди id) першого/останнього
+    рядка сторінки та напрямок - `next` (рядки після) чи `prev` (рядки перед).
+    """
+    payload = json.dumps({"k": [_encode_value(i) for i in values], "d": direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[list, str]:
+    """ :return: (значення ключа сортування, напрямок) """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values, direction = [_decode_value(i) for i in payload["k"]], payload["d"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if direction not in ('next', 'prev'):
+        raise ValueError("Invalid cursor")
+    return values, direction
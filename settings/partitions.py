@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import re
+import zlib
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(day: date, shift: int = 0) -> date:
+    """ Перше число місяця, зсунутого на `shift` місяців від `day` """
+    month = day.year * 12 + day.month - 1 + shift
+    return date(month // 12, month % 12 + 1, 1)
+
+
+class MonthlyPartitionManager:
+    """
+    Обслуговує таблицю, розбиту `PARTITION BY RANGE (<date column>)` на місячні секції:
+    створює секції наперед і відʼєднує (detach) або видаляє (drop) ті, що вийшли за термін зберігання.
+
+    Секції називаються `<table>_yYYYYmMM`, для рядків поза діапазоном є `<table>_default`.
+    Рядки, що потрапили в default до створення секції їх місяця, переносяться в нову секцію.
+    """
+
+    def __init__(self, table: str, column: str, months_ahead: int = 3, retention_months: int = 0,
+                 expired: str = 'detach'):
+        if expired not in ('detach', 'drop'):
+            raise ValueError(f"Unsupported expired partitions action: {expired}")
+        self.table = table
+        self.column = column
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months  # 0 - зберігати назавжди
+        self.expired = expired
+        self.name_re = re.compile(rf'^{table}_y(\d{{4}})m(\d{{2}})$')
+        self.lock_id = zlib.crc32(f'partitions:{table}'.encode())
+        self.task: asyncio.Task | None = None
+
+    def partition_name(self, month: date) -> str:
+        return f'{self.table}_y{month.year:04d}m{month.month:02d}'
+
+    def create_sql(self, month: date) -> str:
+        return (
+            f'CREATE TABLE IF NOT EXISTS {self.partition_name(month)} PARTITION OF {self.table} '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{month_start(month, 1).isoformat()}')"
+        )
+
+    async def create_partition(self, conn, month: date, has_default: bool):
+        """
+        Створює секцію місяця. Postgres не дає створити секцію, якщо рядки її діапазону вже лежать
+        у default, тому default на час створення відʼєднується, а ці рядки переносяться в нову секцію.
+        """
+        default = f'{self.table}_default'
+        bounds = {"lo": month, "hi": month_start(month, 1)}
+        in_month = f'{self.column} >= :lo AND {self.column} < :hi'
+        if not has_default or not (await conn.execute(
+                text(f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_month})'), bounds)).scalar():
+            await conn.execute(text(self.create_sql(month)))
+            return
+
+        await conn.execute(text(f'ALTER TABLE {self.table} DETACH PARTITION {default}'))
+        await conn.execute(text(self.create_sql(month)))
+        moved = await conn.execute(text(
+            f'WITH moved AS (DELETE FROM {default} WHERE {in_month} RETURNING *) '
+            f'INSERT INTO {self.table} SELECT * FROM moved'
+        ), bounds)
+        await conn.execute(text(f'ALTER TABLE {self.table} ATTACH PARTITION {default} DEFAULT'))
+        logger.warning(f'[{self.table} partitions] moved {moved.rowcount} rows from {default} '
+                       f'to {self.partition_name(month)}')
+
+    async def partitions(self, conn) -> list[str]:
+        result = await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ), {"table": self.table})
+        return result.scalars().all()
+
+    async def maintain(self, engine: AsyncEngine, today: date | None = None) -> dict:
+        """
+        Створює секції з поточного місяця на `months_ahead` вперед та обробляє прострочені.
+        :return: dict(created=[...], expired=[...])
+        """
+        today = today or date.today()
+        created, expired = [], []
+
+        async with engine.begin() as conn:
+            # Кілька воркерів можуть запустити обслуговування одночасно
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": self.lock_id})
+            existing = set(await self.partitions(conn))
+
+            has_default = f'{self.table}_default' in existing
+            for shift in range(self.months_ahead + 1):
+                month = month_start(today, shift)
+                if self.partition_name(month) not in existing:
+                    await self.create_partition(conn, month, has_default)
+                    created.append(self.partition_name(month))
+
+            if not has_default:
+                await conn.execute(text(f'CREATE TABLE IF NOT EXISTS {self.table}_default PARTITION OF {self.table} DEFAULT'))
+
+            if self.retention_months:
+                cutoff = month_start(today, -self.retention_months)
+                for name in sorted(existing):
+                    match = self.name_re.match(name)
+                    if not match or date(int(match[1]), int(match[2]), 1) >= cutoff:
+                        continue
+                    if self.expired == 'drop':
+                        await conn.execute(text(f'DROP TABLE {name}'))
+                    else:
+                        await conn.execute(text(f'ALTER TABLE {self.table} DETACH PARTITION {name}'))
+                    expired.append(name)
+
+        if created or expired:
+            logger.info(f'[{self.table} partitions] created: {created}, {self.expired}: {expired}')
+        return dict(created=created, expired=expired)
+
+    async def start(self, engine: AsyncEngine, interval: float = 12 * 60 * 60):
+        """ Обслуговування зараз і далі кожні `interval` секунд у фоновій задачі """
+        await self.maintain(engine)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run_forever(engine, interval))
+
+    async def run_forever(self, engine: AsyncEngine, interval: float = 12 * 60 * 60):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.maintain(engine)
+            except Exception as e:
+                logger.exception(f'[{self.table} partitions] maintenance failed: {e}')
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
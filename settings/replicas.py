@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from starlette.requests import cookie_parser
+
+from settings.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Заголовок запиту / cookie, що привʼязують читання запиту до primary (read-your-writes)
+PRIMARY_HEADER = b'x-db-primary'
+PRIMARY_COOKIE = 'db_primary'
+
+# Відставання репліки, секунд: 0 - це primary або репліка вже програла весь отриманий WAL
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_read_primary: ContextVar[bool] = ContextVar('read_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """ Читання в блоці (і в задачах, запущених з нього) йдуть на primary - для щойно записаних даних """
+    token = _read_primary.set(True)
+    try:
+        yield
+    finally:
+        _read_primary.reset(token)
+
+
+def primary_pinned() -> bool:
+    return _read_primary.get()
+
+
+def primary_requested(scope) -> bool:
+    """ Клієнт просить читати з primary: заголовок X-DB-Primary або cookie, виставлений після його запису """
+    for name, value in scope.get('headers', []):
+        if name == PRIMARY_HEADER and value not in (b'', b'0'):
+            return True
+        if name == b'cookie' and PRIMARY_COOKIE in cookie_parser(value.decode('latin-1')):
+            return True
+    return False
+
+
+class ReplicaSet:
+    """
+    Репліки для читання: round-robin по здорових, фонова перевірка доступності та відставання
+    (не більше DB_REPLICA_MAX_LAG). Недоступна репліка виключається одразу при помилці зʼєднання
+    і повертається після успішної перевірки. Без здорових реплік `pick()` повертає None - читання йдуть на primary.
+    Транзакції на репліках read-only: запис через сесію для читання падає, а не губиться.
+    """
+
+    def __init__(self, urls: list[str], **engine_options):
+        self.engines: list[AsyncEngine] = [
+            create_async_engine(url, execution_options={'postgresql_readonly': True}, **engine_options)
+            for url in urls
+        ]
+        self.healthy = {engine: True for engine in self.engines}
+        self.lag: dict[AsyncEngine, float | None] = {engine: None for engine in self.engines}
+        self.errors: dict[AsyncEngine, str | None] = {engine: None for engine in self.engines}
+        self.checked_at: float | None = None
+        self._next = itertools.count()
+        self.task: asyncio.Task | None = None
+
+    def pick(self) -> AsyncEngine | None:
+        healthy = [engine for engine in self.engines if self.healthy[engine]]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def mark_down(self, engine: AsyncEngine, error: Exception | str):
+        if self.healthy[engine]:
+            logger.warning(f'[replicas] {engine.url.host}:{engine.url.port} is down: {error}')
+        self.healthy[engine] = False
+        self.errors[engine] = str(error)
+
+    @staticmethod
+    async def _lag(engine: AsyncEngine) -> float:
+        async with engine.connect() as connection:
+            return float((await connection.execute(LAG_QUERY)).scalar() or 0)
+
+    async def _check(self, engine: AsyncEngine):
+        try:
+            lag = await asyncio.wait_for(self._lag(engine), timeout=settings.DB_REPLICA_HEALTH_TIMEOUT)
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError) as e:
+            self.lag[engine] = None
+            self.mark_down(engine, str(e) or type(e).__name__)
+            return
+        self.lag[engine] = lag
+        if lag > settings.DB_REPLICA_MAX_LAG:
+            self.mark_down(engine, f'lag {lag:.1f}s')
+            return
+        if not self.healthy[engine]:
+            logger.info(f'[replicas] {engine.url.host}:{engine.url.port} is back')
+        self.healthy[engine] = True
+        self.errors[engine] = None
+
+    async def check(self):
+        """ Перевіряє всі репліки одночасно """
+        await asyncio.gather(*[self._check(engine) for engine in self.engines])
+        self.checked_at = time.time()
+
+    async def start(self):
+        if self.engines and self.task is None:
+            await self.check()
+            self.task = asyncio.create_task(self._run_forever())
+
+    async def _run_forever(self):
+        while True:
+            await asyncio.sleep(settings.DB_REPLICA_HEALTH_INTERVAL)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.exception(f'[replicas] health check failed: {e}')
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for engine in self.engines:
+            await engine.dispose()
+
+    def stats(self) -> list[dict]:
+        return [
+            dict(
+                url=engine.url.render_as_string(hide_password=True),
+                healthy=self.healthy[engine],
+                lag_seconds=self.lag[engine],
+                error=self.errors[engine],
+                checked_out=engine.pool.checkedout(),
+            )
+            for engine in self.engines
+        ]
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import re
+from collections import Counter
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode
+
+from settings.cache import TTLCache
+from settings.config import settings
+from settings.replicas import PRIMARY_HEADER, primary_requested
+
+logger = logging.getLogger(__name__)
+
+# Готові відповіді (status, headers, body) сторінок і read API; ключ - (path, нормалізований query string)
+response_cache = TTLCache(maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL)
+
+
+def _category_tags(match: re.Match) -> list[str]:
+    category = match['category']
+    # /{shop_id}/{item_id} з нечисловим item_id - вибірка по всіх товарах
+    return [f'product:category_id={category}'] if category.isdigit() else ['product:*']
+
+
+# Маршрути, що кешуються: шаблон шляху -> теги (ті самі, що Base.invalidate_caches() скидає при інжесті)
+CACHE_RULES: list[tuple[re.Pattern, Callable[[re.Match], list[str]]]] = [
+    (re.compile(r'^/(api/)?$'), lambda m: ['shops:*']),
+    (re.compile(r'^/(api/)?(?P<shop>\d+)$'), lambda m: [f'category:shop_id={m["shop"]}']),
+    (re.compile(r'^/(api/)?(?P<shop>\d+)/(?P<category>[^/]+)$'), _category_tags),
+    (re.compile(r'^/(?P<shop>\d+)/(?P<category>\d+)/(?P<product>\d+)$'), _category_tags),
+]
+
+
+# З запиту клієнта для перерендеру береться лише серверна частина scope - без його cookies, авторизації тощо
+PREWARM_SCOPE_KEYS = ('type', 'asgi', 'http_version', 'scheme', 'server', 'root_path', 'app', 'state')
+
+
+def prewarm_scope(scope, key: tuple) -> dict:
+    """ Чистий scope GET-запиту для ключа кешу: лише Host і X-DB-Primary (після запису рендер - з primary) """
+    path, query = key
+    headers = [(name, value) for name, value in scope.get('headers', []) if name == b'host']
+    return dict(
+        {name: scope[name] for name in PREWARM_SCOPE_KEYS if name in scope},
+        method='GET',
+        path=path,
+        raw_path=path.encode(),
+        query_string=query.encode('latin-1'),
+        headers=headers + [(PRIMARY_HEADER, b'1')],
+        client=None,
+    )
+
+
+def cache_tags(path: str) -> list[str] | None:
+    for pattern, tags in CACHE_RULES:
+        match = pattern.match(path)
+        if match:
+            return tags(match)
+    return None
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware: кешує успішні GET-відповіді маршрутів з CACHE_RULES (HTML після Jinja
+    та JSON) з тегами магазину/категорії. Записи скидаються через `invalidate()` з ingest-шляхів
+    (Base.invalidate_caches), після чого найпопулярніші з них перерендерюються у фоні.
+    Кеш - у памʼяті процесу; інвалідації з інших процесів приходять через cache_broadcast
+    (settings.database), RESPONSE_CACHE_TTL обмежує застарілість, якщо broadcast недоступний.
+    """
+    instance: "ResponseCacheMiddleware | None" = None
+
+    def __init__(self, app, cache: TTLCache = response_cache):
+        self.app = app
+        self.cache = cache
+        # Популярність ключів і чистий scope (prewarm_scope) для перерендеру
+        self.hits: Counter = Counter()
+        self.scopes: dict[tuple, dict] = {}
+        # Зростає при кожній інвалідації: відповідь, що рендерилась під час інвалідації, не кешується
+        self.version = 0
+        self.prewarm_keys: set[tuple] = set()
+        self.prewarm_task: asyncio.Task | None = None
+        ResponseCacheMiddleware.instance = self
+
+    @staticmethod
+    def cache_key(scope) -> tuple:
+        query = sorted(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        return scope['path'], urlencode(query)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return await self.app(scope, receive, send)
+        tags = cache_tags(scope['path'])
+        if tags is None:
+            return await self.app(scope, receive, send)
+
+        key = self.cache_key(scope)
+        self._track(key, scope)
+        # клієнт, що щойно записував (read-your-writes), не повинен отримати сторінку, відрендерену до запису
+        entry = None if primary_requested(scope) else self.cache.get(key)
+        if entry is not None:
+            status, headers, body = entry
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers + [(b'x-cache', b'HIT')]})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        await self._render(scope, receive, send, key, tags)
+
+    async def _render(self, scope, receive, send, key: tuple, tags: list[str]):
+        version = self.version
+        start, chunks = {}, []
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                start.update(message)
+                message = dict(message, headers=list(message.get('headers', [])) + [(b'x-cache', b'MISS')])
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body') and start.get('status') == 200 and version == self.version:
+                    headers = [(k, v) for k, v in start.get('headers', []) if k.lower() != b'set-cookie']
+                    self.cache.set(key, (200, headers, b''.join(chunks)), tags=tags)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _track(self, key: tuple, scope):
+        self.hits[key] += 1
+        if key not in self.scopes:
+            self.scopes[key] = prewarm_scope(scope, key)
+        if len(self.hits) > settings.RESPONSE_CACHE_TRACK_KEYS:
+            # забуваємо менш популярну половину, лічильники решти зменшуємо (старі хіти важать менше)
+            keep = self.hits.most_common(settings.RESPONSE_CACHE_TRACK_KEYS // 2)
+            self.hits = Counter({k: max(1, v // 2) for k, v in keep})
+            self.scopes = {k: self.scopes[k] for k in self.hits}
+
+    def invalidate(self, *tags: str):
+        self.version += 1
+        keys = self.cache.invalidate(*tags)
+        popular = {key for key, _ in self.hits.most_common(settings.RESPONSE_CACHE_PREWARM)}
+        self.prewarm_keys.update(key for key in keys if key in popular)
+        if self.prewarm_keys and (self.prewarm_task is None or self.prewarm_task.done()):
+            try:
+                self.prewarm_task = asyncio.get_running_loop().create_task(self._prewarm())
+            except RuntimeError:
+                # поза event loop (скрипти) перерендерювати нічого
+                self.prewarm_keys.clear()
+
+    async def _prewarm(self):
+        # чекаємо, поки закінчиться серія записів (інжест приходить пачками)
+        await asyncio.sleep(settings.RESPONSE_CACHE_PREWARM_DELAY)
+        while self.prewarm_keys:
+            key = self.prewarm_keys.pop()
+            scope = self.scopes.get(key)
+            if scope is None or key in self.cache:
+                continue
+            try:
+                # scope копіюється: маршрутизація дописує в нього endpoint, path_params тощо
+                scope = dict(scope, headers=list(scope['headers']))
+                if 'state' in scope:
+                    scope['state'] = dict(scope['state'])
+                await self._render(scope, _empty_receive, _discard_send, key, cache_tags(key[0]) or [])
+            except Exception as e:
+                logger.warning(f'[response cache] prewarm {key} failed: {e}')
+        logger.debug('[response cache] prewarm done')
+
+
+async def _empty_receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+async def _discard_send(message):
+    pass
+
+
+def invalidate_responses(*tags: str):
+    if ResponseCacheMiddleware.instance is not None:
+        ResponseCacheMiddleware.instance.invalidate(*tags)
+    else:
+        response_cache.invalidate(*tags)
+
+
+def clear_responses():
+    """ Скидає весь кеш відповідей (без перерендеру) """
+    if ResponseCacheMiddleware.instance is not None:
+        ResponseCacheMiddleware.instance.version += 1
+        ResponseCacheMiddleware.instance.cache.clear()
+    else:
+        response_cache.clear()
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import re
+import sys
+import time
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+
+from settings.config import settings
+from settings.database import AsyncSessionLocal
+from settings import elastic
+from settings.metrics import observe_reindex
+from shops.models import Product
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Поля документа товару в пошуковому індексі
+DOC_FIELDS = ("id", "name", "last_price", "price_change", "category_id")
+
+
+class SearchBackend(ABC):
+    """
+    Пошук товарів за назвою для `/s` та `/suggest`.
+
+    Реалізації: ElasticBackend - кластер Elasticsearch, MemoryBackend - індекс у памʼяті
+    процесу (локальна розробка, CI, невеликі інсталяції без ES). Обирається SEARCH_BACKEND.
+    """
+    name: str
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def create_index(self) -> bool:
+        """ Готує індекс до роботи на старті застосунку; True - потрібна повна переіндексація (задача reindex) """
+
+    @abstractmethod
+    async def index_products(self, full: bool = False, progress: elastic.Progress | None = None) -> dict:
+        """ Переіндексація з БД, повертає звіт (indexed, failed, seconds, ...) """
+
+    @abstractmethod
+    async def ingest(self, products: list[dict]):
+        """ Інкрементальне оновлення індексу товарами, щойно записаними в БД """
+
+    @abstractmethod
+    async def search(self, q: str, size: int = 20, from_: int = 0,
+                     fields: tuple[str, ...] = elastic.SEARCH_FIELDS) -> list[dict]:
+        """ Всі слова запиту в назві (останнє - префікс), сортування за last_price desc """
+
+    @abstractmethod
+    async def suggest(self, q: str, size: int = settings.SUGGEST_SIZE) -> list[dict]:
+        """ Top `size` за релевантністю: id, name, last_price, category_id """
+
+
+class ElasticBackend(SearchBackend):
+    name = "elastic"
+
+    def __init__(self):
+        self.es = None
+
+    async def connect(self):
+        self.es = await elastic.connect_es()
+
+    async def close(self):
+        await elastic.close_es()
+        self.es = None
+
+    async def create_index(self):
+        return await elastic.create_index(self.es)
+
+    async def index_products(self, full=False, progress=None):
+        if full:
+            return await elastic.rebuild_index(self.es, progress=progress)
+        return await elastic.index_products(self.es, progress=progress)
+
+    async def ingest(self, products: list[dict]):
+        # Нові та змінені товари підхоплює інкрементальна переіндексація за watermark
+        pass
+
+    async def search(self, q, size=20, from_=0, fields=elastic.SEARCH_FIELDS):
+        return await elastic.search_products(self.es, q, size=size, from_=from_, fields=fields)
+
+    async def suggest(self, q, size=settings.SUGGEST_SIZE):
+        return await elastic.suggest_products(self.es, q, size=size)
+
+
+class MemoryBackend(SearchBackend):
+    """
+    Edge-ngram інвертований індекс по назвах товарів у памʼяті процесу.
+
+    Кожне слово назви розкладається на префікси довжиною 1..max_gram; префікс (інтернований
+    рядок) -> відсортований array('I') з id товарів. Запит: перетин списків для кожного слова
+    запиту, слова довші за max_gram додатково перевіряються по самій назві.
+    Документи зберігаються кортежами (name, last_price, price_change, category_id, tokens).
+    """
+    name = "memory"
+
+    def __init__(self, max_gram: int = settings.SEARCH_MEMORY_MAX_GRAM):
+        self.max_gram = max_gram
+        self.postings: dict[str, array] = {}
+        self.docs: dict[int, tuple] = {}
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        return TOKEN_RE.findall(text.lower())
+
+    def grams(self, tokens) -> set[str]:
+        return {sys.intern(token[:size]) for token in tokens for size in range(1, min(len(token), self.max_gram) + 1)}
+
+    def add(self, product: dict):
+        product_id = product['id']
+        tokens = tuple(sys.intern(i) for i in self.tokenize(product['name'] or ''))
+        old = self.docs.get(product_id)
+        old_grams = self.grams(old[4]) if old else set()
+        new_grams = self.grams(tokens)
+
+        for gram in old_grams - new_grams:
+            ids = self.postings[gram]
+            ids.pop(bisect_left(ids, product_id))
+            if not ids:
+                del self.postings[gram]
+        for gram in new_grams - old_grams:
+            ids = self.postings.get(gram)
+            if ids is None:
+                self.postings[gram] = array('I', (product_id,))
+            else:
+                insort(ids, product_id)
+
+        self.docs[product_id] = (product['name'], product.get('last_price'), product.get('price_change'),
+                                 product.get('category_id'), tokens)
+
+    def match(self, q: str) -> list[int]:
+        words = self.tokenize(q)
+        if not words:
+            return []
+        lists = []
+        for word in words:
+            ids = self.postings.get(word[:self.max_gram])
+            if ids is None:
+                return []
+            lists.append(ids)
+        lists.sort(key=len)
+        first, rest = lists[0], lists[1:]
+        found = []
+        for product_id in first:
+            for ids in rest:
+                i = bisect_left(ids, product_id)
+                if i == len(ids) or ids[i] != product_id:
+                    break
+            else:
+                found.append(product_id)
+
+        long_words = [word for word in words if len(word) > self.max_gram]
+        if long_words:
+            found = [
+                product_id for product_id in found
+                if all(any(token.startswith(word) for token in self.docs[product_id][4]) for word in long_words)
+            ]
+        return found
+
+    def document(self, product_id: int, fields) -> dict:
+        name, last_price, price_change, category_id, _ = self.docs[product_id]
+        doc = dict(id=product_id, name=name, last_price=last_price, price_change=price_change, category_id=category_id)
+        return {field: doc[field] for field in fields}
+
+    async def create_index(self):
+        await self.index_products(full=True)
+        return False
+
+    async def index_products(self, full=False, progress=None):
+        # Індекс у памʼяті не переживає перезапуск, тому будується завжди повністю
+        # Новий індекс будується поруч, пошук до кінця побудови працює по старому
+        started = time.monotonic()
+        fresh = MemoryBackend(self.max_gram)
+        stmt = select(*(getattr(Product, i) for i in DOC_FIELDS))
+        async with AsyncSessionLocal.reader() as session:
+            result = await session.stream(stmt.execution_options(yield_per=settings.ES_BATCH_SIZE))
+            async for rows in result.partitions(settings.ES_BATCH_SIZE):
+                for row in rows:
+                    fresh.add(row._mapping)
+                if progress is not None:
+                    await progress(len(fresh.docs), None)
+                # побудова великого індексу не має блокувати event loop
+                await asyncio.sleep(0)
+        self.postings, self.docs = fresh.postings, fresh.docs
+
+        seconds = time.monotonic() - started
+        report = dict(
+            indexed=len(self.docs),
+            failed=0,
+            seconds=round(seconds, 3),
+            docs_per_sec=round(len(self.docs) / seconds, 1) if seconds else 0.0,
+            grams=len(self.postings),
+            full=True,
+        )
+        logger.info(f'[memory search] {report}')
+        observe_reindex(self.name, report)
+        return report
+
+    async def ingest(self, products: list[dict]):
+        for product in products:
+            self.add(product)
+
+    async def search(self, q, size=20, from_=0, fields=elastic.SEARCH_FIELDS):
+        found = self.match(q)
+        found.sort(key=lambda i: self.docs[i][1] or 0.0, reverse=True)
+        return [self.document(i, fields) for i in found[from_:from_ + size]]
+
+    async def suggest(self, q, size=settings.SUGGEST_SIZE):
+        words = self.tokenize(q)
+        found = self.match(q)
+        # релевантність: більше слів запиту збігаються повністю, коротша назва
+        found.sort(key=lambda i: (-sum(word in self.docs[i][4] for word in words), len(self.docs[i][4])))
+        return [self.document(i, elastic.SUGGEST_SOURCE) for i in found[:size]]
+
+
+SEARCH_BACKENDS = {
+    ElasticBackend.name: ElasticBackend,
+    MemoryBackend.name: MemoryBackend,
+}
+
+search_backend: SearchBackend | None = None
+
+
+async def connect_search(name: str = settings.SEARCH_BACKEND) -> SearchBackend:
+    global search_backend
+    if search_backend is None:
+        if name not in SEARCH_BACKENDS:
+            raise ValueError(f"Unsupported search backend: {name}")
+        search_backend = SEARCH_BACKENDS[name]()
+        await search_backend.connect()
+    return search_backend
+
+
+async def close_search():
+    global search_backend
+    if search_backend is not None:
+        await search_backend.close()
+        search_backend = None
+
+
+def get_search() -> SearchBackend:
+    """ FastAPI dependency: пошуковий бекенд процесу """
+    if search_backend is None:
+        raise RuntimeError("Search backend is not initialized")
+    return search_backend
@@ -1,10 +1,19 @@
-from typing import Union, List
-from fastapi import Query, Request, APIRouter, HTTPException, Form
+import zlib
+from datetime import date
+from typing import Union, List, Literal
+from fastapi import Query, Request, APIRouter, HTTPException, Form, Depends
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from sqlalchemy.exc import IntegrityError
 
+from settings.config import settings
 from settings.pagination import PaginatedResponse
-from .models import Shop, Product, Category
+from settings.search import SearchBackend, get_search, DOC_FIELDS
+from .columnar import json_chunks, to_npz
+from .ingest import ingest_queue, IngestQueueFull, IngestDeadLetter, ndjson_chunks
+from .models import Shop, Product, Category, Price, PriceMover
 from .serializers import (ShopSchemaGET, ProductPricesSchemaGET, CategorySchemaGET, ProductSchemaGET,
-                          CategorySchemaPOST, ProductSchemaPOST)
+                          CategorySchemaPOST, ProductSchemaPOST, ProductBulkSchemaGET, PriceHistorySchemaGET,
+                          ProductStreamSchemaGET, PriceChartsSchemaGET, PriceMoverSchemaGET)
 
 router = APIRouter()
 
@@ -36,13 +45,49 @@ async def create_shop(name: str = Form(),
 
 
 
+@router.get("/charts", response_model=PriceChartsSchemaGET,
+            description="Price series of many products for charts: day offsets from `base` and prices, oldest first")
+async def price_charts(ids: str = Query(..., description="Comma-separated product ids"),
+                       limit: int = Query(settings.PRICES_ON_PAGE, ge=1, description="Last N prices per product"),
+                       since: date = Query(None, description="Only prices since this date")):
+    try:
+        product_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not product_ids or len(product_ids) > settings.CHART_MAX_PRODUCTS:
+        raise HTTPException(status_code=400, detail=f"ids must contain 1..{settings.CHART_MAX_PRODUCTS} products")
+    return await Price.series(product_ids, limit=limit, since=since)
+
+
+@router.get("/movers", response_model=List[PriceMoverSchemaGET],
+            description="Biggest price movers: top products by absolute (`abs`) or percent (`pct`) change "
+                        "globally, in a shop or in a category")
+async def price_movers(scope: Literal['global', 'shop', 'category'] = Query('global'),
+                       id: int = Query(None, description="Shop or category id for `shop`/`category` scope"),
+                       direction: Literal['cheaper', 'expensive'] = Query('cheaper'),
+                       metric: Literal['abs', 'pct'] = Query('pct'),
+                       limit: int = Query(settings.MOVERS_LIMIT, ge=1, le=settings.MOVERS_MAX_LIMIT),
+                       offset: int = Query(0, ge=0, le=settings.MOVERS_MAX_OFFSET)):
+    try:
+        return await PriceMover.top(scope=scope, scope_id=id, direction=direction, metric=metric,
+                                    limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/{item_id}", response_model=PaginatedResponse[CategorySchemaGET], description="Get shop category by id")
 async def get_prices(item_id: int,
                      page: int = Query(1, ge=1),
-                     page_size: int = Query(10, ge=1)):
+                     page_size: int = Query(10, ge=1),
+                     cursor: str = Query(None, description="`next`/`prev` cursor from the previous response"),
+                     count: Literal['exact', 'cached', 'estimate', 'none'] = Query('cached')):
     offset = page * page_size if page > 1 else 0
 
-    results: dict = await Category.filter_by_(shop_id=item_id, limit=page_size, offset=offset)
+    try:
+        results: dict = await Category.filter_by_(shop_id=item_id, limit=page_size, offset=offset, cursor=cursor,
+                                                  count=count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     results['page'] = page
     return PaginatedResponse(**results)
 
@@ -56,13 +101,101 @@ async def create_categories(categories: list[CategorySchemaPOST]):
 
 
 
-@router.post("/products", response_model=list[ProductSchemaGET])
-async def create_products(products: list[ProductSchemaPOST]):
+def enqueue_products(data: list[dict]) -> JSONResponse:
+    """ INGEST_MODE = "queue": товари записує фоновий споживач, відповідь - 202 """
+    if any(not i.get('url') for i in data):
+        raise HTTPException(status_code=400, detail="Every product must have 'url'")
+    try:
+        report = ingest_queue.put(data)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(settings.INGEST_FLUSH_INTERVAL)})
+    return JSONResponse(status_code=202, content=dict(status="queued", **report))
+
+
+@router.post("/products", response_model=ProductBulkSchemaGET,
+             responses={202: {"description": "Queued (INGEST_MODE=queue)"}},
+             description="Response changed from a list of products to "
+                         "`{inserted, updated, unchanged, items}`: the former list is now `items`")
+async def create_products(products: list[ProductSchemaPOST],
+                          search_backend: SearchBackend = Depends(get_search)):
     data = [i.__dict__ for i in products]
-    items = await Product.update_or_create_bulb(data)
-    return items
+    if settings.INGEST_MODE == "queue":
+        return enqueue_products(data)
+    try:
+        result = await Product.update_or_create_bulb(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await search_backend.ingest(result['items'])
+    return result
+
+
+@router.post("/products/stream", response_model=ProductStreamSchemaGET,
+             description="NDJSON (one product per line, optionally gzip: `Content-Encoding: gzip`), loaded with COPY")
+async def create_products_stream(request: Request,
+                                 search_backend: SearchBackend = Depends(get_search)):
+    gzip = (request.headers.get('content-encoding', '').lower() == 'gzip'
+            or request.headers.get('content-type', '').startswith('application/gzip'))
+    report = dict(rejected=0, errors=[])
+    try:
+        result = await Product.update_or_create_copy(ndjson_chunks(request.stream(), report, gzip=gzip),
+                                                     on_changed=search_backend.ingest)
+    except (ValueError, zlib.error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid products: {e.orig}")
+    return dict(**result, **report)
 
 
+@router.get("/ingest/stats", description="Write-behind ingest queue: depth, flush latency, counters and dead letters")
+async def ingest_stats():
+    return dict(mode=settings.INGEST_MODE, **ingest_queue.stats(), dead_letter=await IngestDeadLetter.summary())
+
+
+
+
+@router.get("/products/{product_id}/history", response_model=PriceHistorySchemaGET,
+            description="Price history; without `resolution` the finest one with at most HISTORY_MAX_POINTS points "
+                        "in the window is used (month if none fits)")
+async def product_price_history(product_id: int,
+                                resolution: Literal['day', 'week', 'month'] = Query(None),
+                                date_from: date = Query(None, alias="from"),
+                                date_to: date = Query(None, alias="to")):
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    return await Price.history(product_id, resolution=resolution, date_from=date_from, date_to=date_to)
+
+
+@router.get("/prices/series",
+            responses={200: {"content": {"application/json": {}, "application/octet-stream": {}}}},
+            description="Price series of products / a category / a shop as parallel arrays "
+                        "`product_id`, `date`, `price` sorted by (product_id, date): "
+                        f"JSON or `format=npz` (numpy.load). At most {settings.SERIES_MAX_ROWS} points: "
+                        "larger selections get 400, narrow them by products or dates")
+async def price_series(products: str = Query(None, description="Comma-separated product ids"),
+                       category_id: int = Query(None),
+                       shop_id: int = Query(None),
+                       date_from: date = Query(None, alias="from"),
+                       date_to: date = Query(None, alias="to"),
+                       format: Literal['json', 'npz'] = Query('json')):
+    try:
+        product_ids = [int(i) for i in products.split(",") if i.strip()] if products else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="products must be comma-separated integers")
+    if not (product_ids or category_id is not None or shop_id is not None):
+        raise HTTPException(status_code=400, detail="One of products, category_id or shop_id is required")
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    # на одну точку більше за ліміт - щоб відрізнити "рівно ліміт" від обрізаної вибірки
+    columns = await Price.columns_(product_ids, category_id=category_id, shop_id=shop_id,
+                                   date_from=date_from, date_to=date_to, limit=settings.SERIES_MAX_ROWS + 1)
+    if len(columns['price']) > settings.SERIES_MAX_ROWS:
+        raise HTTPException(status_code=400,
+                            detail=f"More than {settings.SERIES_MAX_ROWS} points: narrow products or dates")
+    if format == 'npz':
+        return Response(content=to_npz(columns), media_type="application/octet-stream",
+                        headers={"Content-Disposition": 'attachment; filename="prices.npz"'})
+    return StreamingResponse(json_chunks(columns), media_type="application/json")
 
 
 @router.post("/{shop_id}", response_model=CategorySchemaGET)
@@ -81,28 +214,47 @@ async def create_category(shop_id: int,
 async def read_item(category_id: int,
                     only_changed: Union[int, None] = None,
                     page: int = Query(1, ge=1),
-                    page_size: int = Query(10, ge=1)):
+                    page_size: int = Query(10, ge=1),
+                    prices_limit: int = Query(settings.PRICES_ON_PAGE, ge=1, description="Last N prices per product"),
+                    prices_since: date = Query(None, description="Only prices since this date"),
+                    cursor: str = Query(None, description="`next`/`prev` cursor from the previous response"),
+                    count: Literal['exact', 'cached', 'estimate', 'none'] = Query('cached')):
     offset = page * page_size if page > 1 else 0
 
-    results = await Product.filter_by_(category_id=category_id,
-                                       ordered=['in_stock', ],
-                                       related='prices',
-                                       limit=page_size,
-                                       offset=offset,
-                                       only_changed=bool(only_changed)
-                                       )
+    try:
+        results = await Product.filter_by_(category_id=category_id,
+                                           ordered=['in_stock', ],
+                                           related='prices',
+                                           prices_limit=prices_limit,
+                                           prices_since=prices_since,
+                                           limit=page_size,
+                                           offset=offset,
+                                           only_changed=bool(only_changed),
+                                           cursor=cursor,
+                                           count=count,
+                                           )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     results['page'] = page
     return PaginatedResponse(**results)
 
 
-@router.post("/{shop_id}/{category_id}", response_model=ProductSchemaGET)
+@router.post("/{shop_id}/{category_id}", response_model=ProductSchemaGET,
+             responses={202: {"description": "Queued (INGEST_MODE=queue)"}},
+             description="Synchronously the product is matched by (category_id, name, packaging); "
+                         "with INGEST_MODE=queue it goes through the bulk upsert and is matched by `url`")
 async def create_item(category_id: int,
                     name: str = Form(),
                     url: str = Form(),
                     img_src: str = Form(None),
                     packaging: str = Form(None),
                     in_stock: bool = Form(False),
-                    price: float = Form(0.0)):
+                    price: float = Form(0.0),
+                    search_backend: SearchBackend = Depends(get_search)):
+    if settings.INGEST_MODE == "queue":
+        return enqueue_products([dict(category_id=category_id, name=name, url=url, img_src=img_src,
+                                      packaging=packaging, in_stock=in_stock, price=price)])
+
     item, _ = await Product.update_or_create(category_id=category_id,
                                              name=name,
                                              url=url,
@@ -111,5 +263,6 @@ async def create_item(category_id: int,
                                              in_stock=in_stock,
                                              price=price
                                              )
+    await search_backend.ingest([{field: getattr(item, field) for field in DOC_FIELDS}])
 
     return item
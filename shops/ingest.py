@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy import Text, select, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Mapped, mapped_column
+
+from settings.config import settings
+from settings.database import Base, AsyncSessionLocal
+from settings import search
+from settings.metrics import registry
+from shops.models import Product
+from shops.serializers import ProductSchemaPOST
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+def _transient(error: Exception) -> bool:
+    """ Помилка зʼєднання з БД (пачку варто повторити цілою), а не відмова записати самі дані """
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError))
+    return isinstance(error, (OSError, asyncio.TimeoutError, PoolTimeoutError))
+
+
+class IngestDeadLetter(Base):
+    """ Товари з черги, які БД відхиляє (невідома категорія, невалідні значення) після INGEST_MAX_ATTEMPTS спроб """
+    __tablename__ = "ingest_dead_letter"
+
+    url: Mapped[str] = mapped_column(index=True)
+    payload: Mapped[dict] = mapped_column(JSONB)
+    error: Mapped[str] = mapped_column(Text)
+    attempts: Mapped[int]
+
+    @classmethod
+    async def add(cls, product: dict, error: str, attempts: int):
+        async with AsyncSessionLocal.detached() as session:
+            session.add(cls(url=product['url'], payload=json.loads(json.dumps(product, default=str)),
+                            error=error, attempts=attempts))
+            await session.commit()
+
+    @classmethod
+    async def summary(cls, limit: int = 10) -> dict:
+        async with AsyncSessionLocal.detached() as session:
+            total = (await session.execute(select(func.count()).select_from(cls))).scalar()
+            result = await session.execute(select(cls).order_by(cls.id.desc()).limit(limit))
+            recent = [dict(id=i.id, url=i.url, error=i.error, attempts=i.attempts, created_at=i.created_at)
+                      for i in result.scalars()]
+        return dict(total=total, recent=recent)
+
+
+class IngestQueue:
+    """
+    Write-behind черга товарів від скраперів (INGEST_MODE = "queue").
+
+    Запити лише кладуть товари в чергу, фоновий споживач збирає їх з усіх запитів у великі
+    пачки і записує через Product.update_or_create_bulb. Той самий товар (url), що прийшов
+    кілька разів до запису, зливається в один - перемагає останнє значення.
+    Пачка записується, коли набралось `batch_size` товарів або найстаріший чекає `flush_interval` секунд.
+
+    Пачку, яку відхиляє БД (FK, невалідне значення), черга ділить навпіл, доки не відокремить погані
+    товари: решта записується, погані повертаються в кінець черги, а після `max_attempts` спроб
+    потрапляють в IngestDeadLetter. Коли недоступна сама БД, пачка повертається в чергу цілою.
+    Незаписане при зупинці скидається в INGEST_SPILL_DIR і повертається в чергу на старті.
+    """
+
+    def __init__(self, batch_size: int = settings.INGEST_BATCH_SIZE,
+                 flush_interval: float = settings.INGEST_FLUSH_INTERVAL,
+                 max_pending: int = settings.INGEST_MAX_PENDING,
+                 max_attempts: int = settings.INGEST_MAX_ATTEMPTS,
+                 spill_dir: str = settings.INGEST_SPILL_DIR):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.spill_dir = spill_dir
+        # url -> (товар, час постановки в чергу, невдалих спроб); dict зберігає порядок надходження
+        self.pending: dict[str, tuple[dict, float, int]] = {}
+        self.wakeup = asyncio.Event()
+        self.consumer: asyncio.Task | None = None
+        self.stopping = False
+        self.stats_ = dict(enqueued=0, coalesced=0, flushed=0, batches=0, failed_batches=0, retried=0,
+                           dead_letters=0, spilled=0, last_flush_seconds=None, max_flush_seconds=0.0,
+                           last_lag_seconds=None, max_lag_seconds=0.0)
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
+
+    def put(self, products: list[dict]) -> dict:
+        """ :raise IngestQueueFull: черга переповнена, запис не встигає за скраперами """
+        if self.depth + len(products) > self.max_pending:
+            raise IngestQueueFull(f"Ingest queue is full ({self.depth} pending)")
+        now = time.monotonic()
+        coalesced = 0
+        for product in products:
+            previous = self.pending.get(product['url'])
+            enqueued = now
+            if previous is not None:
+                coalesced += 1
+                # зберігаємо час першої постановки, щоб товар не чекав вічно при частих оновленнях
+                enqueued = previous[1]
+            # нове значення - нові спроби
+            self.pending[product['url']] = (product, enqueued, 0)
+        self.stats_['enqueued'] += len(products)
+        self.stats_['coalesced'] += coalesced
+        if self.depth >= self.batch_size:
+            self.wakeup.set()
+        return dict(accepted=len(products), coalesced=coalesced, depth=self.depth)
+
+    def stats(self) -> dict:
+        oldest = next(iter(self.pending.values()), None)
+        return dict(
+            **self.stats_,
+            depth=self.depth,
+            oldest_seconds=round(time.monotonic() - oldest[1], 3) if oldest else None,
+            batch_size=self.batch_size,
+            flush_interval=self.flush_interval,
+            running=self.consumer is not None and not self.consumer.done(),
+        )
+
+    async def start(self):
+        if self.consumer is None:
+            self.stopping = False
+            self.load_spilled()
+            self.consumer = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        """ Зупиняє споживача; все, що залишилось у черзі, записується перед виходом або скидається на диск """
+        if self.consumer is not None:
+            self.stopping = True
+            self.wakeup.set()
+            await self.consumer
+            self.consumer = None
+
+    async def _consume(self):
+        while not self.stopping:
+            oldest = next(iter(self.pending.values()), None)
+            timeout = self.flush_interval if oldest is None else max(0.0, oldest[1] + self.flush_interval - time.monotonic())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if self.pending and not await self.flush():
+                # БД недоступна - не крутимось в циклі
+                await asyncio.sleep(self.flush_interval)
+
+        # при зупинці: кожен товар - не більше max_attempts спроб, потім - на диск
+        for _ in range(self.max_attempts):
+            while self.pending and await self.flush():
+                pass
+            if not self.pending:
+                return
+            await asyncio.sleep(self.flush_interval)
+        self.spill()
+
+    async def flush(self) -> bool:
+        """
+        Записує одну пачку (до batch_size найстаріших товарів).
+        :return: False - БД недоступна, незаписане повернуто в чергу
+        """
+        urls = list(self.pending)[:self.batch_size]
+        batch = [(url, self.pending.pop(url)) for url in urls]
+        started = time.monotonic()
+        written, reports, rejected = [], [], []
+        try:
+            await self._write(batch, written, reports, rejected)
+        except Exception as e:
+            self.stats_['failed_batches'] += 1
+            logger.exception(f'[ingest] flush of {len(batch)} products failed: {e}')
+            done = {url for url, _ in written}
+            self._requeue([entry for entry in batch if entry[0] not in done], head=True)
+            return False
+        finally:
+            await self._reject(rejected)
+        if not written:
+            return True
+
+        finished = time.monotonic()
+        seconds, lag = finished - started, finished - min(item[1] for _, item in written)
+        self.stats_.update(
+            flushed=self.stats_['flushed'] + len(written),
+            batches=self.stats_['batches'] + 1,
+            last_flush_seconds=round(seconds, 3),
+            max_flush_seconds=round(max(self.stats_['max_flush_seconds'], seconds), 3),
+            last_lag_seconds=round(lag, 3),
+            max_lag_seconds=round(max(self.stats_['max_lag_seconds'], lag), 3),
+        )
+        items = [item for report in reports for item in report['items']]
+        logger.debug(f'[ingest] flushed {len(written)} products in {seconds:.3f}s in {len(reports)} writes, '
+                     f'rejected {len(rejected)}')
+        if search.search_backend is not None:
+            await search.search_backend.ingest(items)
+        return True
+
+    async def _write(self, batch: list[tuple[str, tuple]], written: list, reports: list, rejected: list):
+        """
+        Пише пачку; якщо БД відхиляє дані, ділить її навпіл і пише половини окремо, доки погані товари
+        не залишаться поодинці (log2(batch_size) додаткових записів на кожен). Помилки зʼєднання
+        з БД прокидаються нагору - пачку варто повторити пізніше цілою.
+        """
+        try:
+            reports.append(await Product.update_or_create_bulb([item[0] for _, item in batch]))
+        except Exception as e:
+            if _transient(e):
+                raise
+            if len(batch) == 1:
+                rejected.append((batch[0], e))
+                return
+            middle = len(batch) // 2
+            await self._write(batch[:middle], written, reports, rejected)
+            await self._write(batch[middle:], written, reports, rejected)
+            return
+        written.extend(batch)
+
+    def _requeue(self, batch: list[tuple[str, tuple]], head: bool):
+        """ Повертає товари в чергу, не перезаписуючи новіших значень тих самих товарів """
+        returned = {url: item for url, item in batch if url not in self.pending}
+        self.pending = returned | self.pending if head else self.pending | returned
+
+    async def _reject(self, rejected: list[tuple[tuple[str, tuple], Exception]]):
+        """ Товари, які БД не приймає: ще одна спроба в кінці черги або dead-letter після max_attempts """
+        retry = []
+        for (url, (product, enqueued, attempts)), error in rejected:
+            attempts += 1
+            if url in self.pending:
+                # поки пачка писалась, прийшло нове значення товару - воно й буде записане
+                continue
+            if attempts < self.max_attempts:
+                retry.append((url, (product, enqueued, attempts)))
+                continue
+            message = f'{type(error).__name__}: {getattr(error, "orig", None) or error}'
+            logger.warning(f'[ingest] {url} moved to dead letters after {attempts} attempts: {message}')
+            try:
+                await IngestDeadLetter.add(product, message, attempts)
+                self.stats_['dead_letters'] += 1
+            except Exception as e:
+                logger.exception(f'[ingest] dead letter for {url} failed: {e}')
+                retry.append((url, (product, enqueued, attempts - 1)))
+        self.stats_['retried'] += len(retry)
+        self._requeue(retry, head=False)
+
+    def spill(self) -> str | None:
+        """ Товари, які не вдалось записати при зупинці, - у NDJSON (формат POST /api/products/stream) """
+        if not self.pending:
+            return None
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f'ingest_{int(time.time())}_{os.getpid()}.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            for product, _, _ in self.pending.values():
+                file.write(json.dumps(product, default=str) + '\n')
+        self.stats_['spilled'] += self.depth
+        logger.error(f'[ingest] {self.depth} unwritten products spilled to {path}')
+        self.pending = {}
+        return path
+
+    def load_spilled(self) -> int:
+        """ Повертає в чергу товари, скинуті на диск при попередній зупинці (будь-якого процесу) """
+        if not os.path.isdir(self.spill_dir):
+            return 0
+        loaded = 0
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not name.endswith('.ndjson'):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            claimed = f'{path}.{os.getpid()}.loading'
+            try:
+                # rename атомарний: файл забирає лише один процес
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, encoding='utf-8') as file:
+                products = [json.loads(line) for line in file if line.strip()]
+            now = time.monotonic()
+            for product in products:
+                self.pending.setdefault(product['url'], (product, now, 0))
+            os.remove(claimed)
+            loaded += len(products)
+        if loaded:
+            logger.warning(f'[ingest] {loaded} spilled products returned to the queue')
+        return loaded
+
+
+ingest_queue = IngestQueue()
+
+# Стан write-behind черги для /metrics (пачки, що вона записує, рахує Product.update_or_create_bulb)
+registry.callback('ingest_queue_depth', 'Products waiting in the ingest queue', lambda: [({}, ingest_queue.depth)])
+registry.callback('ingest_queue_oldest_seconds', 'Age of the oldest queued product',
+                  lambda: [({}, ingest_queue.stats()['oldest_seconds'] or 0.0)])
+registry.callback('ingest_queue_lag_seconds', 'Enqueue-to-write lag of the last flushed batch',
+                  lambda: [({}, ingest_queue.stats_['last_lag_seconds'])])
+registry.callback('ingest_queue_products', 'Products accepted by the ingest queue',
+                  lambda: [({}, ingest_queue.stats_['enqueued'])], kind='counter')
+registry.callback('ingest_queue_coalesced', 'Queued products replaced by a newer value before the write',
+                  lambda: [({}, ingest_queue.stats_['coalesced'])], kind='counter')
+registry.callback('ingest_queue_failed_batches', 'Queue flushes that failed and were re-queued',
+                  lambda: [({}, ingest_queue.stats_['failed_batches'])], kind='counter')
+registry.callback('ingest_queue_dead_letters', 'Products moved to ingest_dead_letter after max attempts',
+                  lambda: [({}, ingest_queue.stats_['dead_letters'])], kind='counter')
+
+
+async def _decompress(body: AsyncIterator[bytes], gzip: bool) -> AsyncIterator[bytes]:
+    if not gzip:
+        async for data in body:
+            yield data
+        return
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    async for data in body:
+        # обмежений вихід на кожен крок: маленький стиснутий шматок не розгорнеться в гігабайти
+        data = decompressor.decompress(data, settings.INGEST_STREAM_MAX_LINE)
+        while True:
+            yield data
+            if not decompressor.unconsumed_tail:
+                break
+            data = decompressor.decompress(decompressor.unconsumed_tail, settings.INGEST_STREAM_MAX_LINE)
+    yield decompressor.flush()
+
+
+async def ndjson_chunks(body: AsyncIterator[bytes], report: dict, gzip: bool = False,
+                        chunk_size: int = settings.INGEST_STREAM_CHUNK) -> AsyncIterator[list[tuple]]:
+    """
+    Інкрементально розбирає NDJSON (один ProductSchemaPOST на рядок) з потоку байтів і віддає
+    пачки по `chunk_size` кортежів у порядку STAGING_COLUMNS (першим - номер рядка).
+    Невалідні рядки пропускаються: лічильник report['rejected'] та перші помилки в report['errors'].
+
+    :raise ValueError: рядок довший за INGEST_STREAM_MAX_LINE
+    """
+    buffer = b''
+    line_no = 0
+    records = []
+
+    def parse(line: bytes):
+        try:
+            product = ProductSchemaPOST.model_validate_json(line)
+            if not product.url:
+                raise ValueError("'url' is required")
+        except (ValidationError, ValueError) as e:
+            report['rejected'] += 1
+            if len(report['errors']) < settings.INGEST_STREAM_MAX_ERRORS:
+                message = e.errors()[0]['msg'] if isinstance(e, ValidationError) else str(e)
+                report['errors'].append(dict(line=line_no, error=message))
+            return
+        records.append((line_no, product.name, product.url, product.img_src, product.packaging,
+                        product.category_id, product.in_stock, product.price or 0.0))
+
+    async for data in _decompress(body, gzip):
+        buffer += data
+        *lines, buffer = buffer.split(b'\n')
+        if len(buffer) > settings.INGEST_STREAM_MAX_LINE:
+            raise ValueError(f"Line {line_no + len(lines) + 1} is longer than {settings.INGEST_STREAM_MAX_LINE} bytes")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                parse(line)
+        if len(records) >= chunk_size:
+            yield records
+            records = []
+
+    if buffer.strip():
+        line_no += 1
+        parse(buffer)
+    if records:
+        yield records
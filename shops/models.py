@@ -1,10 +1,48 @@
-from datetime import datetime, timezone
-from typing import Sequence
+import logging
+import time
+from array import array
+from datetime import datetime, date, timedelta
+from typing import AsyncIterator, Awaitable, Callable
 
-from sqlalchemy import String, ForeignKey, select, cast, Date, and_, desc, asc, tuple_, update, case, func, Numeric
+import numpy as np
+
+from sqlalchemy import (String, ForeignKey, select, cast, Date, desc, asc, tuple_, update, case, func, Numeric,
+                        Integer, Float, Boolean, literal, literal_column, any_, bindparam, Index, true, false, insert,
+                        MetaData, Table, Column, BigInteger, type_coerce, SmallInteger, DateTime, delete)
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY, array_agg, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import relationship, Mapped, mapped_column, aliased
-from settings.database import Base, AsyncSessionLocal, get_session
+from sqlalchemy.orm import relationship, Mapped, mapped_column, aliased, declared_attr
+from sqlalchemy.orm.attributes import set_committed_value
+from settings.config import settings
+from settings.database import Base, AsyncSessionLocal, unnest_table
+from settings.metrics import observe_ingest
+from settings.partitions import MonthlyPartitionManager
+from shops.stats import price_stats, STATS_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+# Тимчасові таблиці для Product.update_or_create_copy: окремі метадані, щоб їх не створював
+# create_all; живуть до кінця транзакції (ON COMMIT DROP)
+staging_metadata = MetaData()
+STAGING_COLUMNS = ('seq', 'name', 'url', 'img_src', 'packaging', 'category_id', 'in_stock', 'price')
+Table(
+    'product_staging', staging_metadata,
+    Column('seq', BigInteger), Column('name', String), Column('url', String), Column('img_src', String),
+    Column('packaging', String), Column('category_id', Integer), Column('in_stock', Boolean), Column('price', Float),
+    prefixes=['TEMPORARY'], postgresql_on_commit='DROP',
+)
+Table(
+    'product_staging_changed', staging_metadata,
+    Column('id', Integer, primary_key=True), Column('inserted', Boolean),
+    prefixes=['TEMPORARY'], postgresql_on_commit='DROP',
+)
+Table(
+    'product_staging_prices', staging_metadata,
+    Column('product_id', Integer), Column('price', Float), Column('price_date', Date),
+    prefixes=['TEMPORARY'], postgresql_on_commit='DROP',
+)
 
 
 # TODO рефакторити код, винести в методах "..._bulb" спільний функціонал
@@ -40,6 +78,9 @@ class Shop(Base):
 class Category(Base):
     """ Модель Категорії """
     __tablename__ = "category"
+    __table_args__ = (
+        Index("ix_category_shop_updated_at", "shop_id", "updated_at"),
+    )
 
     name: Mapped[str]
     url: Mapped[str]
@@ -61,21 +102,42 @@ class Category(Base):
 class Product(Base):
     """ Модель Товару """
     __tablename__ = "product"
+    __table_args__ = (
+        # max(updated_at) по категорії / по всіх товарах - валідатори умовних GET, watermark індексації
+        Index("ix_product_category_updated_at", "category_id", "updated_at"),
+        Index("ix_product_updated_at", "updated_at"),
+        # сортування сторінок категорії за метриками цін (Product.update_stats)
+        Index("ix_product_category_below_avg", "category_id", "below_avg_pct"),
+        Index("ix_product_category_above_low", "category_id", "above_low_pct"),
+        Index("ix_product_category_volatility", "category_id", "volatility"),
+    )
     name: Mapped[str]
-    url: Mapped[str | None]
+    url: Mapped[str | None] = mapped_column(unique=True, index=True)  # натуральний ключ для bulk upsert
     img_src: Mapped[str | None]
     packaging: Mapped[str | None] = mapped_column(String(50))
     in_stock: Mapped[bool] = mapped_column(default=False)
     category_id: Mapped[int] = mapped_column(ForeignKey("category.id", ondelete="CASCADE"))
     last_price: Mapped[float | None] = mapped_column(default=0.0, nullable=True)
     price_change: Mapped[float | None] = mapped_column(default=0.0, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(auto_now_add=True)
-    updated_at: Mapped[datetime] = mapped_column(auto_now=True)
+    created_at: Mapped[datetime] = mapped_column(auto_now_add=True, default=func.now())
+    # Метрики цін, рахуються після кожної пачки інжесту (Product.update_stats). Ті, за якими
+    # сортуються сторінки, NOT NULL (0 - немає даних): NULL при DESC опинялись би першими.
+    # Виняток - above_low_pct: 0 означає "на історичному мінімумі", тож без даних - NULL
+    # (у корисному сортуванні, ASC - "найближчі до мінімуму", NULL йдуть останніми)
+    avg_price_30d: Mapped[float | None]
+    below_avg_pct: Mapped[float] = mapped_column(default=0.0, server_default='0')
+    historic_low: Mapped[float | None]
+    above_low_pct: Mapped[float | None]
+    volatility: Mapped[float] = mapped_column(default=0.0, server_default='0')
+    sparkline: Mapped[list[int] | None] = mapped_column(ARRAY(SmallInteger))
+    stats_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    # updated_at - watermark інкрементальної індексації в Elasticsearch, тож оновлюється при кожній зміні
+    updated_at: Mapped[datetime] = mapped_column(auto_now=True, default=func.now(), onupdate=func.now())
 
     # Зв'язок з категорією
     category = relationship("Category", back_populates="products")
     prices = relationship("Price", back_populates="product", cascade="all, delete",
-                          order_by=lambda: desc(Price.updated_at))
+                          order_by=lambda: desc(Price.price_date))
 
     @hybrid_property
     def price(self):
@@ -145,10 +207,16 @@ class Product(Base):
             print(f'price change: {price_change}')
             if isinstance(price_change, float):
                 instance.price_change = price_change
+                instance.last_price = price
 
             # session.add(instance)
             await session.commit()
+            if isinstance(price_change, float):
+                await cls.update_stats([instance.id], session=session)
+                await PriceMover.apply(session, [instance.id])
+                await session.commit()
             await session.refresh(instance)
+        cls.invalidate_caches([dict(category_id=category_id)])
 
         return instance, True
 
@@ -162,67 +230,344 @@ class Product(Base):
         }
 
         if kwargs.get("only_changed"):
-            filter_params = cls._filter_kwargs_by_atribute_(**kwargs)
-            base_query = select(cls).filter_by(**filter_params).filter(*change.get(kwargs["only_changed"]))
-            kwargs.update(base_query=base_query)
+            key = ('only_changed', kwargs["only_changed"])
+            kwargs.update(where=(key, change.get(kwargs["only_changed"])), count_key=key)
             print("kwargs", kwargs)
         elif not kwargs.get("related"):
-            kwargs.update(related='prices')
-
-        if kwargs.get("direction") == "desc" and kwargs.get("ordered"):
-            kwargs.update(ordered=[desc(i) for i in kwargs.get("ordered")])
+            kwargs.update(related='prices', prices_limit=kwargs.get('prices_limit', settings.PRICES_ON_PAGE))
 
-        elif kwargs.get("ordered"):
-            kwargs.update(ordered=kwargs.get("ordered"))
+        # Історію цін вантажимо обмежено (останні N / з дати) окремим запитом для всієї сторінки,
+        # а не повністю через selectinload
+        prices_limit, prices_since = kwargs.get('prices_limit'), kwargs.get('prices_since')
+        related = kwargs.get('related')
+        related = [related, ] if isinstance(related, str) else list(related or [])
+        load_prices = 'prices' in related and bool(prices_limit or prices_since)
+        if load_prices:
+            kwargs.update(related=[i for i in related if i != 'prices'])
 
         # kwargs = {k:v for k,v in kwargs.items() if v is not None}
         print("kwargs", kwargs)
 
         results = await super().filter_by_(**kwargs)
 
+        if load_prices and results['items']:
+            prices = await Price.latest_for_products([i.id for i in results['items']],
+                                                     limit=prices_limit, since=prices_since)
+            for item in results['items']:
+                set_committed_value(item, 'prices', prices[item.id])
+
         return results
 
     @classmethod
-    async def update_or_create_bulb(cls, products: list[dict[str, str | int]]):
-        results_product = await cls.get_or_create_bulb(products)  # returned get and create objects togather
-        print('products', products)
-
-        prices_ = [
-            dict(price=product['price'], product_id=product_.id)
-            for product in products
-            for product_ in results_product
-            if product_.url == product['url']
-        ]
-        only_created = await Price.create_bulb(prices_)
-
-        if only_created:
-            product_ids = [i.product_id for i in only_created]
-            price_map = {i.product_id: i.price for i in only_created}
-            in_stock_map = {i.product_id: True if i.price == 0.0 else False for i in only_created}
-
-            stmt = (
-                update(Product)
-                .filter(Product.id.in_(product_ids))
-                .values(
-                    # Оновлюємо last_price на нову ціну
-                    last_price=case(price_map, value=Product.id),
-                    # Обчислюємо зміну ціни: нова ціна - поточна ціна в базі
-                    price_change=func.round(
-                        (case(price_map, value=Product.id) - func.coalesce(Product.last_price, 0)).cast(Numeric),
-                        2
-                    ),
-                    # оновлюємо статус товару
-                    in_stock=case(in_stock_map, value=Product.id),
-                    updated_at=datetime.now(timezone.utc),
-                )
-                .returning(Product.id)
+    def _modified_columns_(cls) -> tuple:
+        # update_stats не чіпає updated_at (це watermark індексації - перерахунок метрик не має
+        # переіндексовувати товари), але сторінки показують метрики, тож валідатори враховують stats_at
+        return cls.updated_at, cls.stats_at
+
+    @classmethod
+    def _returning_columns_(cls) -> tuple:
+        return (cls.id, cls.name, cls.url, cls.img_src, cls.packaging, cls.in_stock, cls.category_id,
+                cls.last_price, cls.price_change, cls.created_at, cls.updated_at)
+
+    @classmethod
+    def _upsert_stmt_(cls, source):
+        """
+        INSERT ... ON CONFLICT (url) DO UPDATE з джерела з колонками
+        name, url, img_src, packaging, category_id, in_stock (url в джерелі - унікальні)
+        """
+        insert_stmt = pg_insert(cls).from_select(
+            ['name', 'url', 'img_src', 'packaging', 'category_id', 'in_stock',
+             'last_price', 'price_change', 'created_at', 'updated_at'],
+            select(source.c.name, source.c.url, source.c.img_src, source.c.packaging, source.c.category_id,
+                   func.coalesce(source.c.in_stock, False), literal(0.0), literal(0.0), func.now(), func.now()),
+        )
+        excluded = insert_stmt.excluded
+        return insert_stmt.on_conflict_do_update(
+            index_elements=[cls.url],
+            set_=dict(name=excluded.name, img_src=excluded.img_src, packaging=excluded.packaging,
+                      category_id=excluded.category_id, updated_at=func.now()),
+            # не чіпаємо рядок (і не плодимо dead tuples), якщо нічого не змінилось
+            where=tuple_(cls.name, cls.img_src, cls.packaging, cls.category_id).is_distinct_from(
+                tuple_(excluded.name, excluded.img_src, excluded.packaging, excluded.category_id)
+            ),
+        )
+
+    @classmethod
+    def _apply_prices_stmt_(cls, new_prices):
+        """ UPDATE product: last_price / price_change / in_stock з джерела нових цін (product_id, price) """
+        return (
+            update(cls)
+            .where(cls.id == new_prices.c.product_id)
+            .values(
+                # Оновлюємо last_price на нову ціну
+                last_price=new_prices.c.price,
+                # Обчислюємо зміну ціни: нова ціна - поточна ціна в базі
+                price_change=func.round(
+                    (new_prices.c.price - func.coalesce(cls.last_price, 0)).cast(Numeric), 2
+                ),
+                # оновлюємо статус товару
+                in_stock=new_prices.c.price == 0.0,
+                updated_at=func.now(),
             )
-            print('[update_or_create_bulb] stmt:', stmt.compile(compile_kwargs={'literal_binds': True}))
+        )
+
+    @classmethod
+    async def update_stats(cls, product_ids: list[int], session: AsyncSession | None = None) -> int:
+        """
+        Аналітичний етап після пачки інжесту: ряди цін товарів за STATS_WINDOW_DAYS (колонками,
+        через Price.columns_) та історичні мінімуми з місячних агрегатів рахуються в NumPy
+        (shops.stats.price_stats) і записуються одним UPDATE product з параметрів-масивів.
+
+        :param session: сесія з відкритою транзакцією (бачить ще не закомічені ціни пачки);
+                        якщо не передана - відкривається власна
+        :return: кількість оновлених товарів
+        """
+        if session is None:
             async with AsyncSessionLocal() as session:
-                await session.execute(stmt)
+                updated = await cls.update_stats(product_ids, session=session)
                 await session.commit()
+            return updated
+        if not product_ids:
+            return 0
+
+        today = date.today()
+        columns = await Price.columns_(product_ids, date_from=today - timedelta(days=settings.STATS_WINDOW_DAYS),
+                                       session=session)
+        if not columns['price']:
+            return 0
+        product_id = np.frombuffer(columns['product_id'], dtype=np.int32)
+        ids = np.unique(product_id).tolist()
+        result = await session.execute(
+            select(PriceMonthly.product_id, func.min(PriceMonthly.min_price))
+            .where(PriceMonthly.product_id == any_(bindparam('stats_ids', ids, type_=ARRAY(Integer))))
+            .group_by(PriceMonthly.product_id)
+        )
+        lows = dict(result.all())
+        stats = price_stats(
+            product_id,
+            np.frombuffer(columns['date'], dtype=np.int32),
+            np.frombuffer(columns['price'], dtype=np.float64),
+            np.array([lows.get(i, np.nan) for i in ids], dtype=np.float64),
+            today=(today - date(1970, 1, 1)).days,
+            avg_days=settings.STATS_AVG_DAYS,
+            sparkline_points=settings.STATS_SPARKLINE_POINTS,
+        )
+
+        def values(name: str, default: float | None) -> list:
+            return [default if np.isnan(value) else round(value, 4) for value in stats[name].tolist()]
+
+        rows = zip(
+            ids, values('avg_price_30d', None), values('below_avg_pct', 0.0), values('historic_low', None),
+            values('above_low_pct', None), values('volatility', 0.0),
+            # двовимірний масив unnest розгорнув би в один ряд, тож sparkline передається текстом '{..}'
+            ('{%s}' % ','.join(map(str, sparkline.tolist())) for sparkline in stats['sparkline']),
+        )
+        source = unnest_table(
+            dict(id=Integer, avg_price_30d=Float, below_avg_pct=Float, historic_low=Float, above_low_pct=Float,
+                 volatility=Float, sparkline=String),
+            [dict(zip(('id', *STATS_COLUMNS), row)) for row in rows],
+            name='src_stats',
+        )
+        await session.execute(
+            update(cls)
+            .where(cls.id == source.c.id)
+            .values(**{name: source.c[name] for name in STATS_COLUMNS if name != 'sparkline'},
+                    sparkline=cast(source.c.sparkline, ARRAY(SmallInteger)),
+                    stats_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        return len(ids)
+
+    @classmethod
+    async def update_or_create_bulb(cls, products: list[dict[str, str | int]]) -> dict:
+        """
+        Set-based upsert пачки товарів в одній транзакції:
+            1. INSERT ... ON CONFLICT (url) DO UPDATE -- товари (url - натуральний ключ);
+            2. SELECT -- лише для товарів, які не змінились і тому не повернулись з кроку 1;
+            3. INSERT price -- ціна за сьогодні, якщо її ще немає;
+            4. UPDATE product -- last_price / price_change / in_stock для нових цін.
+        Кожен крок - один запит з параметрами-масивами, тож кількість запитів до БД
+        не залежить від розміру пачки.
+
+        :param products: список словників з полями ProductSchemaPOST
+        :return: dict(inserted=..., updated=..., unchanged=..., items=[...])
+        """
+        started = time.perf_counter()
+        rows: dict[str, dict] = {}
+        for product in products:
+            if not product.get('url'):
+                raise ValueError("Invalid objects. Object must have 'url' key")
+            rows[product['url']] = product  # дублікати в пачці: залишається останній
+
+        source = unnest_table(
+            dict(name=String, url=String, img_src=String, packaging=String, category_id=Integer, in_stock=Boolean),
+            list(rows.values()),
+            name='src_product',
+        )
+        upsert_stmt = cls._upsert_stmt_(source).returning(
+            *cls._returning_columns_(), literal_column('(xmax = 0)').label('inserted')
+        )
+
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                # категорії, з яких товари переходять: їхні закешовані сторінки і валідатори теж застаріли
+                result = await session.execute(
+                    select(cls.url, cls.category_id)
+                    .where(cls.url == any_(bindparam('urls', list(rows), type_=ARRAY(String))))
+                )
+                moved_from = {
+                    row.category_id for row in result
+                    if row.category_id is not None and row.category_id != rows[row.url].get('category_id')
+                }
+
+                result = await session.execute(upsert_stmt)
+                items = {row.url: dict(row._mapping) for row in result}
+                inserted = {item['id'] for item in items.values() if item['inserted']}
+                updated = {item['id'] for item in items.values() if not item['inserted']}
+
+                missing = [url for url in rows if url not in items]
+                if missing:
+                    result = await session.execute(
+                        select(*cls._returning_columns_())
+                        .where(cls.url == any_(bindparam('urls', missing, type_=ARRAY(String))))
+                    )
+                    items.update({row.url: dict(row._mapping, inserted=False) for row in result})
+
+                prices_ = [dict(price=rows[url].get('price') or 0.0, product_id=item['id']) for url, item in items.items()]
+                only_created = await Price.create_bulb(prices_, session=session)
+
+                if only_created:
+                    new_prices = unnest_table(
+                        dict(product_id=Integer, price=Float),
+                        [dict(row._mapping) for row in only_created],
+                        name='src_price',
+                    )
+                    stmt = cls._apply_prices_stmt_(new_prices).returning(*cls._returning_columns_())
+                    result = await session.execute(stmt)
+                    for row in result:
+                        items[row.url].update(row._mapping)
+                        if row.price_change and row.id not in inserted:
+                            updated.add(row.id)
+                    await cls.update_stats([row.product_id for row in only_created], session=session)
+                    await PriceMover.apply(session, [row.product_id for row in only_created])
 
-        return results_product
+        for url, item in items.items():
+            item['price'] = rows[url].get('price') or 0.0
+            item.pop('inserted')
+
+        cls.invalidate_caches(list(items.values()) + [dict(category_id=i) for i in moved_from])
+        report = dict(
+            inserted=len(inserted),
+            updated=len(updated),
+            unchanged=len(items) - len(inserted) - len(updated),
+        )
+        logger.debug(f'[update_or_create_bulb] {report}')
+        observe_ingest('bulk', len(rows), time.perf_counter() - started, report)
+        return dict(**report, items=[items[url] for url in rows])
+
+    @classmethod
+    async def update_or_create_copy(cls, chunks: AsyncIterator[list[tuple]],
+                                    on_changed: Callable[[list[dict]], Awaitable] | None = None) -> dict:
+        """
+        Upsert необмеженої кількості товарів через COPY:
+            1. пачки рядків (STAGING_COLUMNS) з `chunks` - COPY у тимчасову таблицю product_staging;
+            2. ті самі кроки, що й update_or_create_bulb, але одним SQL-запитом кожен і з
+               джерелом - staging-таблицею (для дублікатів url береться останній рядок).
+        Результати кроків теж пишуться в тимчасові таблиці, а не повертаються в Python,
+        тож памʼять не залежить від кількості товарів. Все в одній транзакції.
+
+        :param on_changed: async callback, отримує пачками нові та змінені товари (до commit)
+        :return: dict(received=..., inserted=..., updated=..., unchanged=..., prices_created=...)
+        """
+        started = time.perf_counter()
+        staging, changed, new_prices = (staging_metadata.tables[name] for name in (
+            'product_staging', 'product_staging_changed', 'product_staging_prices'))
+
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                conn = await session.connection()
+                await conn.run_sync(staging_metadata.create_all)
+                raw = (await conn.get_raw_connection()).driver_connection
+                received = 0
+                async for chunk in chunks:
+                    await raw.copy_records_to_table(staging.name, records=chunk, columns=STAGING_COLUMNS)
+                    received += len(chunk)
+
+                source = (
+                    select(staging)
+                    .distinct(staging.c.url)
+                    .order_by(staging.c.url, staging.c.seq.desc())
+                    .subquery('src_product')
+                )
+                upserted = cls._upsert_stmt_(source).returning(
+                    cls.id, literal_column('(xmax = 0)').label('inserted')
+                ).cte('upserted')
+                await session.execute(
+                    insert(changed).from_select(['id', 'inserted'], select(upserted.c.id, upserted.c.inserted))
+                )
+
+                prices = (
+                    select(cls.id.label('product_id'), func.coalesce(source.c.price, 0.0).label('price'))
+                    .join(source, source.c.url == cls.url)
+                    .subquery('src_price')
+                )
+                created = Price._create_stmt_(prices).returning(
+                    Price.product_id, Price.price, Price.price_date
+                ).cte('created_prices')
+                await session.execute(
+                    insert(new_prices).from_select(['product_id', 'price', 'price_date'],
+                                                   select(created.c.product_id, created.c.price, created.c.price_date))
+                )
+                for rollup in PRICE_ROLLUPS.values():
+                    await rollup.apply_source(session, new_prices)
+
+                price_updated = cls._apply_prices_stmt_(new_prices).returning(cls.id, cls.price_change).cte('price_updated')
+                await session.execute(
+                    pg_insert(changed)
+                    .from_select(['id', 'inserted'],
+                                 select(price_updated.c.id, false()).where(price_updated.c.price_change != 0))
+                    .on_conflict_do_nothing()
+                )
+
+                stats_ids = array('i')
+                result = await session.stream(
+                    select(new_prices.c.product_id).execution_options(yield_per=settings.STATS_BATCH_SIZE)
+                )
+                async for rows in result.scalars().partitions(settings.STATS_BATCH_SIZE):
+                    stats_ids.extend(rows)
+                for start in range(0, len(stats_ids), settings.STATS_BATCH_SIZE):
+                    await cls.update_stats(stats_ids[start:start + settings.STATS_BATCH_SIZE].tolist(), session=session)
+                await PriceMover.apply_source(session, new_prices)
+
+                inserted, updated = (await session.execute(
+                    select(func.count().filter(changed.c.inserted), func.count().filter(~changed.c.inserted))
+                )).one()
+                products, prices_created = (await session.execute(
+                    select(select(func.count(staging.c.url.distinct())).scalar_subquery(),
+                           select(func.count()).select_from(new_prices).scalar_subquery())
+                )).one()
+                categories = (await session.execute(select(staging.c.category_id.distinct()))).scalars().all()
+
+                if on_changed is not None:
+                    result = await session.stream(
+                        select(*cls._returning_columns_())
+                        .join(changed, changed.c.id == cls.id)
+                        .execution_options(yield_per=settings.ES_BATCH_SIZE)
+                    )
+                    async for rows in result.partitions(settings.ES_BATCH_SIZE):
+                        await on_changed([dict(row._mapping) for row in rows])
+
+        cls.invalidate_caches([dict(category_id=i) for i in categories])
+        report = dict(
+            received=received,
+            inserted=inserted,
+            updated=updated,
+            unchanged=products - inserted - updated,
+            prices_created=prices_created,
+        )
+        logger.debug(f'[update_or_create_copy] {report}')
+        observe_ingest('copy', received, time.perf_counter() - started, report)
+        return report
 
     @hybrid_property
     def lower_name(self):
@@ -232,11 +577,32 @@ class Product(Base):
         return f"{self.name}"
 
 
+price_partitions = MonthlyPartitionManager(
+    "price",
+    "price_date",
+    months_ahead=settings.PRICE_PARTITIONS_AHEAD,
+    retention_months=settings.PRICE_RETENTION_MONTHS,
+    expired=settings.PRICE_EXPIRED_PARTITIONS,
+)
+
+
 class Price(Base):
+    """
+    Історія цін. Таблиця секціонована по місяцях за `price_date` (дата `created_at`),
+    секціями керує `price_partitions`. Запити з умовою на `price_date` зачіпають лише
+    потрібні секції, тому фільтри по даті пишемо саме по ній.
+    """
     __tablename__ = "price"
+    __table_args__ = (
+        # одна ціна на товар за день; "вже є ціна за сьогодні" - пошук по індексу
+        Index("uq_price_product_date", "product_id", "price_date", unique=True),
+        {"postgresql_partition_by": "RANGE (price_date)"},
+    )
 
     price: Mapped[float]
     product_id: Mapped[int] = mapped_column(ForeignKey("product.id", ondelete="CASCADE"))
+    # ключ секціонування має входити в primary key та унікальні індекси
+    price_date: Mapped[date] = mapped_column(Date, primary_key=True, server_default=func.current_date())
 
 
     # Зв'язок з категорією
@@ -244,82 +610,510 @@ class Price(Base):
 
     @classmethod
     async def get_or_create(cls, price: float, product_id: int | Mapped[int]) -> tuple[Base, bool or float]:
-        tody = datetime.today().date()
         async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Price).filter(
-                and_(
-                    cast(Price.created_at, Date) == tody,
-                    Price.product_id == product_id
-                )
-            ))
-            instance = result.scalars().first()
-            if instance:
-                change_price = False
-            else:
-                last_price = await session.execute(
-                    select(Price).filter(Price.product_id == product_id).order_by(desc('created_at'))
-                )
-                last_price = last_price.scalars().first()
+            # остання ціна денормалізована в product.last_price - не треба обходити всі секції price
+            last_price = await session.execute(select(Product.last_price).filter(Product.id == product_id))
+            last_price = last_price.scalar()
 
-                if last_price:
+            result = await session.execute(
+                pg_insert(cls)
+                .values(price=price, product_id=product_id)
+                .on_conflict_do_nothing(index_elements=['product_id', 'price_date'])
+                .returning(cls)
+            )
+            instance = result.scalar()
+            if instance:
+                await PriceRollup.apply_all(session, [
+                    dict(product_id=instance.product_id, price=instance.price, price_date=instance.price_date)
+                ])
+                if last_price is not None:
                     change_price = abs(
-                        round(price - last_price.price, 2)
+                        round(price - last_price, 2)
                     )
                 else:
                     change_price = price
-                instance = cls(price=price, product_id=product_id)
-                session.add(instance)
                 await session.commit()
-                await session.refresh(instance)
+            else:
+                change_price = False
+                result = await session.execute(select(Price).filter(
+                    Price.product_id == product_id,
+                    Price.price_date == func.current_date(),
+                ))
+                instance = result.scalar()
 
         return instance, change_price
 
-    @staticmethod
-    async def get_price_differences(session: AsyncSessionLocal, product_ids) -> dict[int, float]:
-        # Підзапит для отримання останніх двох записів по кожному продукту
-        subquery = (
-            select(Price)
-            .where(Price.product_id.in_(product_ids))
-            .order_by(desc(Price.updated_at))
-            .limit(2)  # Отримати лише два записи
-            .subquery()
-        )
+    @classmethod
+    def _latest_source_(cls, product_ids: list[int], limit: int | None = None, since: date | None = None):
+        """ (ids, latest): unnest(:ids) та LATERAL з останніми цінами кожного товару """
+        ids = unnest_table(dict(id=Integer), [dict(id=i) for i in product_ids], name='ids')
+        latest = select(cls).where(cls.product_id == ids.c.id).order_by(desc(cls.price_date))
+        if since:
+            latest = latest.where(cls.price_date >= since)
+        if limit:
+            latest = latest.limit(limit)
+        return ids, latest.lateral('latest')
+
+    @classmethod
+    async def latest_for_products(cls, product_ids: list[int], limit: int | None = None,
+                                  since: date | None = None,
+                                  session: AsyncSession | None = None) -> dict[int, list["Price"]]:
+        """
+        Останні `limit` цін та/або ціни з дати `since` для сторінки товарів одним запитом:
+            SELECT ... FROM unnest(:ids) AS ids(id)
+            JOIN LATERAL (SELECT ... FROM price WHERE product_id = ids.id ORDER BY price_date DESC LIMIT :limit)
+        Кожен LATERAL підзапит йде по індексу (product_id, price_date) і зупиняється після `limit` рядків,
+        а умова по `since` відсікає непотрібні секції таблиці.
+
+        :return: {product_id: [Price, ...]} від нових до старих
+        """
+        ids, latest = cls._latest_source_(product_ids, limit, since)
+        price_alias = aliased(cls, latest)
+        stmt = select(price_alias).select_from(ids).join(latest, true())
+
+        if session is not None:
+            result = await session.execute(stmt)
+        else:
+            async with AsyncSessionLocal.reader() as session:
+                result = await session.execute(stmt)
+
+        prices = {product_id: [] for product_id in product_ids}
+        for price in result.scalars():
+            prices[price.product_id].append(price)
+        return prices
 
-        # Аліас для підзапиту
-        price_alias = aliased(Price, subquery)
+    @classmethod
+    async def series(cls, product_ids: list[int], limit: int | None = None, since: date | None = None) -> dict:
+        """
+        Компактні ряди цін для графіків кількох товарів одним запитом (той самий LATERAL, що й
+        latest_for_products, але без ORM-обʼєктів - лише кортежі product_id, price_date, price).
+        Дати - зміщення в днях від спільної `base`, ціни - масив float; точки від старих до нових.
+
+        :return: dict(base=date | None, items={product_id: dict(days=[...], prices=[...])})
+        """
+        ids, latest = cls._latest_source_(product_ids, limit, since)
         stmt = (
-            select(price_alias.product_id, price_alias.price)
-            .order_by(price_alias.product_id, desc(price_alias.updated_at))
+            select(latest.c.product_id, latest.c.price_date, latest.c.price)
+            .select_from(ids)
+            .join(latest, true())
+            .order_by(latest.c.product_id, latest.c.price_date)
         )
-        print(f"stmt:{stmt.compile(compile_kwargs={'literal_binds': True})}")
+        async with AsyncSessionLocal.reader() as session:
+            rows = (await session.execute(stmt)).all()
+
+        base = min((price_date for _, price_date, _ in rows), default=None)
+        items = {product_id: dict(days=[], prices=[]) for product_id in product_ids}
+        for product_id, price_date, price in rows:
+            items[product_id]['days'].append((price_date - base).days)
+            items[product_id]['prices'].append(price)
+        return dict(base=base, items=items)
+
+    @classmethod
+    async def columns_(cls, product_ids: list[int] | None = None, category_id: int | None = None,
+                       shop_id: int | None = None, date_from: date | None = None,
+                       date_to: date | None = None, session: AsyncSession | None = None,
+                       limit: int | None = None) -> dict[str, array]:
+        """
+        Ціни товарів / категорії / магазину колонками для аналітики: паралельні масиви
+        product_id (int32), date (дні від 1970-01-01, int32) та price (float64), відсортовані
+        по (product_id, date). Рядки читаються потоком пачками по SERIES_FETCH_SIZE кортежів,
+        без ORM-обʼєктів; дата переводиться в число ще в SQL.
+
+        :param limit: максимум рядків - масиви тримаються в памʼяті цілком
+        """
+        days = type_coerce(cls.price_date - literal(date(1970, 1, 1), Date), Integer)
+        stmt = select(cls.product_id, days, cls.price).order_by(cls.product_id, cls.price_date)
+        if product_ids:
+            stmt = stmt.where(cls.product_id == any_(bindparam('product_ids', product_ids, type_=ARRAY(Integer))))
+        if category_id is not None or shop_id is not None:
+            stmt = stmt.join(Product, Product.id == cls.product_id)
+        if category_id is not None:
+            stmt = stmt.where(Product.category_id == category_id)
+        if shop_id is not None:
+            stmt = stmt.join(Category, Category.id == Product.category_id).where(Category.shop_id == shop_id)
+        # умови саме по price_date - зачіпаються лише потрібні секції
+        if date_from:
+            stmt = stmt.where(cls.price_date >= date_from)
+        if date_to:
+            stmt = stmt.where(cls.price_date <= date_to)
+        if limit is not None:
+            stmt = stmt.limit(limit)
 
-        # Основний запит
-        result = await session.execute(stmt)
-        return result
+        if session is None:
+            async with AsyncSessionLocal.reader() as session:
+                return await cls.columns_(product_ids, category_id, shop_id, date_from, date_to,
+                                          session=session, limit=limit)
+
+        columns = dict(product_id=array('i'), date=array('i'), price=array('d'))
+        result = await session.stream(stmt.execution_options(yield_per=settings.SERIES_FETCH_SIZE))
+        async for partition in result.partitions():
+            product_ids_, days_, prices_ = zip(*partition)
+            columns['product_id'].extend(product_ids_)
+            columns['date'].extend(days_)
+            columns['price'].extend(prices_)
+        return columns
+
+    @classmethod
+    async def get_price_differences(cls, product_ids: list[int],
+                                    session: AsyncSession | None = None) -> dict[int, float]:
+        """ Різниця між двома останніми цінами кожного товару (0.0, якщо ціна лише одна) """
+        latest = await cls.latest_for_products(product_ids, limit=2, session=session)
+        return {
+            product_id: round(prices[0].price - prices[1].price, 2) if len(prices) > 1 else 0.0
+            for product_id, prices in latest.items()
+            if prices
+        }
+
+    @classmethod
+    def _create_stmt_(cls, source):
+        """ INSERT ціни за сьогодні з джерела (product_id, price), якщо її ще немає """
+        return (
+            pg_insert(cls)
+            .from_select(
+                ['product_id', 'price', 'created_at', 'updated_at'],
+                select(source.c.product_id, source.c.price, func.now(), func.now())
+            )
+            .on_conflict_do_nothing(index_elements=['product_id', 'price_date'])
+        )
 
     @classmethod
-    async def create_bulb(cls, prices: list) -> list["Price"]:
-        """ Return  only created objects """
+    async def create_bulb(cls, prices: list[dict], session: AsyncSession | None = None) -> list:
+        """
+        Додає ціни за сьогодні для товарів, у яких їх ще немає, одним запитом.
+        Return only created rows (product_id, price).
+
+        :param session: сесія з відкритою транзакцією; якщо не передана - відкривається власна
+        """
+        source = unnest_table(dict(product_id=Integer, price=Float), prices, name='src_price_new')
+        stmt = cls._create_stmt_(source).returning(cls.product_id, cls.price, cls.price_date)
 
-        today = datetime.today().date()
-        product_list = [i['product_id'] for i in prices]
+        if session is not None:
+            result = await session.execute(stmt)
+            created = result.all()
+            await PriceRollup.apply_all(session, [dict(row._mapping) for row in created])
+            return created
 
         async with AsyncSessionLocal() as session:
-            # збираємо по списку додані сьогодні
-            result = await session.execute(
-                select(Price.product_id)
-                .filter(cast(Price.created_at, Date) == today, )
-                .where(Price.product_id.in_(product_list))
+            result = await session.execute(stmt)
+            created = result.all()
+            await PriceRollup.apply_all(session, [dict(row._mapping) for row in created])
+            await session.commit()
+        return created
+
+    @classmethod
+    async def history(cls, product_id: int, resolution: str | None = None,
+                      date_from: date | None = None, date_to: date | None = None) -> dict:
+        """
+        Історія цін товару за період з потрібною деталізацією.
+        Якщо `resolution` не задано - береться найдетальніша з day/week/month,
+        за якої кількість точок не перевищує settings.HISTORY_MAX_POINTS.
+
+        :return: dict(product_id=..., resolution=..., date_from=..., date_to=..., items=[...])
+        """
+        date_to = date_to or date.today()
+        async with AsyncSessionLocal.reader() as session:
+            if date_from is None:
+                # початок історії - з місячних агрегатів, це один рядок на місяць
+                result = await session.execute(
+                    select(func.min(PriceMonthly.first_date)).where(PriceMonthly.product_id == product_id)
+                )
+                date_from = result.scalar() or date_to
+
+            if resolution is None:
+                days = (date_to - date_from).days + 1
+                resolution = next(
+                    (name for name, period_days in PRICE_RESOLUTION_DAYS.items()
+                     if days / period_days <= settings.HISTORY_MAX_POINTS),
+                    'month'
+                )
+
+            if resolution == 'day':
+                stmt = (
+                    select(cls.price_date.label('date'), cls.price.label('open'), cls.price.label('close'),
+                           cls.price.label('min'), cls.price.label('max'), cls.price.label('avg'))
+                    .where(cls.product_id == product_id, cls.price_date.between(date_from, date_to))
+                    .order_by(cls.price_date)
+                )
+            else:
+                rollup = PRICE_ROLLUPS[resolution]
+                stmt = (
+                    select(rollup.period_start.label('date'), rollup.open_price.label('open'),
+                           rollup.close_price.label('close'), rollup.min_price.label('min'),
+                           rollup.max_price.label('max'), rollup.avg_price.label('avg'))
+                    .where(rollup.product_id == product_id,
+                           rollup.period_start.between(rollup.period_of(date_from), date_to))
+                    .order_by(rollup.period_start)
+                )
+            result = await session.execute(stmt)
+            items = [dict(row._mapping) for row in result]
+
+        return dict(product_id=product_id, resolution=resolution, date_from=date_from, date_to=date_to, items=items)
+
+
+class PriceRollup(Base):
+    """
+    Агрегати цін товару за період: перша/остання/мін/макс/середня ціна.
+    Оновлюються інкрементно з кожною новою ціною (`apply`), `rebuild` перераховує з таблиці price.
+    """
+    __abstract__ = True
+    period = None  # аргумент date_trunc: week | month
+
+    product_id: Mapped[int] = mapped_column(ForeignKey("product.id", ondelete="CASCADE"))
+    period_start: Mapped[date] = mapped_column(Date)
+    open_price: Mapped[float]
+    close_price: Mapped[float]
+    min_price: Mapped[float]
+    max_price: Mapped[float]
+    sum_price: Mapped[float]
+    prices_count: Mapped[int]
+    first_date: Mapped[date] = mapped_column(Date)
+    last_date: Mapped[date] = mapped_column(Date)
+
+    @declared_attr.directive
+    def __table_args__(cls):
+        return (Index(f"uq_{cls.__tablename__}_product_period", "product_id", "period_start", unique=True),)
+
+    @hybrid_property
+    def avg_price(self):
+        return self.sum_price / self.prices_count
+
+    @classmethod
+    def period_of(cls, day: date):
+        return cast(func.date_trunc(cls.period, day), Date)
+
+    @classmethod
+    def _aggregate_(cls, source):
+        """ Агрегує рядки (product_id, price, price_date) джерела по товару та періоду """
+        period_start = cast(func.date_trunc(cls.period, source.c.price_date), Date)
+        return (
+            select(
+                source.c.product_id,
+                period_start,
+                array_agg(aggregate_order_by(source.c.price, source.c.price_date.asc()))[1],
+                array_agg(aggregate_order_by(source.c.price, source.c.price_date.desc()))[1],
+                func.min(source.c.price),
+                func.max(source.c.price),
+                func.sum(source.c.price),
+                func.count(),
+                func.min(source.c.price_date),
+                func.max(source.c.price_date),
             )
-            existing_prices = result.scalars().all()
-
-            # обʼєкти які треба створити
-            to_create = [
-                Price(product_id=price_['product_id'], price=price_['price'], created_at=datetime.now(timezone.utc))
-                for price_ in prices
-                if price_['product_id'] not in existing_prices
-            ]
-            session.add_all(to_create)
+            .group_by(source.c.product_id, period_start)
+        )
+
+    @classmethod
+    def _insert_(cls, source):
+        return pg_insert(cls).from_select(
+            ['product_id', 'period_start', 'open_price', 'close_price', 'min_price', 'max_price',
+             'sum_price', 'prices_count', 'first_date', 'last_date'],
+            cls._aggregate_(source),
+        )
+
+    @classmethod
+    async def apply(cls, session: AsyncSession, prices: list[dict]):
+        """ Додає нові ціни {product_id, price, price_date} до агрегатів """
+        if not prices:
+            return
+        source = unnest_table(dict(product_id=Integer, price=Float, price_date=Date),
+                              prices, name=f'src_{cls.__tablename__}')
+        await cls.apply_source(session, source)
+
+    @classmethod
+    async def apply_source(cls, session: AsyncSession, source):
+        """ Додає до агрегатів нові ціни з джерела (таблиці/підзапиту) з колонками product_id, price, price_date """
+        stmt = cls._insert_(source)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['product_id', 'period_start'],
+            set_=dict(
+                open_price=case((excluded.first_date < cls.first_date, excluded.open_price), else_=cls.open_price),
+                close_price=case((excluded.last_date >= cls.last_date, excluded.close_price), else_=cls.close_price),
+                min_price=func.least(cls.min_price, excluded.min_price),
+                max_price=func.greatest(cls.max_price, excluded.max_price),
+                sum_price=cls.sum_price + excluded.sum_price,
+                prices_count=cls.prices_count + excluded.prices_count,
+                first_date=func.least(cls.first_date, excluded.first_date),
+                last_date=func.greatest(cls.last_date, excluded.last_date),
+                updated_at=func.now(),
+            ),
+        )
+        await session.execute(stmt)
+
+    @classmethod
+    async def apply_all(cls, session: AsyncSession, prices: list[dict]):
+        for rollup in PRICE_ROLLUPS.values():
+            await rollup.apply(session, prices)
+
+    @classmethod
+    async def rebuild(cls, product_ids: list[int] | None = None):
+        """ Перераховує агрегати з таблиці price (всі або для вказаних товарів) """
+        source = select(Price.product_id, Price.price, Price.price_date)
+        if product_ids:
+            source = source.where(Price.product_id == any_(bindparam('product_ids', product_ids,
+                                                                       type_=ARRAY(Integer))))
+        source = source.subquery()
+
+        async with AsyncSessionLocal() as session:
+            for rollup in PRICE_ROLLUPS.values():
+                stmt = rollup._insert_(source)
+                excluded = stmt.excluded
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['product_id', 'period_start'],
+                    set_={name: excluded[name] for name in (
+                        'open_price', 'close_price', 'min_price', 'max_price',
+                        'sum_price', 'prices_count', 'first_date', 'last_date')} | dict(updated_at=func.now()),
+                )
+                await session.execute(stmt)
+            await session.commit()
+
+
+class PriceWeekly(PriceRollup):
+    __tablename__ = "price_weekly"
+    period = "week"
+
+
+class PriceMonthly(PriceRollup):
+    __tablename__ = "price_monthly"
+    period = "month"
+
+
+PRICE_ROLLUPS: dict[str, type[PriceRollup]] = {"week": PriceWeekly, "month": PriceMonthly}
+PRICE_RESOLUTION_DAYS = {"day": 1, "week": 7, "month": 30}
+
+
+class PriceMover(Base):
+    """
+    Лідерборди найбільших змін цін ("подешевшали" / "подорожчали") по магазину, категорії та
+    глобально, за абсолютною та відсотковою зміною. Рядок - товар з ненульовою зміною відносно
+    попередньої ціни (нові товари без попередньої ціни сюди не потрапляють); shop_id денормалізований.
+    Оновлюється разом з цінами кожної пачки інжесту (`apply`), топ-N - зворотний/прямий обхід
+    індексу (scope, зміна, product_id) з LIMIT, без сканування product та count.
+    """
+    __tablename__ = "price_mover"
+    __table_args__ = tuple(
+        Index(f"ix_price_mover_{name}", *scope, metric, "product_id")
+        for name, scope, metric in (
+            ("change", (), "price_change"), ("pct", (), "change_pct"),
+            ("shop_change", ("shop_id",), "price_change"), ("shop_pct", ("shop_id",), "change_pct"),
+            ("category_change", ("category_id",), "price_change"), ("category_pct", ("category_id",), "change_pct"),
+        )
+    ) + (
+        # max(updated_at) - валідатор умовних GET сторінки лідерборду
+        Index("ix_price_mover_updated_at", "updated_at"),
+    )
+
+    product_id: Mapped[int] = mapped_column(ForeignKey("product.id", ondelete="CASCADE"), unique=True)
+    shop_id: Mapped[int]
+    category_id: Mapped[int]
+    last_price: Mapped[float]
+    price_change: Mapped[float]
+    change_pct: Mapped[float]
+
+    SCOPES = {"global": None, "shop": "shop_id", "category": "category_id"}
+    METRICS = {"abs": "price_change", "pct": "change_pct"}
+    DIRECTIONS = ("cheaper", "expensive")
+
+    @classmethod
+    def leaderboard_for(cls, only_changed: str | None, ordered: str | None, direction: str | None) -> dict | None:
+        """
+        Аргументи `top_products` для сторінки товарів з фільтром only_changed / ordered / direction,
+        якщо її віддає глобальний лідерборд; None - сторінці потрібне сканування product
+        """
+        if (only_changed in cls.DIRECTIONS and ordered in (None, 'price_change', 'change_pct')
+                and direction in (None, 'asc', 'desc')):
+            return dict(direction=only_changed, metric='pct' if ordered == 'change_pct' else 'abs', order=direction)
+        return None
+
+    @classmethod
+    def _movers_(cls, product_filter):
+        """ SELECT рядків лідербордів з product для товарів, що проходять `product_filter` """
+        previous_price = Product.last_price - Product.price_change
+        return (
+            select(Product.id, Category.shop_id, Product.category_id, Product.last_price, Product.price_change,
+                   func.round(cast(Product.price_change / previous_price * 100, Numeric), 2))
+            .join(Category, Category.id == Product.category_id)
+            .where(product_filter, Product.price_change != 0, Product.last_price > 0, previous_price > 0)
+        )
+
+    @classmethod
+    async def _apply_(cls, session: AsyncSession, product_filter) -> int:
+        await session.execute(delete(cls).where(cls.product_id.in_(select(Product.id).where(product_filter))))
+        result = await session.execute(
+            insert(cls).from_select(
+                ['product_id', 'shop_id', 'category_id', 'last_price', 'price_change', 'change_pct'],
+                cls._movers_(product_filter),
+            )
+        )
+        return result.rowcount
+
+    @classmethod
+    async def apply(cls, session: AsyncSession, product_ids: list[int]):
+        """ Перераховує рядки лідербордів товарів з новими цінами (після UPDATE product) """
+        if product_ids:
+            await cls._apply_(session, Product.id == any_(bindparam('mover_ids', product_ids, type_=ARRAY(Integer))))
+
+    @classmethod
+    async def apply_source(cls, session: AsyncSession, source):
+        """ Те саме для товарів з джерела (таблиці/підзапиту) з колонкою product_id """
+        await cls._apply_(session, Product.id.in_(select(source.c.product_id)))
+
+    @classmethod
+    async def rebuild(cls) -> int:
+        """ Перебудова з таблиці product (після міграції або ручних змін цін) """
+        async with AsyncSessionLocal() as session:
+            movers = await cls._apply_(session, true())
             await session.commit()
-        print(f'PRICE+> {to_create}')
-        return to_create
+        return movers
+
+    @classmethod
+    def _top_(cls, stmt, scope: str = "global", scope_id: int | None = None, direction: str = "expensive",
+              metric: str = "abs", limit: int = 20, offset: int = 0, order: str | None = None):
+        """
+        Фільтр і порядок лідерборду для запиту, що вже містить price_mover.
+        `order` - asc / desc за значенням зміни; None - від найбільшої зміни в напрямку `direction`
+        """
+        if scope not in cls.SCOPES or metric not in cls.METRICS or direction not in cls.DIRECTIONS:
+            raise ValueError(f"Unsupported leaderboard: {scope}/{direction}/{metric}")
+        if order not in (None, "asc", "desc"):
+            raise ValueError(f"Unsupported order: {order}")
+        if cls.SCOPES[scope]:
+            if scope_id is None:
+                raise ValueError(f"'{scope}' leaderboard requires scope id")
+            stmt = stmt.where(getattr(cls, cls.SCOPES[scope]) == scope_id)
+        column = getattr(cls, cls.METRICS[metric])
+        stmt = stmt.where(column < 0 if direction == "cheaper" else column > 0)
+        if order is None:
+            order = "asc" if direction == "cheaper" else "desc"
+        # обидва порядки - прямий чи зворотний обхід того самого індексу
+        if order == "asc":
+            stmt = stmt.order_by(column, cls.product_id)
+        else:
+            stmt = stmt.order_by(column.desc(), cls.product_id.desc())
+        return stmt.limit(limit).offset(offset)
+
+    @classmethod
+    async def top(cls, **kwargs) -> list[dict]:
+        """ Топ товарів лідерборду (аргументи - як у `_top_`) """
+        stmt = cls._top_(
+            select(cls.product_id, Product.name, Product.url, Product.img_src, cls.shop_id, cls.category_id,
+                   cls.last_price, cls.price_change, cls.change_pct)
+            .join(Product, Product.id == cls.product_id),
+            **kwargs,
+        )
+        async with AsyncSessionLocal.reader() as session:
+            result = await session.execute(stmt)
+            return [dict(row._mapping) for row in result]
+
+    @classmethod
+    async def top_products(cls, related: list[str] | None = None, limit: int = 20, offset: int = 0,
+                           **kwargs) -> dict:
+        """ Сторінка лідерборду обʼєктами Product - у форматі результату filter_by_ (без count) """
+        stmt = cls._top_(select(Product).join(cls, cls.product_id == Product.id),
+                         limit=limit + 1, offset=offset, **kwargs)
+        if related:
+            stmt = stmt.options(*Product.validate_relationships(related))
+        async with AsyncSessionLocal.reader() as session:
+            result = await session.execute(stmt)
+            items = result.scalars().all()
+        return dict(page=offset // limit + 1, page_size=limit, total_items=None, total_pages=None,
+                    items=items[:limit], has_more=len(items) > limit, next=None, prev=None)
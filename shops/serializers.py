@@ -1,6 +1,6 @@
 from pydantic import BaseModel, computed_field, field_serializer, Field
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Literal
+from datetime import datetime, date
 from settings.config import settings
 
 
@@ -60,6 +60,28 @@ class ProductSchemaGET(ProductSchemaPOST):
     updated_at: Optional[datetime] = None
 
 
+class ProductBulkSchemaGET(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    items: List[ProductSchemaGET]
+
+
+class IngestErrorSchemaGET(BaseModel):
+    line: int
+    error: str
+
+
+class ProductStreamSchemaGET(BaseModel):
+    received: int
+    rejected: int
+    inserted: int
+    updated: int
+    unchanged: int
+    prices_created: int
+    errors: List[IngestErrorSchemaGET]
+
+
 class PriceSchemaGET(BaseModel):
     id: int
     price: float | None = None
@@ -81,8 +103,53 @@ class ProductPricesSchemaGET(BaseModel):
     in_stock: bool
     prices: List[PriceSchemaGET]
     category_id: int
+    avg_price_30d: Optional[float] = None
+    below_avg_pct: float = 0.0
+    historic_low: Optional[float] = None
+    above_low_pct: Optional[float] = None
+    volatility: float = 0.0
+    sparkline: Optional[List[int]] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+class PriceHistoryPointSchemaGET(BaseModel):
+    date: date
+    open: float
+    close: float
+    min: float
+    max: float
+    avg: float
+
+
+class PriceHistorySchemaGET(BaseModel):
+    product_id: int
+    resolution: Literal['day', 'week', 'month']
+    date_from: date
+    date_to: date
+    items: List[PriceHistoryPointSchemaGET]
+
+
+class PriceSeriesSchemaGET(BaseModel):
+    days: List[int]
+    prices: List[float]
+
+
+class PriceChartsSchemaGET(BaseModel):
+    base: date | None
+    items: dict[int, PriceSeriesSchemaGET]
+
+
+class PriceMoverSchemaGET(BaseModel):
+    product_id: int
+    name: str
+    url: Optional[str] = None
+    img_src: Optional[str] = None
+    shop_id: int
+    category_id: int
+    last_price: float
+    price_change: float
+    change_pct: float
@@ -0,0 +1,63 @@
+import numpy as np
+
+# Значення, що записуються в Product (порядок - як у результаті price_stats)
+STATS_COLUMNS = ('avg_price_30d', 'below_avg_pct', 'historic_low', 'above_low_pct', 'volatility', 'sparkline')
+
+
+def price_stats(product_id: np.ndarray, day: np.ndarray, price: np.ndarray, low: np.ndarray, today: int,
+                avg_days: int = 30, sparkline_points: int = 30) -> dict[str, np.ndarray | list[np.ndarray]]:
+    """
+    Метрики товарів з рядів цін, відсортованих по (product_id, day), без циклу по товарах:
+        avg_price_30d - середня ціна за останні `avg_days` днів;
+        below_avg_pct - наскільки остання ціна нижча за цю середню, % (відʼємне - дорожче);
+        historic_low / above_low_pct - історичний мінімум (`low`, з місячних агрегатів) і
+            наскільки остання ціна вища за нього, %; ціни <= 0 (ціни немає) в мінімум не входять,
+            для такої останньої ціни above_low_pct - NaN;
+        volatility - стандартне відхилення змін ціни між сусідніми точками, %;
+        sparkline - останні `sparkline_points` цін, масштабовані в 0..100 (int16).
+
+    :param low: історичний мінімум для кожного з np.unique(product_id), NaN або <= 0 - невідомий
+    :param today: день (від 1970-01-01), від якого рахується вікно середньої
+    :return: dict(id=..., **{column: масив по товарах}); NaN - метрику порахувати неможливо
+    """
+    ids, starts, counts = np.unique(product_id, return_index=True, return_counts=True)
+    size = len(ids)
+    segment = np.repeat(np.arange(size), counts)
+    ends = starts + counts - 1
+    last = price[ends]
+
+    recent = (day > today - avg_days).astype(np.float64)
+    recent_count = np.bincount(segment, weights=recent, minlength=size)
+    recent_sum = np.bincount(segment, weights=price * recent, minlength=size)
+    avg = np.divide(recent_sum, recent_count, out=np.full(size, np.nan), where=recent_count > 0)
+    below_avg = np.divide(avg - last, avg, out=np.full(size, np.nan), where=avg > 0) * 100
+
+    # fmin пропускає NaN: нульові ціни не стають "історичним мінімумом"
+    positive = np.where(price > 0, price, np.nan)
+    low = np.fmin(np.where(low > 0, low, np.nan), np.fmin.reduceat(positive, starts))
+    above_low = np.divide(last - low, low, out=np.full(size, np.nan), where=(low > 0) & (last > 0)) * 100
+
+    # зміни ціни між сусідніми точками одного товару
+    previous = price[:-1]
+    valid = (product_id[1:] == product_id[:-1]) & (previous > 0)
+    change = np.divide(price[1:] - previous, previous, out=np.zeros_like(previous), where=valid)[valid]
+    change_segment = segment[1:][valid]
+    change_count = np.bincount(change_segment, minlength=size)
+    change_sum = np.bincount(change_segment, weights=change, minlength=size)
+    change_sq_sum = np.bincount(change_segment, weights=change * change, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = change_sum / change_count
+        variance = np.maximum(change_sq_sum / change_count - mean * mean, 0.0)
+    volatility = np.where(change_count > 1, np.sqrt(variance) * 100, np.nan)
+
+    # останні sparkline_points точок кожного товару, масштабовані між їх мінімумом і максимумом
+    keep = ends[segment] - np.arange(len(price)) < sparkline_points
+    kept, kept_segment = price[keep], segment[keep]
+    kept_starts = np.searchsorted(kept_segment, np.arange(size))
+    lo = np.minimum.reduceat(kept, kept_starts)[kept_segment]
+    span = np.maximum.reduceat(kept, kept_starts)[kept_segment] - lo
+    scaled = np.divide(kept - lo, span, out=np.full(len(kept), 0.5), where=span > 0)
+    sparkline = np.split(np.rint(scaled * 100).astype(np.int16), kept_starts[1:])
+
+    return dict(id=ids, avg_price_30d=avg, below_avg_pct=below_avg, historic_low=low, above_low_pct=above_low,
+                volatility=volatility, sparkline=sparkline)
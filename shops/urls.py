@@ -1,7 +1,33 @@
+import re
+
 from fastapi import APIRouter
+from settings.conditional import ConditionalRules
 from shops.apis import router as products_router
 from shops.views import router as categories_router
+from shops.models import Shop, Category, Product, PriceMover
 
 router = APIRouter()
 router.include_router(products_router, prefix="/api", tags=["apis"])
 router.include_router(categories_router, prefix="", tags=["Views"])
+
+# Умовні GET (ETag / Last-Modified) сторінок і API: шлях -> (час останньої зміни, кількість рядків) їхніх даних
+conditional_rules: ConditionalRules = [
+    (re.compile(r'^/(api/)?$'), lambda m, q: Shop.last_modified_()),
+    (re.compile(r'^/(api/)?(?P<shop>\d+)$'), lambda m, q: Category.last_modified_(shop_id=int(m['shop']))),
+    (re.compile(r'^/(api/)?\d+/(?P<category>\d+)$'), lambda m, q: Product.last_modified_(category_id=int(m['category']))),
+    (re.compile(r'^/\d+/(?P<category>\d+)/\d+$'), lambda m, q: Product.last_modified_(category_id=int(m['category']))),
+    # /{shop_id}/{item_id} з нечисловим item_id - вибірка по всіх товарах
+    (re.compile(r'^/\d+/[^/]+$'), lambda m, q: goods_last_modified(q)),
+]
+
+
+async def goods_last_modified(query: dict[str, str]):
+    """
+    Сторінку з лідерборду змін цін валідує сам лідерборд (apply при інжесті, rebuild - нові рядки
+    з updated_at, видалені змінюють кількість). Сторінки зі скануванням product - без валідаторів:
+    max(updated_at) по всій таблиці на кожен запит дорожчий за користь від 304.
+    """
+    if PriceMover.leaderboard_for(query.get('only_changed') or 'expensive', query.get('ordered'),
+                                  query.get('direction')) is None:
+        return None
+    return await PriceMover.last_modified_()
@@ -1,9 +1,10 @@
-from elasticsearch import AsyncElasticsearch
-from fastapi import APIRouter, Request, Query
+from fastapi import APIRouter, Request, Query, HTTPException, Depends
 from fastapi.responses import HTMLResponse
 
 from settings.config import settings
-from shops.models import Shop, Category, Product
+from settings.elastic import SEARCH_FIELDS
+from settings.search import SearchBackend, get_search
+from shops.models import Shop, Category, Product, PriceMover
 
 router = APIRouter()
 templates = settings.templates
@@ -18,37 +19,22 @@ async def read_item(request: Request):
 
 
 @router.get("/s")
-async def search(q: str):
-    async with  AsyncElasticsearch("http://elastic_search:9200") as client:
-        res = await client.search(
-            index="products",
-            size=500,
-            sort=['last_price:desc',],
-            query={
-                "match": {
-                    "name": {
-                        "query": q,
-                        "operator": "and"
-                    }
-                }
-                # "fuzzy": {
-                #     "name": {
-                #         "value": q,
-                #         "fuzziness": "AUTO"
-                #     }
-                # },
-                # "wildcard": {
-                #     "name": {
-                #         "value": f"*{q}*",
-                #         "case_insensitive": True
-                #     }
-                # }
-                # "prefix": {
-                #     "name": q.lower()
-                # }
-            }
-        )
-    return [hit["_source"] for hit in res["hits"]["hits"]]
+async def search(q: str,
+                 size: int = Query(20, ge=1, le=100),
+                 from_: int = Query(0, ge=0, alias="from"),
+                 fields: str = Query(",".join(SEARCH_FIELDS), description="Comma-separated _source fields"),
+                 search_backend: SearchBackend = Depends(get_search)):
+    fields_ = tuple(i for i in fields.split(",") if i in SEARCH_FIELDS)
+    if not fields_:
+        raise HTTPException(status_code=400, detail=f"fields must be any of {', '.join(SEARCH_FIELDS)}")
+    return await search_backend.search(q, size=size, from_=from_, fields=fields_)
+
+@router.get("/suggest")
+async def suggest(q: str = Query(..., min_length=1, max_length=100),
+                  size: int = Query(settings.SUGGEST_SIZE, ge=1, le=20),
+                  search_backend: SearchBackend = Depends(get_search)):
+    return await search_backend.suggest(q, size=size)
+
 
 @router.get("/search", response_class=HTMLResponse)
 async def get_search_page(request: Request):
@@ -59,12 +45,18 @@ async def get_search_page(request: Request):
 async def read_item(request: Request,
                     item_id: int,
                     page: int = Query(1, ge=1),
-                    page_size: int = Query(20, ge=1)):
+                    page_size: int = Query(20, ge=1),
+                    cursor: str = Query(None)):
     offset = (page - 1) * page_size
-    objects = await Category.filter_by_(shop_id=item_id,
-                                        related='shop',
-                                        limit=page_size,
-                                        offset=offset)
+    try:
+        objects = await Category.filter_by_(shop_id=item_id,
+                                            related='shop',
+                                            limit=page_size,
+                                            offset=offset,
+                                            cursor=cursor,
+                                            count='cached')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     objects["page"] = page
     return templates.TemplateResponse(request=request,
                                       name="category.html",
@@ -79,6 +71,7 @@ async def read_item(
         only_changed: str = Query(None, description="cheaper, expensive, no_change"),
         ordered: str = Query(None),
         direction: str = Query(None),
+        cursor: str = Query(None),
 ):
     offset = (page - 1) * page_size
     try:
@@ -86,28 +79,48 @@ async def read_item(
         query = dict(
             category_id=int(item_id),
             ordered=[ordered, ] if ordered else ['in_stock', 'name', ],
-            related=['category', 'prices', 'category.shop'],
+            # графіки цін сторінка довантажує з /api/charts, тут потрібна лише остання ціна
+            related=['category', 'category.shop'],
             only_changed=only_changed,
             limit=page_size,
             offset=offset,
-            direction=direction
+            direction=direction,
+            cursor=cursor,
+            count='cached',
         )
     except ValueError:
+        only_changed = only_changed or "expensive"
+        leaderboard = PriceMover.leaderboard_for(only_changed, ordered, direction)
+        if leaderboard is not None:
+            # вибірка по всіх товарах - з глобального лідерборду змін цін, без сканування product і count
+            objects = await PriceMover.top_products(**leaderboard,
+                                                    related=['category', 'category.shop'],
+                                                    limit=page_size,
+                                                    offset=offset)
+            objects["page"] = page
+            return templates.TemplateResponse(request=request, name="goods.html", context={"title": "Goods", **objects})
         query = dict(
             ordered=[ordered, ] if ordered else ['in_stock', 'name', ],
-            related=['category', 'prices', 'category.shop'],
-            only_changed=only_changed if only_changed else "expensive",
+            # графіки цін сторінка довантажує з /api/charts, тут потрібна лише остання ціна
+            related=['category', 'category.shop'],
+            only_changed=only_changed,
             limit=page_size,
             offset=offset,
-            direction=direction
+            direction=direction,
+            cursor=cursor,
+            # вибірка по всіх товарах - точний count дорожчий за саму сторінку
+            count='estimate',
         )
-    objects = await Product.filter_by_(**query)
+    try:
+        objects = await Product.filter_by_(**query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     objects["page"] = page
     return templates.TemplateResponse(request=request, name="goods.html", context={"title": "Goods", **objects})
 
 @router.get("/{shop_id}/{category_id}/{good_id}", response_class=HTMLResponse)
 async def read_item(request: Request, good_id: int):
-    objects = await Product.filter_by_(id=good_id, related=['category', 'prices', 'category.shop'])
+    objects = await Product.filter_by_(id=good_id, related=['category', 'category.shop'])
     if objects:
         objects = objects
     objects["page"] = 0
@@ -0,0 +1,94 @@
+import pytest
+
+from settings import cache as cache_module
+from settings.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_invalidate_by_tag():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1, tags=['shop:1', 'category:1'])
+    cache.set('b', 2, tags=['category:2'])
+    cache.set('c', 3)
+
+    assert sorted(cache.invalidate('category:1', 'missing')) == ['a']
+    assert 'a' not in cache
+    assert cache.get('b') == 2 and cache.get('c') == 3
+    # тег видаленого запису теж прибраний - повторна інвалідація нічого не видаляє
+    assert cache.invalidate('shop:1') == []
+
+
+def test_set_replaces_tags():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1, tags=['old'])
+    cache.set('a', 2, tags=['new'])
+
+    assert cache.invalidate('old') == []
+    assert cache.get('a') == 2
+    assert cache.invalidate('new') == ['a']
+
+
+def test_ttl_expiry(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1, tags=['t'])
+    cache.set('b', 2, ttl=120)
+
+    clock.now += 59
+    assert cache.get('a') == 1
+    clock.now += 2
+    assert cache.get('a') is None
+    assert 'a' not in cache
+    assert cache.get('b') == 2
+    # запис, що протух, прибирається разом з тегами
+    assert cache.invalidate('t') == []
+    clock.now += 60
+    assert cache.get('b', 'default') == 'default'
+    assert len(cache) == 0
+
+
+def test_hits_and_misses(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=3, ttl=60)
+    for key in 'abc':
+        cache.set(key, key, tags=[f'tag:{key}'])
+    # читання робить запис найсвіжішим - витісняється найдавніше використаний
+    cache.get('a')
+    cache.set('d', 'd')
+
+    assert cache.keys() == ['c', 'a', 'd']
+    assert 'b' not in cache
+    assert cache.invalidate('tag:b') == []
+    # перезапис існуючого ключа нічого не витісняє
+    cache.set('c', 'c2')
+    assert len(cache) == 3 and cache.get('c') == 'c2'
+
+
+def test_clear():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1, tags=['t'])
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.invalidate('t') == []
@@ -0,0 +1,81 @@
+import io
+import json
+from array import array
+from datetime import date
+
+import numpy as np
+import pytest
+
+from shops import columnar
+from shops.columnar import json_chunks, to_npz
+
+
+def columns(days: list[int], prices: list[float], product_id: list[int] | None = None) -> dict[str, array]:
+    """ Колонки history, як їх збирає вивантаження: дні від 1970-01-01 """
+    return dict(
+        product_id=array('i', product_id if product_id is not None else [1] * len(days)),
+        date=array('i', days),
+        price=array('d', prices),
+    )
+
+
+def load(data: bytes) -> dict[str, np.ndarray]:
+    with np.load(io.BytesIO(data)) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def test_npz_round_trip():
+    days = [date(2026, 1, 1), date(2026, 1, 2), date(2024, 2, 29)]
+    data = load(to_npz(columns([(day - columnar.EPOCH).days for day in days], [10.5, 0.0, 99.99], [7, 7, 8])))
+
+    assert list(data) == ['product_id', 'date', 'price']
+    assert data['product_id'].dtype == np.int32
+    assert data['date'].dtype == np.dtype('datetime64[D]')
+    assert data['price'].dtype == np.float64
+    assert {array_.shape for array_ in data.values()} == {(3,)}
+    assert data['product_id'].tolist() == [7, 7, 8]
+    assert data['date'].tolist() == days
+    assert data['price'].tolist() == [10.5, 0.0, 99.99]
+
+
+def test_npz_int64_column():
+    data = load(to_npz(dict(product_id=array('q', [2 ** 40]))))
+
+    assert data['product_id'].dtype == np.int64
+    assert data['product_id'].tolist() == [2 ** 40]
+
+
+def test_npz_empty_series():
+    data = load(to_npz(columns([], [])))
+
+    assert data['product_id'].dtype == np.int32
+    assert data['date'].dtype == np.dtype('datetime64[D]')
+    assert data['price'].dtype == np.float64
+    assert {array_.shape for array_ in data.values()} == {(0,)}
+
+
+def parse(chunks) -> dict:
+    return json.loads(b''.join(chunks))
+
+
+def test_json():
+    result = parse(json_chunks(columns([0, 20_454, 0], [1.5, 2.0, 0.0], [3, 3, 4])))
+
+    assert result == dict(product_id=[3, 3, 4], date=['1970-01-01', '2026-01-01', '1970-01-01'], price=[1.5, 2.0, 0.0])
+
+
+@pytest.mark.parametrize('size', [5, 6, 7, 11])
+def test_json_across_chunks(monkeypatch, size):
+    # колонка довша за JSON_CHUNK віддається кількома шматками, склеєними комами
+    monkeypatch.setattr(columnar, 'JSON_CHUNK', 3)
+    days = list(range(20_000, 20_000 + size))
+    prices = [i / 4 for i in range(size)]
+    result = parse(json_chunks(columns(days, prices)))
+
+    assert result['product_id'] == [1] * size
+    assert result['date'] == [str(date.fromordinal(columnar.EPOCH.toordinal() + day)) for day in days]
+    assert result['price'] == prices
+
+
+def test_json_empty_series():
+    assert parse(json_chunks(columns([], []))) == dict(product_id=[], date=[], price=[])
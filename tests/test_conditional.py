@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from starlette.datastructures import Headers
+
+from settings.conditional import validators, not_modified
+
+MODIFIED = datetime(2026, 3, 1, 12, 30, 15, 250_000, tzinfo=timezone.utc)
+LAST_MODIFIED = 'Sun, 01 Mar 2026 12:30:15 GMT'
+
+
+def test_validators():
+    etag, last_modified = validators(MODIFIED, 255)
+
+    assert etag == f'W/"{int(MODIFIED.timestamp() * 1_000_000):x}-ff"'
+    assert last_modified == LAST_MODIFIED
+
+
+def test_validators_change_with_count():
+    # видалений рядок не змінює max(updated_at), але змінює ETag
+    assert validators(MODIFIED, 10)[0] != validators(MODIFIED, 9)[0]
+    assert validators(MODIFIED, 10)[0] != validators(MODIFIED + timedelta(microseconds=1), 10)[0]
+
+
+def test_validators_local_time_in_gmt():
+    kyiv = MODIFIED.astimezone(timezone(timedelta(hours=2)))
+
+    assert validators(kyiv, 1) == validators(MODIFIED, 1)
+
+
+def test_validators_without_rows():
+    assert validators(None) == ('W/"0-0"', None)
+    assert validators(None, 3) == ('W/"0-3"', None)
+
+
+def check(headers: dict, modified: datetime | None = MODIFIED, total: int = 1) -> bool:
+    etag, _ = validators(modified, total)
+    return not_modified(Headers(headers), etag, modified)
+
+
+@pytest.mark.parametrize('if_none_match', [
+    validators(MODIFIED, 1)[0],
+    validators(MODIFIED, 1)[0].removeprefix('W/'),  # слабке порівняння: W/ не враховується
+    f'"other", {validators(MODIFIED, 1)[0]}',
+    '*',
+])
+def test_if_none_match_hit(if_none_match):
+    assert check({'if-none-match': if_none_match})
+
+
+@pytest.mark.parametrize('if_none_match', ['"other"', 'W/"other"', validators(MODIFIED, 2)[0], ''])
+def test_if_none_match_miss(if_none_match):
+    assert not check({'if-none-match': if_none_match})
+
+
+def test_if_none_match_takes_precedence():
+    # ETag не збігся - If-Modified-Since (що сам по собі дав би 304) ігнорується
+    assert not check({'if-none-match': '"other"', 'if-modified-since': LAST_MODIFIED})
+    # і навпаки: ETag збігся - застарілий If-Modified-Since не заважає
+    assert check({'if-none-match': validators(MODIFIED, 1)[0], 'if-modified-since': 'Thu, 01 Jan 2015 00:00:00 GMT'})
+
+
+@pytest.mark.parametrize('since, expected', [
+    (LAST_MODIFIED, True),  # мікросекунди Last-Modified не передає
+    ('Sun, 01 Mar 2026 12:30:16 GMT', True),
+    ('Sun, 01 Mar 2026 12:30:14 GMT', False),
+    ('Sun, 01 Mar 2026 14:30:15 +0200', True),
+    ('Sun, 01 Mar 2026 12:30:15 -0000', True),
+])
+def test_if_modified_since(since, expected):
+    assert check({'if-modified-since': since}) is expected
+
+
+@pytest.mark.parametrize('since', ['yesterday', '', 'Sun, 99 Foo 2026 99:99:99 GMT'])
+def test_if_modified_since_unparseable(since):
+    assert not check({'if-modified-since': since})
+
+
+def test_if_modified_since_without_rows():
+    assert not check({'if-modified-since': LAST_MODIFIED}, modified=None)
+
+
+def test_no_conditional_headers():
+    assert not check({})
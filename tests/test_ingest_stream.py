@@ -0,0 +1,130 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from settings.config import settings
+from shops.ingest import ndjson_chunks
+
+PRODUCTS = [dict(name=f'Product {i}', url=f'https://shop.test/p/{i}', category_id=i % 3 + 1,
+                 price=10.0 * i, in_stock=bool(i % 2)) for i in range(1, 8)]
+
+
+def ndjson(products: list[dict]) -> bytes:
+    return b''.join(json.dumps(product).encode() + b'\n' for product in products)
+
+
+def split(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def parse(pieces: list[bytes], **kwargs) -> tuple[list[list[tuple]], dict]:
+    """ Пачки ndjson_chunks для тіла з частин `pieces` та звіт про відхилені рядки """
+
+    async def body():
+        for piece in pieces:
+            yield piece
+
+    async def collect():
+        return [chunk async for chunk in ndjson_chunks(body(), report, **kwargs)]
+
+    report = dict(rejected=0, errors=[])
+    return asyncio.run(collect()), report
+
+
+def row(line_no: int, product: dict) -> tuple:
+    return (line_no, product['name'], product['url'], None, None,
+            product['category_id'], product['in_stock'], product['price'])
+
+
+def rows(chunks: list[list[tuple]]) -> list[tuple]:
+    return [record for chunk in chunks for record in chunk]
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, 10_000])
+def test_lines_split_across_chunks(size):
+    chunks, report = parse(split(ndjson(PRODUCTS), size))
+
+    assert rows(chunks) == [row(i, product) for i, product in enumerate(PRODUCTS, 1)]
+    assert report == dict(rejected=0, errors=[])
+
+
+def test_last_line_without_newline():
+    data = ndjson(PRODUCTS).rstrip(b'\n')
+    chunks, _ = parse(split(data, 16))
+
+    assert rows(chunks)[-1] == row(len(PRODUCTS), PRODUCTS[-1])
+    assert len(rows(chunks)) == len(PRODUCTS)
+
+
+def test_blank_lines_keep_numbering():
+    data = b'\n' + json.dumps(PRODUCTS[0]).encode() + b'\n  \r\n' + json.dumps(PRODUCTS[1]).encode() + b'\n\n'
+    chunks, report = parse([data])
+
+    # порожні рядки пропускаються, але номери рядків у звіті й staging відповідають файлу
+    assert rows(chunks) == [row(2, PRODUCTS[0]), row(4, PRODUCTS[1])]
+    assert report['rejected'] == 0
+
+
+@pytest.mark.parametrize('size', [5, 100, 10_000])
+def test_gzip(size):
+    data = gzip.compress(ndjson(PRODUCTS).rstrip(b'\n'))
+    chunks, report = parse(split(data, size), gzip=True)
+
+    assert rows(chunks) == [row(i, product) for i, product in enumerate(PRODUCTS, 1)]
+    assert report['rejected'] == 0
+
+
+def test_gzip_output_is_bounded(monkeypatch):
+    # стиснуте тіло розгортається шматками не більше INGEST_STREAM_MAX_LINE, а не одним блоком
+    monkeypatch.setattr(settings, 'INGEST_STREAM_MAX_LINE', 300)
+    products = PRODUCTS * 50
+    chunks, report = parse([gzip.compress(ndjson(products))], gzip=True)
+
+    assert len(rows(chunks)) == len(products)
+    assert report['rejected'] == 0
+
+
+def test_malformed_lines_are_rejected():
+    lines = [
+        json.dumps(PRODUCTS[0]).encode(),
+        b'{"name": "broken",',
+        json.dumps(dict(PRODUCTS[1], url=None)).encode(),
+        json.dumps(dict(PRODUCTS[2], category_id='many')).encode(),
+        json.dumps(PRODUCTS[3]).encode(),
+    ]
+    chunks, report = parse([b'\n'.join(lines)])
+
+    assert rows(chunks) == [row(1, PRODUCTS[0]), row(5, PRODUCTS[3])]
+    assert report['rejected'] == 3
+    assert [error['line'] for error in report['errors']] == [2, 3, 4]
+    assert report['errors'][1]['error'] == "'url' is required"
+
+
+def test_errors_are_capped(monkeypatch):
+    monkeypatch.setattr(settings, 'INGEST_STREAM_MAX_ERRORS', 2)
+    _, report = parse([b'not json\n' * 5])
+
+    assert report['rejected'] == 5
+    assert [error['line'] for error in report['errors']] == [1, 2]
+
+
+def test_line_too_long(monkeypatch):
+    monkeypatch.setattr(settings, 'INGEST_STREAM_MAX_LINE', 50)
+
+    with pytest.raises(ValueError, match='Line 2 is longer than 50 bytes'):
+        parse([b'{}\n', b'x' * 30, b'x' * 30])
+
+
+def test_chunk_size():
+    chunks, _ = parse([ndjson(PRODUCTS[:3]), ndjson(PRODUCTS[3:])], chunk_size=2)
+
+    # пачка віддається, щойно набралось chunk_size записів після чергової частини тіла
+    assert [len(chunk) for chunk in chunks] == [3, 4]
+    assert rows(chunks) == [row(i, product) for i, product in enumerate(PRODUCTS, 1)]
+
+
+def test_empty_body():
+    assert parse([]) == ([], dict(rejected=0, errors=[]))
+    assert parse([b'', b'\n\n']) == ([], dict(rejected=0, errors=[]))
@@ -0,0 +1,69 @@
+import asyncio
+
+import httpx
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+from main import app
+from settings.metrics import Metric, registry, observe_ingest
+
+
+def scrape() -> dict:
+    """ /metrics, розібраний парсером prometheus_client: {імʼя сімейства: сімейство} """
+
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            return await client.get('/metrics')
+
+    response = asyncio.run(get())
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    return {family.name: family for family in text_string_to_metric_families(response.text)}
+
+
+def test_metric_requires_samples():
+    class Incomplete(Metric):
+        kind = 'gauge'
+
+    with pytest.raises(TypeError):
+        Incomplete('incomplete', 'Metric without samples()')
+
+
+def test_exposition_parses():
+    observe_ingest('test', 10, 0.2, dict(inserted=7, updated=3))
+    families = scrape()
+
+    # кожна зареєстрована метрика - окреме сімейство з типом, як у реєстрі
+    assert {name for name in registry.metrics} <= set(families)
+    for name, metric in registry.metrics.items():
+        assert families[name].type == metric.kind
+        assert families[name].documentation == metric.documentation
+
+
+def test_counter_and_histogram_samples():
+    observe_ingest('test', 10, 0.2, dict(inserted=7, updated=3))
+    families = scrape()
+
+    rows = {(sample.labels['path'], sample.labels['result']): sample.value
+            for sample in families['ingest_rows'].samples if sample.name == 'ingest_rows_total'}
+    assert rows[('test', 'inserted')] >= 7
+    assert rows[('test', 'updated')] >= 3
+
+    samples = [sample for sample in families['ingest_batch_duration_seconds'].samples
+               if sample.labels.get('path') == 'test']
+    buckets = [sample for sample in samples if sample.name.endswith('_bucket')]
+    counts = [sample.value for sample in buckets]
+    # кошики кумулятивні, +Inf дорівнює _count
+    assert counts == sorted(counts)
+    assert buckets[-1].labels['le'] == '+Inf'
+    count = next(sample.value for sample in samples if sample.name.endswith('_count'))
+    assert buckets[-1].value == count
+
+
+def test_label_values_are_escaped():
+    gauge = registry.metrics.get('test_escaping') or registry.gauge('test_escaping', 'Label escaping', ('label',))
+    raw = 'quote " backslash \\ newline \n end'
+    gauge.set(1, label=raw)
+    families = scrape()
+
+    assert [sample.labels['label'] for sample in families['test_escaping'].samples] == [raw]
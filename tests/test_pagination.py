@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import json
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, Table, create_engine, insert, select, true
+
+from settings.database import Base
+from settings.pagination import encode_cursor, decode_cursor
+from shops.models import Product
+
+metadata = MetaData()
+# price без NULL - порівняння рядків (price, id) > (...), rank з NULL - розгорнута умова
+rows_table = Table(
+    'rows', metadata,
+    Column('id', Integer, primary_key=True, nullable=False),
+    Column('price', Float, nullable=False),
+    Column('rank', Integer, nullable=True),
+)
+ROWS = [dict(id=i, price=float(i % 3), rank=None if i % 4 == 0 else i % 5) for i in range(1, 21)]
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(rows_table), ROWS)
+    return engine
+
+
+def ordered(order: list[tuple]):
+    """ ORDER BY з NULL як у PostgreSQL: ASC - NULLS LAST, DESC - NULLS FIRST """
+    return [column.desc().nulls_first() if descending else column.asc().nulls_last() for column, descending in order]
+
+
+def page_through(engine, order: list[tuple], size: int = 3) -> list[int]:
+    """ Всі рядки сторінками: наступна сторінка - рядки після останнього рядка попередньої """
+    ids, values = [], None
+    with engine.connect() as conn:
+        while True:
+            where = Base._keyset_after_(order, values) if values is not None else true()
+            page = conn.execute(select(rows_table).where(where).order_by(*ordered(order)).limit(size)).all()
+            if not page:
+                return ids
+            ids += [row.id for row in page]
+            values = [getattr(page[-1], column.name) for column, _ in order]
+
+
+def expected(order: list[tuple]) -> list[int]:
+    def key(row):
+        parts = []
+        for column, descending in order:
+            value = row[column.name]
+            # NULL: ASC - в кінці, DESC - на початку
+            parts.append((value is None) != descending)
+            parts.append(0 if value is None else (-value if descending else value))
+        return parts
+    return [row['id'] for row in sorted(ROWS, key=key)]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_ties_broken_by_id(engine, descending):
+    order = [(rows_table.c.price, descending), (rows_table.c.id, descending)]
+
+    assert page_through(engine, order) == expected(order)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_nullable_column(engine, descending):
+    order = [(rows_table.c.rank, descending), (rows_table.c.id, descending)]
+
+    assert page_through(engine, order) == expected(order)
+
+
+def test_mixed_directions(engine):
+    order = [(rows_table.c.price, True), (rows_table.c.id, False)]
+
+    assert page_through(engine, order) == expected(order)
+
+
+def test_cursor_round_trip():
+    values = [3.5, datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc), date(2026, 1, 2), None, 'name', 42]
+    cursor = encode_cursor(values, 'prev')
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (values, 'prev')
+
+
+def _raw(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    '!!!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    _raw([1, 2]),
+    _raw({'k': 5, 'd': 'next'}),
+    _raw({'k': [1]}),
+    _raw({'k': [1], 'd': 'sideways'}),
+    _raw({'k': [{'$x': 1}], 'd': 'next'}),
+    _raw({'k': [{'$dt': 'yesterday'}], 'd': 'next'}),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('cursor', ['garbage', encode_cursor([1, 2, 3, 4, 5], 'next')])
+def test_invalid_cursor_is_a_client_error(cursor):
+    # ValueError (-> 400 в ендпоінтах) ще до звернення до БД, зокрема для курсора іншої довжини ключа
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        asyncio.run(Product.filter_by_(category_id=1, limit=10, offset=0, cursor=cursor))
@@ -0,0 +1,77 @@
+import numpy as np
+
+from shops.stats import price_stats
+
+TODAY = 20_000
+
+
+def stats(series: dict[int, list[float]], low: dict[int, float] | None = None, **kwargs):
+    """ price_stats для рядів {product_id: [ціни по днях до TODAY включно]} """
+    product_id, day, price = [], [], []
+    for id_, prices in sorted(series.items()):
+        product_id += [id_] * len(prices)
+        day += range(TODAY - len(prices) + 1, TODAY + 1)
+        price += prices
+    ids = sorted(series)
+    return price_stats(
+        np.array(product_id, dtype=np.int32),
+        np.array(day, dtype=np.int32),
+        np.array(price, dtype=np.float64),
+        np.array([(low or {}).get(i, np.nan) for i in ids], dtype=np.float64),
+        today=TODAY,
+        **kwargs,
+    )
+
+
+def test_single_point_series():
+    result = stats({1: [50.0]})
+
+    assert result['id'].tolist() == [1]
+    assert result['avg_price_30d'][0] == 50.0
+    assert result['below_avg_pct'][0] == 0.0
+    assert result['historic_low'][0] == 50.0
+    assert result['above_low_pct'][0] == 0.0
+    # одна точка - змін ціни немає
+    assert np.isnan(result['volatility'][0])
+    assert result['sparkline'][0].tolist() == [50]
+
+
+def test_zero_prices_are_not_historic_low():
+    result = stats({1: [100.0, 0.0, 120.0], 2: [0.0, 0.0]}, low={1: 0.0, 2: 0.0})
+
+    assert result['historic_low'][0] == 100.0
+    assert result['above_low_pct'][0] == 20.0
+    # цін немає зовсім - мінімуму і відстані до нього теж
+    assert np.isnan(result['historic_low'][1])
+    assert np.isnan(result['above_low_pct'][1])
+
+
+def test_zero_last_price_is_not_at_low():
+    result = stats({1: [80.0, 90.0, 0.0]}, low={1: 70.0})
+
+    assert result['historic_low'][0] == 70.0
+    assert np.isnan(result['above_low_pct'][0])
+
+
+def test_monthly_low_below_window():
+    result = stats({1: [100.0, 110.0]}, low={1: 55.0})
+
+    assert result['historic_low'][0] == 55.0
+    assert result['above_low_pct'][0] == 100.0
+
+
+def test_sparkline_bounds():
+    rng = np.random.default_rng(0)
+    series = {1: rng.uniform(10, 500, 100).tolist(), 2: [42.0] * 10, 3: [5.0, 7.0]}
+    result = stats(series, sparkline_points=30)
+
+    first, flat, short = result['sparkline']
+    assert first.dtype == np.int16
+    assert len(first) == 30
+    assert first.min() == 0 and first.max() == 100
+    # останні 30 точок, масштабовані між їх мінімумом і максимумом
+    tail = np.array(series[1][-30:])
+    assert first.tolist() == np.rint((tail - tail.min()) / (tail.max() - tail.min()) * 100).astype(int).tolist()
+    # без коливань - посередині
+    assert flat.tolist() == [50] * 10
+    assert short.tolist() == [0, 100]